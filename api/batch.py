@@ -0,0 +1,223 @@
+"""
+Batch uploads of offline captured farms and monitoring visits.
+
+A batch is validated as a whole: field validation per record, then one
+query per related table for the ids the batch references, one resolver
+pass for districts and one code reservation per prefix. Valid records are
+written with a single bulk_create in one transaction. Every record gets a
+result in input order keyed by its ``client_ref``; a ``client_ref`` that
+was already stored comes back as ``duplicate`` with the existing row, so
+replaying an upload is safe.
+"""
+from django.db import IntegrityError, transaction
+
+from portal.models import Farm, Farmer, MonitoringVisit, Staff, UserProfile
+from portal.services import dashboard_cache, kpi
+from portal.services.district_resolver import district_resolver, farm_location_codes
+from portal.services.sequences import allocate_farm_codes_bulk, allocate_visit_ids
+from portal.signals import refresh_map_caches_for
+from .serializers import (
+    FarmBatchItemSerializer, MonitoringVisitBatchItemSerializer, build_farm_geometry
+)
+
+MAX_BATCH_SIZE = 5000
+
+
+class BatchTooLarge(ValueError):
+    pass
+
+
+def _check_size(records):
+    if not isinstance(records, list):
+        raise ValueError('Expected a list of records')
+    if len(records) > MAX_BATCH_SIZE:
+        raise BatchTooLarge(f'A batch can hold at most {MAX_BATCH_SIZE} records')
+
+
+def _result(index, record, status, **extra):
+    client_ref = record.get('client_ref') if isinstance(record, dict) else None
+    return {'index': index, 'client_ref': client_ref, 'status': status, **extra}
+
+
+def _validate(records, serializer_class, model, results):
+    """
+    Run field validation and drop records whose client_ref is already
+    stored or repeated earlier in the batch. Returns [(index, validated_data)].
+    """
+    refs = [r.get('client_ref') for r in records if isinstance(r, dict) and r.get('client_ref')]
+    existing = {
+        row['client_ref']: row
+        for row in model._base_manager.filter(client_ref__in=refs).values('id', 'client_ref')
+    } if refs else {}
+
+    valid = []
+    seen = set()
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[index] = _result(index, record, 'error', errors={'non_field_errors': ['Expected an object']})
+            continue
+
+        client_ref = record.get('client_ref') or None
+        if client_ref in existing:
+            results[index] = _result(index, record, 'duplicate', id=existing[client_ref]['id'])
+            continue
+        if client_ref in seen:
+            results[index] = _result(index, record, 'error', errors={'client_ref': ['Repeated in this batch']})
+            continue
+
+        serializer = serializer_class(data=record)
+        if not serializer.is_valid():
+            results[index] = _result(index, record, 'error', errors=serializer.errors)
+            continue
+
+        if client_ref:
+            seen.add(client_ref)
+        valid.append((index, serializer.validated_data))
+    return valid
+
+
+def _insert(model, records, objects, results, created_result):
+    """bulk_create ``objects`` under a savepoint and record their results."""
+    if not objects:
+        return
+    try:
+        with transaction.atomic():
+            created = model.objects.bulk_create(objects, batch_size=500)
+    except IntegrityError as e:
+        # A concurrent upload stored one of these client_refs (or unique
+        # codes) first. Nothing was written; report so the client retries.
+        for obj in objects:
+            index = obj._batch_index
+            results[index] = _result(index, records[index], 'error', errors={'non_field_errors': [str(e)]})
+        return
+
+    for obj in created:
+        index = obj._batch_index
+        results[index] = _result(index, records[index], 'created', **created_result(obj))
+
+
+def upload_farms(records):
+    """Validate and insert a batch of farms. Returns the per record results."""
+    _check_size(records)
+    results = [None] * len(records)
+    valid = _validate(records, FarmBatchItemSerializer, Farm, results)
+
+    # Related rows and unique values for the whole batch in one query each
+    farmers = Farmer.objects.select_related('user_profile__district').in_bulk(
+        {data['farmer'] for _, data in valid}
+    )
+    officers = set(Staff.objects.filter(
+        id__in={data['officer'] for _, data in valid if data.get('officer')}
+    ).values_list('id', flat=True))
+    taken_visit_ids = set(Farm._base_manager.filter(
+        visit_id__in={data['visit_id'] for _, data in valid if data.get('visit_id')}
+    ).values_list('visit_id', flat=True))
+
+    pending = []
+    for index, data in valid:
+        data = dict(data)
+        errors = {}
+        farmer = farmers.get(data.pop('farmer'))
+        if farmer is None:
+            errors['farmer'] = ['Farmer does not exist.']
+        officer_id = data.pop('officer', None)
+        if officer_id and officer_id not in officers:
+            errors['officer'] = ['Officer does not exist.']
+        if data.get('visit_id') and data['visit_id'] in taken_visit_ids:
+            errors['visit_id'] = ['farm with this visit id already exists.']
+
+        boundary_coordinates = data.pop('boundary_coordinates', None)
+        try:
+            polygon, location = build_farm_geometry(
+                boundary_coordinates, data.pop('latitude', None), data.pop('longitude', None)
+            )
+        except Exception as e:
+            errors['boundary_coordinates'] = [str(e)]
+            polygon = location = None
+
+        if errors:
+            results[index] = _result(index, records[index], 'error', errors=errors)
+            continue
+
+        if data.get('visit_id'):
+            taken_visit_ids.add(data['visit_id'])
+        farm = Farm(farmer=farmer, officer_id=officer_id, **data)
+        farm.client_ref = data.get('client_ref') or None
+        if boundary_coordinates:
+            farm.boundary_coord = boundary_coordinates
+        if polygon:
+            farm.boundary = polygon
+            farm.geom = polygon
+            farm.has_farm_boundary_polygon = True
+        farm.location = location
+        farm._batch_index = index
+        pending.append(farm)
+
+    # Districts for the whole batch in one pass, one code block per prefix
+    matches = district_resolver.resolve_many([farm.boundary or farm.location for farm in pending])
+    with transaction.atomic():
+        codes = allocate_farm_codes_bulk([
+            farm_location_codes(match, farm.farmer) for farm, match in zip(pending, matches)
+        ])
+        for farm, code in zip(pending, codes):
+            farm.farm_code = code
+
+        _insert(Farm, records, pending, results, lambda farm: {'id': farm.id, 'farm_code': farm.farm_code})
+
+    # bulk_create skips the model signals, refresh the map caches, KPIs and dashboard cache here
+    created = [farm for farm in pending if farm.pk]
+    if created:
+        transaction.on_commit(lambda: refresh_map_caches_for(created))
+        transaction.on_commit(lambda: kpi.refresh_days(farm.registration_date for farm in created))
+        transaction.on_commit(lambda: dashboard_cache.invalidate(Farm))
+    return results
+
+
+def upload_monitoring_visits(records):
+    """Validate and insert a batch of monitoring visits. Returns the per record results."""
+    _check_size(records)
+    results = [None] * len(records)
+    valid = _validate(records, MonitoringVisitBatchItemSerializer, MonitoringVisit, results)
+
+    farms = set(Farm.objects.filter(
+        id__in={data['farm'] for _, data in valid}
+    ).values_list('id', flat=True))
+    officers = set(UserProfile.objects.filter(
+        id__in={data['officer'] for _, data in valid}
+    ).values_list('id', flat=True))
+
+    pending = []
+    for index, data in valid:
+        data = dict(data)
+        errors = {}
+        farm_id = data.pop('farm')
+        officer_id = data.pop('officer')
+        if farm_id not in farms:
+            errors['farm'] = ['Farm does not exist.']
+        if officer_id not in officers:
+            errors['officer'] = ['Officer does not exist.']
+        if errors:
+            results[index] = _result(index, records[index], 'error', errors=errors)
+            continue
+
+        data['client_ref'] = data.get('client_ref') or None
+        visit = MonitoringVisit(farm_id=farm_id, officer_id=officer_id, **data)
+        visit._batch_index = index
+        pending.append(visit)
+
+    with transaction.atomic():
+        if pending:
+            for visit, visit_id in zip(pending, allocate_visit_ids(len(pending))):
+                visit.visit_id = visit_id
+
+        _insert(MonitoringVisit, records, pending, results, lambda visit: {'id': visit.id, 'visit_id': visit.visit_id})
+    if any(visit.pk for visit in pending):
+        transaction.on_commit(lambda: dashboard_cache.invalidate(MonitoringVisit))
+    return results
+
+
+def summarize(results):
+    summary = {'created': 0, 'duplicate': 0, 'error': 0}
+    for result in results:
+        summary[result['status']] += 1
+    return summary
@@ -0,0 +1,258 @@
+"""
+Fast read paths for the mobile API.
+
+GET lists don't go through the DRF serializers. Rows are read with
+``values_list()`` and turned into the same dicts the serializers produce by
+a ``Reader`` (portal.services.rows): a field list compiled once into one
+extractor per output key over the row tuple, so no model instance or
+serializer field is built per row. Bodies are encoded with orjson and
+streamed out one row at a time.
+
+The farmer list is keyset paginated on id: a page is ``?limit=`` rows with
+id greater than ``?cursor=``, and the response carries the cursor for the
+next page, so every page costs the same no matter how deep it is.
+"""
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from portal.models import Farm, Farmer, MonitoringVisit, Project
+from portal.services.rows import PointOrdinate, Reader, dumps, participating_farmers_count
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+def page_params(request):
+    """Return ``(cursor, limit)`` from the query string, raises ValueError."""
+    cursor = request.GET.get('cursor') or 0
+    limit = request.GET.get('limit') or DEFAULT_PAGE_SIZE
+    try:
+        cursor = int(cursor)
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise ValueError('cursor and limit must be integers')
+    if cursor < 0 or limit < 1:
+        raise ValueError('cursor must be >= 0 and limit >= 1')
+    return cursor, min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_page(queryset, cursor, limit):
+    """
+    Ids of one page of ``queryset`` after ``cursor``. Returns
+    ``(ids, next_cursor)``, next_cursor is None on the last page.
+    """
+    ids = list(
+        queryset.filter(id__gt=cursor).order_by('id').values_list('id', flat=True)[:limit + 1]
+    )
+    if len(ids) > limit:
+        ids = ids[:limit]
+        return ids, ids[-1]
+    return ids, None
+
+
+# Value converters, matching what the DRF fields output
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def _datetime(value):
+    """Format like DRF's DateTimeField."""
+    if not value:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _decimal(places):
+    """DRF DecimalField output: a string with the field's decimal places."""
+    exponent = Decimal(1).scaleb(-places)
+
+    def convert(value):
+        return None if value is None else str(value.quantize(exponent))
+    return convert
+
+
+def _geometry(value):
+    return str(value) if value else None
+
+
+def _full_name(first_name, last_name):
+    """Same as User.get_full_name"""
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+def _optional_full_name(pk, first_name, last_name):
+    return _full_name(first_name, last_name) if pk else None
+
+
+# FarmSerializer
+FARM_READER = Reader([
+    ('id', 'id'),
+    ('farmer', 'farmer_id'),
+    ('farmer_name', ('farmer__user_profile__user__first_name', 'farmer__user_profile__user__last_name'), _full_name),
+    ('farmer_national_id', 'farmer__national_id'),
+    ('name', 'name'),
+    ('farm_code', 'farm_code'),
+    ('project', 'project_id'),
+    ('project_name', 'project__name'),
+    ('main_buyers', 'main_buyers'),
+    ('land_use_classification', 'land_use_classification'),
+    ('has_farm_boundary_polygon', 'has_farm_boundary_polygon'),
+    ('accessibility', 'accessibility'),
+    ('proximity_to_processing_plants', 'proximity_to_processing_plants'),
+    ('service_provider', 'service_provider'),
+    ('farmer_groups_affiliated', 'farmer_groups_affiliated'),
+    ('value_chain_linkages', 'value_chain_linkages'),
+    ('visit_id', 'visit_id'),
+    ('officer', 'officer_id'),
+    ('officer_name', ('officer_id', 'officer__user_profile__user__first_name', 'officer__user_profile__user__last_name'), _optional_full_name),
+    ('observation', 'observation'),
+    ('issues_identified', 'issues_identified'),
+    ('infrastructure_identified', 'infrastructure_identified'),
+    ('recommended_actions', 'recommended_actions'),
+    ('follow_up_actions', 'follow_up_actions'),
+    ('area_hectares', 'area_hectares'),
+    ('soil_type', 'soil_type'),
+    ('irrigation_type', 'irrigation_type'),
+    ('irrigation_coverage', 'irrigation_coverage'),
+    ('boundary_coordinates', 'boundary_coord', lambda value: value or None),
+    ('latitude', 'location_latitude'),
+    ('longitude', 'location_longitude'),
+    ('geom', 'geom', _geometry),
+    ('altitude', 'altitude'),
+    ('slope', 'slope'),
+    ('district_name', 'farmer__user_profile__district__district'),
+    ('region_name', 'farmer__user_profile__district__region'),
+    ('status', 'status'),
+    ('registration_date', 'registration_date', _date),
+    ('last_visit_date', 'last_visit_date', _date),
+    ('validation_status', 'validation_status'),
+    ('created_at', 'created_at', _datetime),
+    ('updated_at', 'updated_at', _datetime),
+], annotations={
+    'location_latitude': PointOrdinate('location', function='ST_Y'),
+    'location_longitude': PointOrdinate('location', function='ST_X'),
+})
+
+# FarmerSerializer, farms and farms_count are added by iter_farmers_with_farms
+FARMER_READER = Reader([
+    ('id', 'id'),
+    ('national_id', 'national_id'),
+    ('years_of_experience', 'years_of_experience'),
+    ('primary_crop', 'primary_crop'),
+    ('secondary_crops', 'secondary_crops'),
+    ('cooperative_membership', 'cooperative_membership'),
+    ('extension_services', 'extension_services'),
+    ('business_name', 'business_name'),
+    ('community', 'community'),
+    ('crop_type', 'crop_type'),
+    ('variety', 'variety'),
+    ('planting_date', 'planting_date', _date),
+    ('labour_hired', 'labour_hired'),
+    ('estimated_yield', 'estimated_yield'),
+    ('yield_in_pre_season', 'yield_in_pre_season'),
+    ('estimated_yield_tons', 'estimated_yield_tons'),
+    ('yield_in_pre_season_tons', 'yield_in_pre_season_tons'),
+    ('harvest_date', 'harvest_date', _date),
+    ('first_name', 'user_profile__user__first_name'),
+    ('last_name', 'user_profile__user__last_name'),
+    ('email', 'user_profile__user__email'),
+    ('phone_number', 'user_profile__phone_number'),
+    ('gender', 'user_profile__gender'),
+    ('date_of_birth', 'user_profile__date_of_birth', _date),
+    ('address', 'user_profile__address'),
+    ('bank_account_number', 'user_profile__bank_account_number'),
+    ('bank_name', 'user_profile__bank_name'),
+    ('district_name', 'user_profile__district__district'),
+    ('region_name', 'user_profile__district__region'),
+    ('created_at', 'created_at', _datetime),
+    ('updated_at', 'updated_at', _datetime),
+])
+
+# ProjectSerializer
+PROJECT_READER = Reader([
+    ('id', 'id'),
+    ('name', 'name'),
+    ('code', 'code'),
+    ('description', 'description'),
+    ('start_date', 'start_date', _date),
+    ('end_date', 'end_date', _date),
+    ('status', 'status'),
+    ('total_budget', 'total_budget', _decimal(Project._meta.get_field('total_budget').decimal_places)),
+    ('manager', 'manager_id'),
+    ('manager_name', ('manager_id', 'manager__user_profile__user__first_name', 'manager__user_profile__user__last_name'), _optional_full_name),
+    ('total_farmers', 'total_farmers', lambda value: value or 0),
+    ('created_at', 'created_at', _datetime),
+    ('updated_at', 'updated_at', _datetime),
+], annotations={'total_farmers': participating_farmers_count()})
+
+
+def _model_fields(model):
+    """``(key, lookup, convert)`` for every concrete field, like fields = '__all__'."""
+    fields = []
+    for field in model._meta.concrete_fields:
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateTimeField':
+            fields.append((field.name, field.attname, _datetime))
+        elif internal_type == 'DateField':
+            fields.append((field.name, field.attname, _date))
+        elif internal_type == 'DecimalField':
+            fields.append((field.name, field.attname, _decimal(field.decimal_places)))
+        else:
+            fields.append((field.name, field.attname))
+    return fields
+
+
+# MonitoringVisitSerializer
+MONITORING_VISIT_READER = Reader([
+    *_model_fields(MonitoringVisit),
+    ('officer_name', ('officer__user__first_name', 'officer__user__last_name'), _full_name),
+    ('farm_name', 'farm__name'),
+    ('farm_code', 'farm__farm_code'),
+])
+
+
+def iter_farmers_with_farms(ids):
+    """
+    Yield farmer payloads with their farms for ``ids``. Both queries are
+    ordered by farmer id, so farms are merged in while streaming.
+    """
+    farms = FARM_READER.iter_payloads(
+        Farm.objects.filter(farmer_id__in=ids).order_by('farmer_id', 'id')
+    )
+    pending = next(farms, None)
+    for farmer in FARMER_READER.iter_payloads(Farmer.objects.filter(id__in=ids).order_by('id')):
+        farmer_farms = []
+        while pending is not None and pending['farmer'] <= farmer['id']:
+            if pending['farmer'] == farmer['id']:
+                farmer_farms.append(pending)
+            pending = next(farms, None)
+        farmer['farms'] = farmer_farms
+        farmer['farms_count'] = len(farmer_farms)
+        yield farmer
+
+
+def stream_envelope(msg, items, status=1, **extra):
+    """
+    Yield the ``{'msg', 'data': [...], 'status'}`` body in chunks, ``status``
+    None leaves the key out.
+    """
+    head = {'msg': msg}
+    head.update(extra)
+    yield dumps(head)[:-1] + b',"data":['
+    first = True
+    for item in items:
+        yield dumps(item) if first else b',' + dumps(item)
+        first = False
+    yield b']}' if status is None else b'],"status":' + dumps(status) + b'}'
+
+
+def streaming_response(msg, items, status=1, **extra):
+    return StreamingHttpResponse(
+        stream_envelope(msg, items, status, **extra), content_type='application/json'
+    )
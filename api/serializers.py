@@ -6,6 +6,8 @@ from portal.models import (
     FollowUpAction, Infrastructure, Milestone, ComplianceCheck
 )
 from django.contrib.gis.geos import Point, Polygon
+from portal.services.district_resolver import district_resolver
+from portal.services.sequences import next_farm_code, next_visit_id
 from django.contrib.gis.db.models.functions import Distance
 import base64
 import uuid
@@ -126,7 +128,8 @@ class FarmerSerializer(serializers.ModelSerializer):
             'id', 'national_id', 'years_of_experience', 'primary_crop', 
             'secondary_crops', 'cooperative_membership', 'extension_services',
             'business_name', 'community', 'crop_type', 'variety', 'planting_date',
-            'labour_hired', 'estimated_yield', 'yield_in_pre_season', 'harvest_date',
+            'labour_hired', 'estimated_yield', 'yield_in_pre_season',
+            'estimated_yield_tons', 'yield_in_pre_season_tons', 'harvest_date',
             'first_name', 'last_name', 'email', 'phone_number', 'gender', 
             'date_of_birth', 'address', 'bank_account_number', 'bank_name',
             'district_name', 'region_name', 'farms', 'farms_count',
@@ -145,6 +148,16 @@ class FarmerSerializer(serializers.ModelSerializer):
 
 
 
+class FarmerSyncSerializer(FarmerSerializer):
+    """Farmer without nested farms, the sync API sends farms separately"""
+    
+    class Meta(FarmerSerializer.Meta):
+        fields = [
+            field for field in FarmerSerializer.Meta.fields
+            if field not in ('farms', 'farms_count')
+        ]
+
+
 class FarmerCreateSerializer(serializers.ModelSerializer):
     # User data
     first_name = serializers.CharField(write_only=True, max_length=30)
@@ -332,6 +345,36 @@ class DateFieldWithDatetimeSupport(serializers.DateField):
 
 
 
+def build_farm_geometry(boundary_coordinates, latitude, longitude):
+    """
+    Build the boundary polygon and location point sent by the mobile app.
+    Closes the ring if needed. Returns (polygon, location), either may be None.
+    """
+    polygon = None
+    location = None
+    
+    # Create polygon from boundary coordinates if provided
+    if boundary_coordinates and len(boundary_coordinates) >= 3:
+        try:
+            # Ensure the polygon is closed (first and last points are the same)
+            if boundary_coordinates[0] != boundary_coordinates[-1]:
+                boundary_coordinates.append(boundary_coordinates[0])
+            
+            # Create polygon with SRID 4326
+            polygon = Polygon(boundary_coordinates, srid=4326)
+        except Exception as e:
+            raise serializers.ValidationError(f"Invalid boundary coordinates: {str(e)}")
+    
+    # Create point from latitude/longitude if provided
+    if latitude is not None and longitude is not None:
+        try:
+            location = Point(longitude, latitude, srid=4326)
+        except Exception as e:
+            raise serializers.ValidationError(f"Invalid coordinates: {str(e)}")
+    
+    return polygon, location
+
+
 class FarmCreateSerializer(serializers.ModelSerializer):
     boundary_coordinates = serializers.ListField(
         child=serializers.ListField(child=serializers.FloatField()),
@@ -449,31 +492,10 @@ class FarmCreateSerializer(serializers.ModelSerializer):
         latitude = validated_data.pop('latitude', None)
         longitude = validated_data.pop('longitude', None)
         
-        polygon = None
-        location = None
-        
-        # Create polygon from boundary coordinates if provided
-        if boundary_coordinates and len(boundary_coordinates) >= 3:
-            try:
-                # Ensure the polygon is closed (first and last points are the same)
-                if boundary_coordinates[0] != boundary_coordinates[-1]:
-                    boundary_coordinates.append(boundary_coordinates[0])
-                
-                # Create polygon with SRID 4326
-                polygon = Polygon(boundary_coordinates, srid=4326)
-                # Update has_farm_boundary_polygon field
-                validated_data['has_farm_boundary_polygon'] = True
-                print(f"Created polygon with {len(boundary_coordinates)} points")
-            except Exception as e:
-                raise serializers.ValidationError(f"Invalid boundary coordinates: {str(e)}")
-        
-        # Create point from latitude/longitude if provided
-        if latitude is not None and longitude is not None:
-            try:
-                location = Point(longitude, latitude, srid=4326)
-                print(f"Created point at {longitude}, {latitude}")
-            except Exception as e:
-                raise serializers.ValidationError(f"Invalid coordinates: {str(e)}")
+        polygon, location = build_farm_geometry(boundary_coordinates, latitude, longitude)
+        if polygon:
+            # Update has_farm_boundary_polygon field
+            validated_data['has_farm_boundary_polygon'] = True
         
         # Initialize region and district codes
         region_code = "UN"
@@ -492,54 +514,22 @@ class FarmCreateSerializer(serializers.ModelSerializer):
         
         if spatial_point:
             try:
-                print("Attempting spatial query...")
-                
-                # Find district containing the point
-                district_obj = District.objects.filter(
-                    geom__isnull=False
-                ).filter(
-                    geom__contains=spatial_point
-                ).first()
+                # In-memory lookup: district containing the point, else one within ~1km
+                match = district_resolver.resolve(spatial_point)
                 
-                if district_obj:
-                    print(f"Found district: {district_obj.district}")
-                    district_code = district_obj.district_code if district_obj.district_code else "UN"
-                    district_name = district_obj.district
+                if match:
+                    print(f"Found {'nearby ' if match.nearby else ''}district: {match.district}")
+                    district_code = match.district_code if match.district_code else "UN"
+                    district_name = match.district
                     
-                    # Get region using reg_code (since there's no foreign key)
-                    region_obj = Region.objects.filter(
-                        reg_code=district_obj.reg_code
-                    ).first() if district_obj.reg_code else None
-                    
-                    if region_obj:
-                        region_code = region_obj.reg_code if region_obj.reg_code else "UN"
-                        region_name = region_obj.region
-                        print(f"Found region: {region_obj.region}")
+                    if match.reg_code:
+                        region_code = match.reg_code
+                        region_name = match.region
+                        print(f"Found region: {match.region}")
                     else:
                         print("No region found for district reg_code")
-                
                 else:
-                    print("No district found containing the point")
-                    # Fallback: use buffer search
-                    buffer_point = spatial_point.buffer(0.01)  # ~1km buffer
-                    nearby_district = District.objects.filter(
-                        geom__isnull=False
-                    ).filter(
-                        geom__intersects=buffer_point
-                    ).first()
-                    
-                    if nearby_district:
-                        print(f"Found nearby district: {nearby_district.district}")
-                        district_code = nearby_district.district_code if nearby_district.district_code else "UN"
-                        district_name = nearby_district.district
-                        
-                        region_obj = Region.objects.filter(
-                            reg_code=nearby_district.reg_code
-                        ).first() if nearby_district.reg_code else None
-                        
-                        if region_obj:
-                            region_code = region_obj.reg_code if region_obj.reg_code else "UN"
-                            region_name = region_obj.region
+                    print("No district found for the point")
                 
             except Exception as e:
                 print(f"Spatial query error: {e}")
@@ -557,16 +547,15 @@ class FarmCreateSerializer(serializers.ModelSerializer):
                     if farmer_district.region:
                         region_name = farmer_district.region
                         # Try to find region by name to get reg_code
-                        region_obj = Region.objects.filter(region=region_name).first()
-                        if region_obj:
-                            region_code = region_obj.reg_code if region_obj.reg_code else "UN"
+                        region_match = district_resolver.region_by_name(region_name)
+                        if region_match:
+                            region_code = region_match.reg_code if region_match.reg_code else "UN"
                     print(f"Using farmer's district: {district_name}, region: {region_name}")
             except Exception as farmer_error:
                 print(f"Farmer district fallback error: {farmer_error}")
         
         # Generate farm code
-        farm_count = Farm.objects.count() + 1
-        farm_code = f"EX-{region_code}-{district_code}-{farm_count:06d}"
+        farm_code = next_farm_code(region_code, district_code)
         
         print(f"Generated farm code: {farm_code}")
         print(f"Region: {region_name}, District: {district_name}")
@@ -596,6 +585,26 @@ class FarmCreateSerializer(serializers.ModelSerializer):
         except Exception as e:
             print(f"Error creating farm: {e}")
             raise serializers.ValidationError(f"Error creating farm: {str(e)}")
+
+
+class FarmBatchItemSerializer(FarmCreateSerializer):
+    """
+    One record of a batch farm upload. Related ids and unique fields are
+    checked for the whole batch at once in api.batch, not per record here.
+    """
+    farmer = serializers.IntegerField()
+    officer = serializers.IntegerField(required=False, allow_null=True)
+    visit_id = serializers.CharField(max_length=50, required=False, allow_null=True, allow_blank=True)
+    client_ref = serializers.CharField(max_length=64, required=False, allow_null=True, allow_blank=True)
+    
+    class Meta(FarmCreateSerializer.Meta):
+        fields = FarmCreateSerializer.Meta.fields + ['client_ref']
+    
+    def validate_farmer(self, value):
+        return value
+    
+    def validate_officer(self, value):
+        return value
 ################################################################################################################################
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -651,11 +660,11 @@ class MonitoringVisitCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = MonitoringVisit
         fields = '__all__'
+        read_only_fields = ['visit_id']
     
     def create(self, validated_data):
         # Generate visit ID
-        visit_count = MonitoringVisit.objects.count() + 1
-        visit_id = f"VISIT-{visit_count:06d}"
+        visit_id = next_visit_id()
         
         monitoring_visit = MonitoringVisit.objects.create(
             visit_id=visit_id,
@@ -664,6 +673,15 @@ class MonitoringVisitCreateSerializer(serializers.ModelSerializer):
         
         return monitoring_visit
 
+class MonitoringVisitBatchItemSerializer(MonitoringVisitCreateSerializer):
+    """One record of a batch visit upload, related ids are checked in bulk in api.batch"""
+    officer = serializers.IntegerField()
+    farm = serializers.IntegerField()
+    client_ref = serializers.CharField(max_length=64, required=False, allow_null=True, allow_blank=True)
+    
+    class Meta(MonitoringVisitCreateSerializer.Meta):
+        pass
+
 class FollowUpActionSerializer(serializers.ModelSerializer):
     class Meta:
         model = FollowUpAction
@@ -0,0 +1,183 @@
+"""
+Delta sync for the field mobile app.
+
+Each entity is read in (updated_at, id) order starting after the client's
+watermark. Live rows come back in ``changed``, soft-deleted ones as
+``deleted`` tombstones. The watermark handed back is an opaque token for
+the last row sent, so paging and the next incremental sync use the same
+value.
+
+A row stamped by a transaction that has not committed yet is invisible,
+so a watermark must never move past it. Rows newer than ``horizon`` are
+held back until a later call. The horizon is the start of the oldest
+transaction that is still writing, however long that transaction runs,
+minus ``SAFETY_LAG``.
+"""
+import base64
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from portal.models import Farm, Farmer, MonitoringVisit, Project
+from .serializers import (
+    FarmerSyncSerializer, FarmSerializer, MonitoringVisitSerializer, ProjectSerializer
+)
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+# Covers the time between a row's updated_at being stamped in Python and
+# its transaction starting in PostgreSQL. Open transactions themselves are
+# covered by ``horizon``, whatever their length. A writer that stamps
+# updated_at itself and then starts its transaction more than this later
+# can still be skipped, so raise SYNC_SAFETY_LAG_SECONDS for such writers.
+SAFETY_LAG = timedelta(seconds=getattr(settings, 'SYNC_SAFETY_LAG_SECONDS', 5))
+
+
+class InvalidWatermark(ValueError):
+    pass
+
+
+def encode_watermark(updated_at, pk):
+    raw = f'{updated_at.isoformat()}|{pk}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _aware(moment):
+    return timezone.make_aware(moment, dt_timezone.utc) if timezone.is_naive(moment) else moment
+
+
+def decode_watermark(value):
+    """
+    Accept either a token from a previous sync or a plain ISO datetime.
+    Returns (updated_at, id).
+    """
+    if not value:
+        return None
+
+    # An unencoded '+' of an ISO offset arrives as a space, tokens have neither
+    value = value.strip().replace(' ', '+')
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        raise InvalidWatermark(f'Invalid watermark: {value}')
+    if moment is not None:
+        return _aware(moment), 0
+
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        moment, pk = raw.rsplit('|', 1)
+        moment, pk = parse_datetime(moment), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidWatermark(f'Invalid watermark: {value}')
+    if moment is None or not 0 <= pk < 2 ** 63:
+        raise InvalidWatermark(f'Invalid watermark: {value}')
+    return _aware(moment), pk
+
+
+def _farmers(district):
+    queryset = Farmer.all_objects.select_related('user_profile__user', 'user_profile__district')
+    if district:
+        queryset = queryset.filter(user_profile__district__district__icontains=district)
+    return queryset
+
+
+def _farms(district):
+    queryset = Farm.all_objects.select_related(
+        'farmer__user_profile__user', 'farmer__user_profile__district',
+        'officer__user_profile__user', 'project'
+    )
+    if district:
+        queryset = queryset.filter(farmer__user_profile__district__district__icontains=district)
+    return queryset
+
+
+def _monitoring_visits(district):
+    queryset = MonitoringVisit.objects.select_related('officer__user', 'farm')
+    if district:
+        queryset = queryset.filter(farm__farmer__user_profile__district__district__icontains=district)
+    return queryset
+
+
+def _projects(district):
+    queryset = Project.all_objects.select_related('manager__user_profile__user')
+    if district:
+        queryset = queryset.filter(id__in=Project.all_objects.filter(
+            participating_farmers__user_profile__district__district__icontains=district
+        ).values('id'))
+    return queryset
+
+
+# entity name -> (queryset builder, serializer, soft deletable)
+# Monitoring visits are hard deleted, so they never produce tombstones.
+SYNC_ENTITIES = {
+    'farmers': (_farmers, FarmerSyncSerializer, True),
+    'farms': (_farms, FarmSerializer, True),
+    'monitoring_visits': (_monitoring_visits, MonitoringVisitSerializer, False),
+    'projects': (_projects, ProjectSerializer, True),
+}
+
+
+def horizon():
+    """
+    Newest updated_at that is safe to hand out. A later stamp may belong to
+    a transaction that hasn't committed yet.
+
+    pg_stat_activity only shows the transaction start of sessions of the
+    same database role, or of every role with pg_read_all_stats, which is
+    the case when the application uses one role.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()'
+        )
+        oldest = cursor.fetchone()[0]
+    now = timezone.now()
+    return (min(now, oldest) if oldest else now) - SAFETY_LAG
+
+
+def sync_entity(entity, since=None, district=None, limit=DEFAULT_LIMIT, until=None):
+    """Return one page of changes for ``entity`` after the ``since`` watermark."""
+    build_queryset, serializer_class, soft_deletable = SYNC_ENTITIES[entity]
+    queryset = build_queryset(district)
+
+    until = until or horizon()
+    queryset = queryset.filter(updated_at__lte=until)
+
+    watermark = decode_watermark(since)
+    if watermark:
+        updated_at, pk = watermark
+        queryset = queryset.filter(
+            Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk)
+        )
+
+    rows = list(queryset.order_by('updated_at', 'id')[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    changed = [row for row in rows if not (soft_deletable and row.is_deleted)]
+    deleted = [
+        {
+            'id': row.id,
+            'deleted_at': (row.deleted_at or row.updated_at).isoformat(),
+        }
+        for row in rows if soft_deletable and row.is_deleted
+    ]
+
+    if rows:
+        new_watermark = encode_watermark(rows[-1].updated_at, rows[-1].id)
+    else:
+        new_watermark = since
+
+    return {
+        'changed': serializer_class(changed, many=True).data,
+        'deleted': deleted,
+        'watermark': new_watermark,
+        'has_more': has_more,
+        'next_cursor': new_watermark if has_more else None,
+    }
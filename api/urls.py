@@ -37,10 +37,12 @@ urlpatterns = [
     path('v1/farmers/', views.FarmerAPIView.as_view(), name='create-farmer'),
 
     # Farms
+    path('v1/farms/batch/', views.FarmBatchAPIView.as_view(), name='farms-batch'),
     path('v1/farms/<str:district>/', views.FarmAPIView.as_view(), name='farms-by-district'),
     path('v1/farms/', views.FarmAPIView.as_view(), name='create-farm'),
 
     # Monitoring Visits
+    path('v1/monitoring-visits/batch/', views.MonitoringVisitBatchAPIView.as_view(), name='monitoring-visits-batch'),
     path('v1/monitoring-visits/<str:district>/', views.MonitoringVisitAPIView.as_view(), name='monitoring-visits-by-district'),
     path('v1/monitoring-visits/', views.MonitoringVisitAPIView.as_view(), name='create-monitoring-visit'),
 
@@ -62,6 +64,9 @@ urlpatterns = [
     path('v1/compliance-checks/<int:project_id>/', views.ComplianceCheckAPIView.as_view(), name='compliance-checks-by-project'),
     path('v1/compliance-checks/', views.ComplianceCheckAPIView.as_view(), name='create-compliance-check'),
 
+    # Delta sync for the mobile app
+    path('v1/sync/', views.SyncAPIView.as_view(), name='sync'),
+
     # Documentation
     path('v1/swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('v1/redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
@@ -13,21 +13,33 @@ from .serializers import (
     FarmerCreateSerializer, FarmSerializer, FarmCreateSerializer,
     MonitoringVisitSerializer, MonitoringVisitCreateSerializer,
     ProjectSerializer, ProjectCreateSerializer, MilestoneSerializer,
-    ComplianceCheckSerializer, FollowUpActionSerializer, InfrastructureSerializer
+    ComplianceCheckSerializer, FollowUpActionSerializer, InfrastructureSerializer,
+    FarmBatchItemSerializer, MonitoringVisitBatchItemSerializer
 )
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 import json
+from functools import wraps
 from rest_framework.permissions import AllowAny
+from django.utils import timezone
+
+from . import batch, readers, sync
 
 def staff_exists_required(func):
     """
-    Decorator to check if staff exists
+    Decorator to check if staff exists. Batch uploads post a bare list, so
+    their userid is read from the query string.
     """
+    @wraps(func)
     def wrapper(self, request, *args, **kwargs):
-        staff_id = request.data.get('userid') or request.query_params.get('userid')
+        data = request.data
+        if isinstance(data, list):
+            data = {}
+        elif not isinstance(data, dict):
+            return Response({'msg': 'Request body must be a JSON object', 'data': []}, status=status.HTTP_400_BAD_REQUEST)
+        staff_id = data.get('userid') or request.query_params.get('userid')
         if not staff_id:
             return Response({'msg': 'userid is required', 'data': []}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -242,7 +254,11 @@ class FarmerAPIView(APIView):
     permission_classes = [AllowAny]
     
     @swagger_auto_schema(
-        operation_description="Fetch all farmers data with their farms - optionally filter by district",
+        operation_description=(
+            "Fetch farmers data with their farms - optionally filter by district. "
+            "Results are paged by farmer id: pass the returned next_cursor as cursor "
+            "to get the next page, next_cursor is null on the last page."
+        ),
         manual_parameters=[
             openapi.Parameter(
                 'district',
@@ -250,6 +266,20 @@ class FarmerAPIView(APIView):
                 description="Filter by district name",
                 type=openapi.TYPE_STRING,
                 required=False
+            ),
+            openapi.Parameter(
+                'cursor',
+                openapi.IN_QUERY,
+                description="next_cursor from the previous page",
+                type=openapi.TYPE_INTEGER,
+                required=False
+            ),
+            openapi.Parameter(
+                'limit',
+                openapi.IN_QUERY,
+                description=f"Farmers per page (default {readers.DEFAULT_PAGE_SIZE}, max {readers.MAX_PAGE_SIZE})",
+                type=openapi.TYPE_INTEGER,
+                required=False
             )
         ]
     )
@@ -258,41 +288,36 @@ class FarmerAPIView(APIView):
         Fetch farmers data with their farms - can filter by district if provided
         """
         try:
-            farmers = Farmer.objects.filter(is_deleted=False)
-            
-            # Prefetch related data to optimize queries
-            farmers = farmers.select_related(
-                'user_profile__user',
-                'user_profile__district'
-            ).prefetch_related(
-                'farms',  # Prefetch all farms for each farmer
-                'farms__project',
-                'farms__officer__user_profile__user'
-            )
+            try:
+                cursor, limit = readers.page_params(request)
+            except ValueError as e:
+                return Response({
+                    'msg': str(e),
+                    'data': [],
+                    'status': 0
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            farmers = Farmer.objects.all()
             
             # Filter by district if provided (either from URL parameter or query parameter)
+            district = district or request.GET.get('district')
             if district:
                 farmers = farmers.filter(user_profile__district__district__icontains=district)
-            else:
-                # Also check for district in query parameters
-                district_query = request.GET.get('district')
-                if district_query:
-                    farmers = farmers.filter(user_profile__district__district__icontains=district_query)
             
-            if not farmers.exists():
+            ids, next_cursor = readers.keyset_page(farmers, cursor, limit)
+            
+            if not ids and not cursor:
                 return Response({
                     'msg': 'No farmers found', 
                     'data': [],
                     'status': 0
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            serializer = FarmerSerializer(farmers, many=True)
-            
-            return Response({
-                'msg': 'Farmers data with farms fetched successfully',
-                'data': serializer.data,
-                'status': 1
-            }, status=status.HTTP_200_OK)
+            return readers.streaming_response(
+                'Farmers data with farms fetched successfully',
+                readers.iter_farmers_with_farms(ids),
+                next_cursor=next_cursor
+            )
             
         except Exception as e:
             return Response({
@@ -357,7 +382,7 @@ class FarmAPIView(APIView):
         Fetch farms data - can filter by district
         """
         try:
-            farms = Farm.objects.filter(is_deleted=False)
+            farms = Farm.objects.order_by('id')
             
             # Filter by district if provided
             if district:
@@ -370,13 +395,10 @@ class FarmAPIView(APIView):
                     'status': 0
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            serializer = FarmSerializer(farms, many=True)
-            
-            return Response({
-                'msg': 'Farms data fetched successfully',
-                'data': serializer.data,
-                'status': 1
-            }, status=status.HTTP_200_OK)
+            return readers.streaming_response(
+                'Farms data fetched successfully',
+                readers.FARM_READER.iter_payloads(farms)
+            )
             
         except Exception as e:
             return Response({
@@ -445,15 +467,15 @@ class MonitoringVisitAPIView(APIView):
         """
         try:
             monitoring_visits = MonitoringVisit.objects.filter(
-                farm__farmer__user_profile__district__name=district
-            ).order_by('-date_of_visit')
+                farm__farmer__user_profile__district__district__icontains=district
+            ).order_by('-date_of_visit', 'id')
             
             if monitoring_visits.exists():
-                serializer = MonitoringVisitSerializer(monitoring_visits, many=True)
-                return Response({
-                    'msg': 'Monitoring visits data fetched successfully',
-                    'data': serializer.data
-                }, status=status.HTTP_200_OK)
+                return readers.streaming_response(
+                    'Monitoring visits data fetched successfully',
+                    readers.MONITORING_VISIT_READER.iter_payloads(monitoring_visits),
+                    status=None
+                )
             
             return Response({
                 'msg': f'No monitoring visits found in {district}',
@@ -524,20 +546,14 @@ class ProjectAPIView(APIView):
         Fetch projects data - can filter by district if provided
         """
         try:
-            projects = Project.objects.filter(is_deleted=False)
+            projects = Project.objects.order_by('id')
             
             # Filter by district if provided (either from URL parameter or query parameter)
+            district = district or request.GET.get('district')
             if district:
-                projects = projects.filter(
+                projects = projects.filter(id__in=Project.objects.filter(
                     participating_farmers__user_profile__district__district__icontains=district
-                ).distinct()
-            else:
-                # Also check for district in query parameters
-                district_query = request.GET.get('district')
-                if district_query:
-                    projects = projects.filter(
-                        participating_farmers__user_profile__district__district__icontains=district_query
-                    ).distinct()
+                ).values('id'))
             
             if not projects.exists():
                 return Response({
@@ -546,13 +562,10 @@ class ProjectAPIView(APIView):
                     'status': 0
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            serializer = ProjectSerializer(projects, many=True)
-            
-            return Response({
-                'msg': 'Projects data fetched successfully',
-                'data': serializer.data,
-                'status': 1
-            }, status=status.HTTP_200_OK)
+            return readers.streaming_response(
+                'Projects data fetched successfully',
+                readers.PROJECT_READER.iter_payloads(projects)
+            )
             
         except Exception as e:
             return Response({
@@ -830,4 +843,185 @@ class ComplianceCheckAPIView(APIView):
             return Response({
                 'msg': str(e),
                 'data': []
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class SyncAPIView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    @swagger_auto_schema(
+        operation_description=(
+            "Delta sync: rows changed since the last sync per entity. Pass the "
+            "watermark returned for an entity as <entity>_since on the next call; "
+            "while has_more is true, call again with it straight away."
+        ),
+        manual_parameters=[
+            openapi.Parameter('entities', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description="Comma separated: farmers, farms, monitoring_visits, projects (default all)"),
+            openapi.Parameter('district', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description="Filter by district name"),
+            openapi.Parameter('since', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                              description="Watermark or ISO datetime used for entities without their own <entity>_since"),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False,
+                              description=f"Rows per entity, max {sync.MAX_LIMIT}"),
+        ]
+    )
+    def get(self, request):
+        """
+        Return changed and deleted rows per entity after the client's watermarks
+        """
+        try:
+            requested = request.GET.get('entities')
+            entities = [e.strip() for e in requested.split(',') if e.strip()] if requested else list(sync.SYNC_ENTITIES)
+            unknown = [e for e in entities if e not in sync.SYNC_ENTITIES]
+            if unknown:
+                return Response({
+                    'msg': f'Unknown entities: {", ".join(unknown)}',
+                    'data': [],
+                    'status': 0
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            try:
+                limit = min(max(int(request.GET.get('limit', sync.DEFAULT_LIMIT)), 1), sync.MAX_LIMIT)
+            except ValueError:
+                limit = sync.DEFAULT_LIMIT
+            
+            district = request.GET.get('district')
+            since = request.GET.get('since')
+            server_time = timezone.now()
+            until = sync.horizon()
+            
+            data = {}
+            for entity in entities:
+                data[entity] = sync.sync_entity(
+                    entity,
+                    since=request.GET.get(f'{entity}_since', since),
+                    district=district,
+                    limit=limit,
+                    until=until
+                )
+            
+            return Response({
+                'msg': 'Sync data fetched successfully',
+                'data': data,
+                'server_time': server_time.isoformat(),
+                'status': 1
+            }, status=status.HTTP_200_OK)
+            
+        except sync.InvalidWatermark as e:
+            return Response({
+                'msg': str(e),
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'msg': f'Error syncing data: {str(e)}',
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+
+def _batch_records(request):
+    """Records of a batch upload: a bare list or {"records": [...]}"""
+    data = request.data
+    if isinstance(data, dict):
+        data = data.get('records')
+    return data
+
+
+def _batch_response(label, results):
+    summary = batch.summarize(results)
+    return Response({
+        'msg': f"{summary['created']} {label} created, {summary['duplicate']} duplicates, {summary['error']} failed",
+        'data': results,
+        'summary': summary,
+        'status': 1 if not summary['error'] else 0
+    }, status=status.HTTP_200_OK)
+
+
+class FarmBatchAPIView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    @staff_exists_required
+    @swagger_auto_schema(
+        operation_description=(
+            f"Upload up to {batch.MAX_BATCH_SIZE} farms captured offline. Each record takes the "
+            "same fields as the single farm POST plus an optional client_ref; records whose "
+            "client_ref is already stored are reported as duplicates and not created again."
+        ),
+        manual_parameters=[
+            openapi.Parameter('userid', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True,
+                              description='Id of the active staff uploading the batch'),
+        ],
+        request_body=FarmBatchItemSerializer(many=True),
+        responses={200: "Per record results", 400: "Invalid batch", 500: "Internal server error"}
+    )
+    def post(self, request):
+        """
+        Create many farms in one request
+        
+        Returns:
+            Response: one result per record, in input order
+        """
+        try:
+            results = batch.upload_farms(_batch_records(request))
+            return _batch_response('farms', results)
+            
+        except ValueError as e:
+            return Response({
+                'msg': str(e),
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'msg': f'Error uploading farms: {str(e)}',
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MonitoringVisitBatchAPIView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    
+    @staff_exists_required
+    @swagger_auto_schema(
+        operation_description=(
+            f"Upload up to {batch.MAX_BATCH_SIZE} monitoring visits captured offline, "
+            "with an optional client_ref per record for safe retries."
+        ),
+        manual_parameters=[
+            openapi.Parameter('userid', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True,
+                              description='Id of the active staff uploading the batch'),
+        ],
+        request_body=MonitoringVisitBatchItemSerializer(many=True),
+        responses={200: "Per record results", 400: "Invalid batch", 500: "Internal Server Error"}
+    )
+    def post(self, request):
+        """
+        Create many monitoring visits in one request
+        
+        Returns:
+            Response: one result per record, in input order
+        """
+        try:
+            results = batch.upload_monitoring_visits(_batch_records(request))
+            return _batch_response('monitoring visits', results)
+            
+        except ValueError as e:
+            return Response({
+                'msg': str(e),
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({
+                'msg': f'Error uploading monitoring visits: {str(e)}',
+                'data': [],
+                'status': 0
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
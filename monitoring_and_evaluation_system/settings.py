@@ -109,6 +109,11 @@ DATABASES = {
     },
    
 }
+# Farm, loan and visit codes (portal.services.sequences) are allocated and
+# committed on their own connection, so the sequence row is not locked
+# until the request that asked for the code commits
+DATABASES['sequences'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+CODE_SEQUENCE_DATABASE = 'sequences'
 
 
 JAZZMIN_SETTINGS = {
@@ -293,3 +298,45 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Map vector tiles
+# Rendered farm tiles are cached on disk as {z}/{x}/{y}.pbf and removed
+# whenever a farm covering the tile changes.
+MAP_TILE_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'tiles')
+MAP_TILE_MAX_ZOOM = 20
+
+# Prebuilt, gzipped region/district GeoJSON (rebuilt when boundaries change)
+MAP_LAYER_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'layers')
+
+# Mobile delta sync (api.sync) holds back rows stamped this many seconds
+# before the oldest open writing transaction began
+SYNC_SAFETY_LAG_SECONDS = int(os.getenv('SYNC_SAFETY_LAG_SECONDS', '5'))
+
+# Spatial exports (GeoPackage/Shapefile) are written by GDAL's ogr2ogr
+OGR2OGR_BINARY = os.getenv('OGR2OGR_BINARY', 'ogr2ogr')
+
+# Dashboard and statistics responses (portal.services.dashboard_cache).
+# File based, so a write in any process invalidates the entries every
+# process serves.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'dashboard'),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    # Farm cluster tiles (portal.services.clustering). A farm write drops
+    # only the tiles around the farm, which has to reach every worker, so
+    # these are file based too. A local memory cache would keep serving
+    # stale clusters from the processes that did not handle the write.
+    'map_clusters': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'clusters'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+DASHBOARD_CACHE = 'dashboard'
+MAP_CLUSTER_CACHE = 'map_clusters'
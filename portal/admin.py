@@ -250,7 +250,10 @@ class FarmerAdmin(ImportExportModelAdmin):
         'user_profile__district__district'  # Add district search
     )
     list_select_related = ('user_profile__user', 'user_profile__district')
-    readonly_fields = ('national_id', 'created_at', 'updated_at', 'farms_count', 'get_district')
+    readonly_fields = (
+        'national_id', 'created_at', 'updated_at', 'farms_count', 'get_district',
+        'estimated_yield_tons', 'yield_in_pre_season_tons'
+    )
     date_hierarchy = 'user_profile__user__date_joined'
     
     fieldsets = (
@@ -273,7 +276,8 @@ class FarmerAdmin(ImportExportModelAdmin):
         ('Production Details', {
             'fields': (
                 'planting_date', 'harvest_date', 'labour_hired',
-                'estimated_yield', 'yield_in_pre_season'
+                'estimated_yield', 'estimated_yield_tons',
+                'yield_in_pre_season', 'yield_in_pre_season_tons'
             )
         }),
         ('Organizational Information', {
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from portal.models import Farmer
+from portal.services import dashboard_cache, kpi, yields
+
+
+class Command(BaseCommand):
+    help = 'Parse the free text farmer yields into the typed yield columns and list the rows that cannot be parsed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Farmers read and updated per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report without writing anything')
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        text_fields = list(yields.YIELD_FIELDS)
+        columns = yields.typed_columns(text_fields)
+
+        queryset = Farmer.all_objects.order_by('id').only(
+            'id', 'national_id', 'created_at', 'updated_at', *text_fields, *columns
+        )
+        last_id = 0
+        checked = updated = 0
+        unparsed = []
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            checked += len(batch)
+
+            changed = []
+            for farmer in batch:
+                stored = [getattr(farmer, column) for column in columns]
+                yields.apply(farmer)
+                if [getattr(farmer, column) for column in columns] != stored:
+                    changed.append(farmer)
+                for field in text_fields:
+                    text = getattr(farmer, field)
+                    if yields.is_unparsed(text, yields.parse_yield(text)):
+                        unparsed.append((farmer, field, text))
+
+            if changed and not options['dry_run']:
+                # Bumped so mobile sync, which pages by (updated_at, id),
+                # sends the new columns to clients that already synced
+                now = timezone.now()
+                for farmer in changed:
+                    farmer.updated_at = now
+                with transaction.atomic():
+                    # bulk_update skips save() and the signals, so the
+                    # snapshot days and dashboard cache are refreshed here
+                    Farmer.all_objects.bulk_update(changed, [*columns, 'updated_at'])
+                    days = {farmer.created_at for farmer in changed}
+                    transaction.on_commit(lambda days=days: kpi.refresh_days(days))
+                    transaction.on_commit(lambda: dashboard_cache.invalidate(Farmer))
+            updated += len(changed)
+            self.stdout.write(f'{checked} farmers checked, {updated} changed')
+
+        for farmer, field, text in unparsed:
+            self.stdout.write(self.style.WARNING(f'Farmer {farmer.id} ({farmer.national_id}) {field}: {text!r}'))
+
+        verb = 'would update' if options['dry_run'] else 'updated'
+        summary = f'{checked} farmers checked, {verb} {updated}, {len(unparsed)} yields could not be parsed'
+        self.stdout.write(self.style.WARNING(summary) if unparsed else self.style.SUCCESS(summary))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from portal.services import boundaries
+
+
+class Command(BaseCommand):
+    help = 'Prebuild the gzipped region/district GeoJSON layers served to the map'
+
+    def handle(self, *args, **options):
+        boundaries.invalidate_layers()
+        for (layer, level), size in boundaries.build_all().items():
+            self.stdout.write(self.style.SUCCESS(f'Built {layer} ({level}): {size / 1024:.1f} KB gzipped'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from portal.models import Loan
+from portal.services import amortization
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored repayment schedules of every loan and match the repayments to them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Loans rebuilt per transaction')
+        parser.add_argument('--loan', action='append', default=[], help='Only rebuild this loan ID (repeatable)')
+
+    def handle(self, *args, **options):
+        chunk_size = max(options['chunk_size'], 1)
+        queryset = Loan.all_objects.order_by('id')
+        if options['loan']:
+            queryset = queryset.filter(loan_id__in=options['loan'])
+        loan_ids = list(queryset.values_list('id', flat=True))
+
+        installments = 0
+        for start in range(0, len(loan_ids), chunk_size):
+            installments += amortization.refresh_schedules(loan_ids[start:start + chunk_size])
+            self.stdout.write(f'{min(start + chunk_size, len(loan_ids))}/{len(loan_ids)} loans')
+
+        self.stdout.write(self.style.SUCCESS(f'Stored {installments} installments for {len(loan_ids)} loans'))
+
+        summary = amortization.portfolio_arrears()
+        self.stdout.write(
+            f"{summary['loans_in_arrears']} of {summary['loans']} scheduled loans in arrears, "
+            f"{summary['amount_overdue']:,.2f} overdue"
+        )
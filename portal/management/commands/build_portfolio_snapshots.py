@@ -0,0 +1,37 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from portal.services import portfolio
+
+
+class Command(BaseCommand):
+    help = 'Build the portfolio at risk, aging and roll rate snapshot of a day (run nightly), or of a range of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to build (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--since', help='Build every day from this one (YYYY-MM-DD) up to --date')
+
+    def handle(self, *args, **options):
+        try:
+            until = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+            since = date.fromisoformat(options['since']) if options['since'] else until
+        except ValueError as e:
+            raise CommandError(str(e))
+        if since > until:
+            raise CommandError('--since must not be after --date')
+
+        day = since
+        while day <= until:
+            rows = portfolio.build_snapshot(day)
+            self.stdout.write(f'{day}: {rows} rows')
+            day += timedelta(days=1)
+
+        latest = portfolio.latest()
+        if latest:
+            self.stdout.write(
+                f"PAR30 {latest['par30']}%, PAR60 {latest['par60']}%, PAR90 {latest['par90']}% "
+                f"of {latest['outstanding']:,.2f} outstanding on {latest['date']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Built portfolio snapshots from {since} to {until}'))
@@ -0,0 +1,43 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.models import StatementImport
+from portal.services import statements
+
+
+class Command(BaseCommand):
+    help = 'Stage a bank or mobile money statement CSV, match it to open loans and optionally record the matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement CSV file')
+        parser.add_argument('--source', default='bank', choices=[source for source, _ in StatementImport.SOURCES])
+        parser.add_argument('--user', help='Username the statement and repayments are recorded by')
+        parser.add_argument('--confirm', action='store_true', help='Record the matched lines as repayments')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user {options['user']}")
+
+        with open(options['path'], 'rb') as statement_file:
+            content = statement_file.read()
+        try:
+            statement = statements.stage(content, os.path.basename(options['path']), options['source'], user)
+        except statements.StatementError as e:
+            raise CommandError(str(e))
+
+        for status, totals in statements.summary(statement)['lines'].items():
+            if totals['lines']:
+                self.stdout.write(f"{status}: {totals['lines']} lines, {totals['amount']:,.2f}")
+
+        if options['confirm']:
+            written = statements.confirm(statement, user)
+            self.stdout.write(self.style.SUCCESS(f'Statement {statement.id}: recorded {written} repayments'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Statement {statement.id} staged, {statement.matched_lines} of {statement.total_lines} lines matched'
+            ))
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from portal.models import KpiSnapshot
+from portal.services import kpi
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard KPI snapshots from the source tables, one month at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD), defaults to the earliest data')
+        parser.add_argument('--until', help='Last day to rebuild (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        try:
+            since = date.fromisoformat(options['since']) if options['since'] else None
+            until = date.fromisoformat(options['until']) if options['until'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        full = since is None and not options['until']
+        since = since or kpi.first_day()
+        if since is None:
+            deleted, _ = KpiSnapshot.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'No source data, removed {deleted} snapshot rows'))
+            return
+
+        total = 0
+        for span in kpi.month_spans(since, until):
+            rows = kpi.rebuild_spans([span])
+            total += rows
+            self.stdout.write(f'{span[0]:%b %Y}: {rows} rows')
+
+        if full:
+            # Nothing is counted outside the rebuilt range any more
+            KpiSnapshot.objects.filter(Q(snapshot_date__lt=since) | Q(snapshot_date__gt=until)).delete()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} KPI snapshot rows from {since} to {until}'))
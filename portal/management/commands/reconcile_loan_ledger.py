@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from portal.models import Loan
+from portal.services import ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute loan ledger balances from disbursements and repayments and report differences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Store the recomputed balances for loans that differ')
+        parser.add_argument('--loan', action='append', default=[], help='Only check this loan ID (repeatable)')
+
+    def handle(self, *args, **options):
+        queryset = Loan.all_objects.all()
+        if options['loan']:
+            queryset = queryset.filter(loan_id__in=options['loan'])
+
+        mismatched = []
+        for row, changes in ledger.find_mismatches(queryset):
+            mismatched.append(row['id'])
+            details = ', '.join(
+                f'{field}: {stored} -> {computed}' for field, (stored, computed) in changes.items()
+            )
+            self.stdout.write(self.style.WARNING(f"{row['loan_id']}: {details}"))
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('All loan balances match'))
+            return
+
+        if options['fix']:
+            for start in range(0, len(mismatched), 1000):
+                ledger.refresh_loan_balances(mismatched[start:start + 1000])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {len(mismatched)} loans'))
+        else:
+            self.stdout.write(self.style.WARNING(f'{len(mismatched)} loans differ, run with --fix to update them'))
@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from portal.services import export_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process queued DataExport jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Exports run at the same time')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        worker = export_jobs.worker_name()
+
+        requeued = export_jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale exports'))
+
+        # Spawned children import Django fresh instead of sharing the parent's connection
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        running = {}
+        self.stdout.write(self.style.SUCCESS(f'Export worker {worker} started with {processes} processes'))
+        try:
+            while True:
+                while len(running) < processes:
+                    job = export_jobs.claim_next(worker)
+                    if job is None:
+                        break
+                    self.stdout.write(f'Exporting {job.model_name} as {job.export_format} (#{job.id})')
+                    running[pool.submit(export_jobs.process_export, job.id)] = job.id
+
+                if not running:
+                    if options['once']:
+                        break
+                    close_old_connections()
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        _, status = future.result()
+                    except Exception as e:
+                        export_jobs.fail(job_id, e)
+                        status = 'failed'
+                    style = self.style.SUCCESS if status == 'completed' else self.style.ERROR
+                    self.stdout.write(style(f'Export #{job_id} {status}'))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping, running exports are requeued on next start'))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
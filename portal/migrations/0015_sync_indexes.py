@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0014_codesequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='farm',
+            index=models.Index(fields=['updated_at', 'id'], name='farm_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='farmer',
+            index=models.Index(fields=['updated_at', 'id'], name='farmer_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monitoringvisit',
+            index=models.Index(fields=['updated_at', 'id'], name='monitoringvisit_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['updated_at', 'id'], name='project_sync_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0015_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farm',
+            name='client_ref',
+            field=models.CharField(blank=True, help_text='Idempotency key sent by the mobile app', max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='monitoringvisit',
+            name='client_ref',
+            field=models.CharField(blank=True, help_text='Idempotency key sent by the mobile app', max_length=64, null=True, unique=True),
+        ),
+    ]
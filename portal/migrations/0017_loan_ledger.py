@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+UPDATE portal_loan l SET
+    total_disbursed = t.disbursed,
+    total_repaid = t.repaid,
+    outstanding = t.disbursed - t.repaid,
+    last_payment_date = t.last_payment_date
+FROM (
+    SELECT l2.id,
+        COALESCE((SELECT SUM(d.amount) FROM portal_loandisbursement d
+                  WHERE d.loan_id = l2.id AND NOT d.is_deleted), 0) AS disbursed,
+        COALESCE((SELECT SUM(r.amount) FROM portal_loanrepayment r
+                  WHERE r.loan_id = l2.id AND NOT r.is_deleted), 0) AS repaid,
+        (SELECT MAX(r.repayment_date) FROM portal_loanrepayment r
+         WHERE r.loan_id = l2.id AND NOT r.is_deleted) AS last_payment_date
+    FROM portal_loan l2
+) t
+WHERE t.id = l.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0016_client_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='last_payment_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='outstanding',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='total_disbursed',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='total_repaid',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0017_loan_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataexport',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Percent complete'),
+        ),
+        migrations.AddField(
+            model_name='dataexport',
+            name='rows_written',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dataexport',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataexport',
+            name='total_rows',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='dataexport',
+            name='worker',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dataexport',
+            index=models.Index(fields=['status', 'requested_at'], name='dataexport_queue_idx'),
+        ),
+    ]
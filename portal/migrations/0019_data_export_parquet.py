@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0018_data_export_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataexport',
+            name='export_format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('xlsx', 'Excel'), ('parquet', 'Parquet'), ('pdf', 'PDF'), ('shapefile', 'Shapefile')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0020_data_export_gpkg'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KpiSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('crop', models.CharField(blank=True, default='', max_length=100)),
+                ('farmers_registered', models.PositiveIntegerField(default=0)),
+                ('yield_total', models.FloatField(default=0, help_text='Sum of parsed estimated yields in tons')),
+                ('yield_count', models.PositiveIntegerField(default=0)),
+                ('farms_registered', models.PositiveIntegerField(default=0)),
+                ('measured_farms', models.PositiveIntegerField(default=0, help_text='Farms with an area')),
+                ('hectares', models.FloatField(default=0)),
+                ('participants', models.PositiveIntegerField(default=0)),
+                ('disbursements', models.PositiveIntegerField(default=0)),
+                ('disbursed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('repayments', models.PositiveIntegerField(default=0)),
+                ('repaid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('defaulted_loans', models.PositiveIntegerField(default=0)),
+                ('defaulted_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('district', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.district')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.project')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.region')),
+            ],
+            options={
+                'verbose_name': 'KPI Snapshot',
+                'verbose_name_plural': 'KPI Snapshots',
+                'indexes': [models.Index(fields=['snapshot_date'], name='kpi_snapshot_date_idx'), models.Index(fields=['region', 'snapshot_date'], name='kpi_snapshot_region_idx'), models.Index(fields=['project', 'snapshot_date'], name='kpi_snapshot_project_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0021_kpi_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmer',
+            name='estimated_yield_tons',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='estimated_yield_unit',
+            field=models.CharField(blank=True, choices=[('kg', 'Kilograms'), ('ton', 'Tons')], editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='estimated_yield_value',
+            field=models.DecimalField(blank=True, decimal_places=3, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='yield_in_pre_season_tons',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='yield_in_pre_season_unit',
+            field=models.CharField(blank=True, choices=[('kg', 'Kilograms'), ('ton', 'Tons')], editable=False, max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='farmer',
+            name='yield_in_pre_season_value',
+            field=models.DecimalField(blank=True, decimal_places=3, editable=False, max_digits=12, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0022_farmer_yield_tons'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='interest_method',
+            field=models.CharField(choices=[('reducing', 'Reducing Balance'), ('flat', 'Flat Rate')], default='reducing', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='LoanInstallment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('due_date', models.DateField()),
+                ('principal_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('amount_due', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_date', models.DateField(blank=True, help_text='Date the installment was paid in full', null=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='portal.loan')),
+            ],
+            options={
+                'verbose_name': 'Loan Installment',
+                'verbose_name_plural': 'Loan Installments',
+                'ordering': ['loan', 'number'],
+                'indexes': [models.Index(fields=['due_date'], name='installment_due_idx')],
+                'unique_together': {('loan', 'number')},
+            },
+        ),
+    ]
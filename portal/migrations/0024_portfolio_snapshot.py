@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0023_loan_installments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('loans', models.PositiveIntegerField(default=0, help_text='Loans with a balance outstanding')),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('overdue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('loans_current', models.PositiveIntegerField(default=0)),
+                ('outstanding_current', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('loans_1_30', models.PositiveIntegerField(default=0)),
+                ('outstanding_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('loans_31_60', models.PositiveIntegerField(default=0)),
+                ('outstanding_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('loans_61_90', models.PositiveIntegerField(default=0)),
+                ('outstanding_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('loans_over_90', models.PositiveIntegerField(default=0)),
+                ('outstanding_over_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('previous_current', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rolled_current', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('previous_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rolled_1_30', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('previous_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rolled_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('previous_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rolled_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('district', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.district')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.project')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.region')),
+            ],
+            options={
+                'verbose_name': 'Portfolio Snapshot',
+                'verbose_name_plural': 'Portfolio Snapshots',
+                'indexes': [models.Index(fields=['snapshot_date'], name='portfolio_snapshot_date_idx'), models.Index(fields=['region', 'snapshot_date'], name='portfolio_region_idx'), models.Index(fields=['district', 'snapshot_date'], name='portfolio_district_idx'), models.Index(fields=['project', 'snapshot_date'], name='portfolio_project_idx')],
+            },
+        ),
+    ]
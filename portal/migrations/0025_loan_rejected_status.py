@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0024_portfolio_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loan',
+            name='status',
+            field=models.CharField(choices=[('applied', 'Applied'), ('approved', 'Approved'), ('disbursed', 'Disbursed'), ('repaying', 'Repaying'), ('completed', 'Completed'), ('defaulted', 'Defaulted'), ('rejected', 'Rejected')], default='applied', max_length=20),
+        ),
+    ]
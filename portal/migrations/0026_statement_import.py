@@ -0,0 +1,104 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0025_loan_rejected_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('source', models.CharField(choices=[('bank', 'Bank'), ('mobile_money', 'Mobile Money')], default='bank', max_length=20)),
+                ('file_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('staged', 'Staged'), ('confirmed', 'Confirmed')], default='staged', max_length=20)),
+                ('total_lines', models.PositiveIntegerField(default=0)),
+                ('matched_lines', models.PositiveIntegerField(default=0)),
+                ('confirmed_lines', models.PositiveIntegerField(default=0)),
+                ('confirmed_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Statement Import',
+                'verbose_name_plural': 'Statement Imports',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('row_number', models.PositiveIntegerField()),
+                ('transaction_date', models.DateField(blank=True, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('reference', models.CharField(blank=True, max_length=100, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('payer', models.CharField(blank=True, max_length=200, null=True)),
+                ('phone_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('raw', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('matched', 'Matched'), ('ambiguous', 'Ambiguous'), ('unmatched', 'Unmatched'), ('duplicate', 'Duplicate'), ('ignored', 'Ignored'), ('rejected', 'Rejected'), ('confirmed', 'Confirmed')], default='unmatched', max_length=20)),
+                ('match_method', models.CharField(blank=True, choices=[('reference', 'Transaction Reference'), ('loan_id', 'Loan ID'), ('national_id', 'National ID'), ('phone', 'Phone Number'), ('manual', 'Manual')], max_length=20, null=True)),
+                ('candidates', models.JSONField(blank=True, default=list, help_text='Loan ids an ambiguous line could belong to')),
+                ('error', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'verbose_name': 'Statement Line',
+                'verbose_name_plural': 'Statement Lines',
+                'ordering': ['statement', 'row_number'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(fields=['transaction_reference'], name='repayment_reference_idx'),
+        ),
+        migrations.AddField(
+            model_name='statementimport',
+            name='added_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_created', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='statementimport',
+            name='deleted_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_deleted', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='statementimport',
+            name='modified_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='%(class)s_modified', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='statementline',
+            name='loan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='portal.loan'),
+        ),
+        migrations.AddField(
+            model_name='statementline',
+            name='repayment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statement_line', to='portal.loanrepayment'),
+        ),
+        migrations.AddField(
+            model_name='statementline',
+            name='statement',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='portal.statementimport'),
+        ),
+        migrations.AddIndex(
+            model_name='statementline',
+            index=models.Index(fields=['statement', 'status'], name='statementline_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statementline',
+            index=models.Index(fields=['reference'], name='statementline_reference_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:45
+
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# Trigram indexes over the expression ``icontains`` compiles to,
+# UPPER(column::text) LIKE UPPER('%term%'), see portal.services.datatables
+TRIGRAM_INDEXES = (
+    ('loan_id_trgm_idx', 'portal_loan', 'loan_id'),
+    ('farmer_national_id_trgm_idx', 'portal_farmer', 'national_id'),
+    ('repayment_reference_trgm_idx', 'portal_loanrepayment', 'transaction_reference'),
+    ('disbursement_reference_trgm_idx', 'portal_loandisbursement', 'transaction_reference'),
+    ('auth_user_first_name_trgm_idx', 'auth_user', 'first_name'),
+    ('auth_user_last_name_trgm_idx', 'auth_user', 'last_name'),
+)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0026_statement_import'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        *(
+            migrations.RunSQL(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)',
+                f'DROP INDEX IF EXISTS {name}',
+            )
+            for name, table, column in TRIGRAM_INDEXES
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['application_date', 'id'], name='loan_application_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loandisbursement',
+            index=models.Index(fields=['disbursement_date', 'id'], name='disbursement_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loanrepayment',
+            index=models.Index(fields=['repayment_date', 'id'], name='repayment_keyset_idx'),
+        ),
+    ]
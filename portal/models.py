@@ -8,6 +8,8 @@ from datetime import date
 import uuid
 from django.contrib.gis.db.models import GeometryField
 
+from portal.services import yields
+
 
 
 
@@ -27,7 +29,9 @@ class TimeStampManager(models.Manager):
 
 class TimeStampQuerySet(models.QuerySet):
     def delete(self):
-        return self.update(is_deleted=True)
+        # Bump updated_at as well so delta sync picks the rows up as tombstones
+        now = timezone.now()
+        return self.update(is_deleted=True, deleted_at=now, updated_at=now)
     
     def hard_delete(self):
         return super(TimeStampQuerySet, self).delete()
@@ -58,6 +62,7 @@ class TimeStampModel(models.Model):
     
     def delete(self, *args, **kwargs):
         self.is_deleted = True
+        self.deleted_at = timezone.now()
         self.save()
     
     def hard_delete(self, *args, **kwargs):
@@ -189,12 +194,31 @@ class Farmer(TimeStampModel):
     yield_in_pre_season = models.CharField(max_length=200, blank=True, null=True)
     harvest_date = models.DateField(blank=True, null=True)
     
+    # Parsed from the text fields above on save, see portal.services.yields
+    estimated_yield_value = models.DecimalField(max_digits=12, decimal_places=3, blank=True, null=True, editable=False)
+    estimated_yield_unit = models.CharField(max_length=10, choices=yields.UNIT_CHOICES, blank=True, null=True, editable=False)
+    estimated_yield_tons = models.FloatField(blank=True, null=True, editable=False)
+    yield_in_pre_season_value = models.DecimalField(max_digits=12, decimal_places=3, blank=True, null=True, editable=False)
+    yield_in_pre_season_unit = models.CharField(max_length=10, choices=yields.UNIT_CHOICES, blank=True, null=True, editable=False)
+    yield_in_pre_season_tons = models.FloatField(blank=True, null=True, editable=False)
+    
     def __str__(self):
         return f"{self.user_profile.user.get_full_name()} - {self.national_id}"
     
     class Meta:
         verbose_name = "Farmer"
         verbose_name_plural = "Farmers"
+        indexes = [models.Index(fields=['updated_at', 'id'], name='farmer_sync_idx')]
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            yields.apply(self)
+        else:
+            parsed = [field for field in update_fields if field in yields.YIELD_FIELDS]
+            yields.apply(self, parsed)
+            kwargs['update_fields'] = [*update_fields, *yields.typed_columns(parsed)]
+        super().save(*args, **kwargs)
     
     # def save(self, *args, **kwargs):
     #     if not self.national_id:
@@ -229,6 +253,7 @@ class Project(TimeStampModel):
     class Meta:
         verbose_name = "Project"
         verbose_name_plural = "Projects"
+        indexes = [models.Index(fields=['updated_at', 'id'], name='project_sync_idx')]
 
 class Farm(TimeStampModel):
     FARM_STATUS = (
@@ -252,6 +277,7 @@ class Farm(TimeStampModel):
     farmer_groups_affiliated = models.CharField(max_length=100, blank=True, null=True)
     value_chain_linkages = models.CharField(max_length=100, blank=True, null=True)
     visit_id = models.CharField(max_length=50, unique=True, blank=True, null=True)
+    client_ref = models.CharField(max_length=64, unique=True, blank=True, null=True, help_text="Idempotency key sent by the mobile app")
     visit_date = models.DateField(blank=True, null=True)
     officer = models.ForeignKey(Staff, on_delete=models.SET_NULL, blank=True, null=True)
     observation = models.TextField(blank=True, null=True)
@@ -283,6 +309,7 @@ class Farm(TimeStampModel):
     class Meta:
         verbose_name = "Farm"
         verbose_name_plural = "Farms"
+        indexes = [models.Index(fields=['updated_at', 'id'], name='farm_sync_idx')]
     
     # def save(self, *args, **kwargs):
     #     if not self.farm_code:
@@ -297,6 +324,7 @@ class Farm(TimeStampModel):
 class MonitoringVisit(models.Model):
     # Basic Visit Information
     visit_id = models.CharField(max_length=50, unique=True, verbose_name="Visit ID / Reference Number")
+    client_ref = models.CharField(max_length=64, unique=True, blank=True, null=True, help_text="Idempotency key sent by the mobile app")
     date_of_visit = models.DateField(verbose_name="Date of Visit")
     officer = models.ForeignKey(UserProfile, on_delete=models.PROTECT, verbose_name="Officer Name & ID")
     farm = models.ForeignKey(Farm, on_delete=models.CASCADE, verbose_name="Farm Name & ID")
@@ -359,6 +387,7 @@ class MonitoringVisit(models.Model):
         verbose_name = "Monitoring Visit"
         verbose_name_plural = "Monitoring Visits"
         ordering = ['-date_of_visit', 'visit_id']
+        indexes = [models.Index(fields=['updated_at', 'id'], name='monitoringvisit_sync_idx')]
     
     def __str__(self):
         return f"{self.visit_id} - {self.date_of_visit}"
@@ -440,6 +469,11 @@ class Loan(TimeStampModel):
         ('repaying', 'Repaying'),
         ('completed', 'Completed'),
         ('defaulted', 'Defaulted'),
+        ('rejected', 'Rejected'),
+    )
+    INTEREST_METHODS = (
+        ('reducing', 'Reducing Balance'),
+        ('flat', 'Flat Rate'),
     )
     
     farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name='loans')
@@ -452,22 +486,39 @@ class Loan(TimeStampModel):
     disbursement_date = models.DateField(blank=True, null=True)
     interest_rate = models.FloatField(validators=[MinValueValidator(0)])
     term_months = models.IntegerField(validators=[MinValueValidator(1)])
+    interest_method = models.CharField(max_length=10, choices=INTEREST_METHODS, default='reducing')
     status = models.CharField(max_length=20, choices=LOAN_STATUS, default='applied')
     collateral_details = models.TextField(blank=True, null=True)
     
+    # Ledger balances, maintained by portal.services.ledger
+    total_disbursed = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    total_repaid = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    last_payment_date = models.DateField(blank=True, null=True, editable=False)
+    
+    LEDGER_FIELDS = ('total_disbursed', 'total_repaid', 'outstanding', 'last_payment_date')
+    
     def __str__(self):
         return f"Loan {self.loan_id} - {self.farmer}"
     
     class Meta:
         verbose_name = "Loan"
         verbose_name_plural = "Loans"
+        # Keyset pagination of the loan list, see portal.services.datatables
+        indexes = [models.Index(fields=['application_date', 'id'], name='loan_application_keyset_idx')]
     
     def save(self, *args, **kwargs):
         if not self.loan_id:
             # Generate loan ID if not provided
-            count = Loan.objects.count() + 1
-            farmer_code = self.farmer.national_id[-4:] if self.farmer.national_id else "0000"
-            self.loan_id = f"LN{farmer_code}{count:04d}"
+            from portal.services.sequences import next_loan_id
+            self.loan_id = next_loan_id(self.farmer)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Never write back ledger balances read before a disbursement or
+            # repayment changed them
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LEDGER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
 
@@ -486,6 +537,7 @@ class LoanDisbursement(TimeStampModel):
     class Meta:
         verbose_name = "Loan Disbursement"
         verbose_name_plural = "Loan Disbursements"
+        indexes = [models.Index(fields=['disbursement_date', 'id'], name='disbursement_keyset_idx')]
 
 class LoanRepayment(TimeStampModel):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='repayments')
@@ -501,6 +553,116 @@ class LoanRepayment(TimeStampModel):
     class Meta:
         verbose_name = "Loan Repayment"
         verbose_name_plural = "Loan Repayments"
+        indexes = [
+            models.Index(fields=['transaction_reference'], name='repayment_reference_idx'),
+            models.Index(fields=['repayment_date', 'id'], name='repayment_keyset_idx'),
+        ]
+
+
+class LoanInstallment(models.Model):
+    """
+    One installment of a loan's repayment schedule, with the repayments
+    matched to it oldest first. Built by portal.services.amortization.
+    """
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='installments')
+    number = models.PositiveSmallIntegerField()
+    due_date = models.DateField()
+    principal_due = models.DecimalField(max_digits=12, decimal_places=2)
+    interest_due = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_due = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid_date = models.DateField(blank=True, null=True, help_text="Date the installment was paid in full")
+    
+    def __str__(self):
+        return f"{self.loan.loan_id} #{self.number}"
+    
+    class Meta:
+        verbose_name = "Loan Installment"
+        verbose_name_plural = "Loan Installments"
+        ordering = ['loan', 'number']
+        unique_together = ('loan', 'number')
+        indexes = [models.Index(fields=['due_date'], name='installment_due_idx')]
+
+
+class StatementImport(TimeStampModel):
+    """
+    A bank or mobile money statement staged for reconciliation, see
+    portal.services.statements.
+    """
+    SOURCES = (
+        ('bank', 'Bank'),
+        ('mobile_money', 'Mobile Money'),
+    )
+    STATUSES = (
+        ('staged', 'Staged'),
+        ('confirmed', 'Confirmed'),
+    )
+
+    source = models.CharField(max_length=20, choices=SOURCES, default='bank')
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUSES, default='staged')
+    total_lines = models.PositiveIntegerField(default=0)
+    matched_lines = models.PositiveIntegerField(default=0)
+    confirmed_lines = models.PositiveIntegerField(default=0)
+    confirmed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    confirmed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.get_source_display()} statement {self.file_name}"
+
+    class Meta:
+        verbose_name = "Statement Import"
+        verbose_name_plural = "Statement Imports"
+        ordering = ['-created_at']
+
+
+class StatementLine(models.Model):
+    """One transaction of a StatementImport and the loan it was matched to."""
+    STATUSES = (
+        ('matched', 'Matched'),
+        ('ambiguous', 'Ambiguous'),
+        ('unmatched', 'Unmatched'),
+        ('duplicate', 'Duplicate'),
+        ('ignored', 'Ignored'),
+        ('rejected', 'Rejected'),
+        ('confirmed', 'Confirmed'),
+    )
+    MATCH_METHODS = (
+        ('reference', 'Transaction Reference'),
+        ('loan_id', 'Loan ID'),
+        ('national_id', 'National ID'),
+        ('phone', 'Phone Number'),
+        ('manual', 'Manual'),
+    )
+
+    statement = models.ForeignKey(StatementImport, on_delete=models.CASCADE, related_name='lines')
+    row_number = models.PositiveIntegerField()
+    transaction_date = models.DateField(blank=True, null=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True)
+    reference = models.CharField(max_length=100, blank=True, null=True)
+    description = models.TextField(blank=True, null=True)
+    payer = models.CharField(max_length=200, blank=True, null=True)
+    phone_number = models.CharField(max_length=20, blank=True, null=True)
+    raw = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=20, choices=STATUSES, default='unmatched')
+    loan = models.ForeignKey(Loan, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    match_method = models.CharField(max_length=20, choices=MATCH_METHODS, blank=True, null=True)
+    candidates = models.JSONField(default=list, blank=True, help_text="Loan ids an ambiguous line could belong to")
+    error = models.CharField(max_length=255, blank=True, null=True)
+    repayment = models.OneToOneField(LoanRepayment, on_delete=models.SET_NULL, blank=True, null=True, related_name='statement_line')
+
+    def __str__(self):
+        return f"{self.statement} line {self.row_number}"
+
+    class Meta:
+        verbose_name = "Statement Line"
+        verbose_name_plural = "Statement Lines"
+        ordering = ['statement', 'row_number']
+        indexes = [
+            models.Index(fields=['statement', 'status'], name='statementline_status_idx'),
+            models.Index(fields=['reference'], name='statementline_reference_idx'),
+        ]
 
 
 
@@ -979,13 +1141,121 @@ class SystemSetting(TimeStampModel):
         verbose_name = "System Setting"
         verbose_name_plural = "System Settings"
 
+class CodeSequence(models.Model):
+    """
+    Last number handed out for a code prefix (e.g. "EX-AS-KMA-", "VISIT-").
+    Allocated through portal.services.sequences, never edited directly.
+    """
+    prefix = models.CharField(max_length=100, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.prefix} ({self.last_value})"
+    
+    class Meta:
+        verbose_name = "Code Sequence"
+        verbose_name_plural = "Code Sequences"
+
+class KpiSnapshot(models.Model):
+    """
+    Dashboard totals for one day, district, project and crop. Every measure
+    is additive, so any rollup is a SUM over these rows. Farmer measures
+    have no project (a farmer can join several), the others no crop.
+    Maintained by portal.services.kpi, never edited directly.
+    """
+    snapshot_date = models.DateField()
+    region = models.ForeignKey(Region, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    district = models.ForeignKey(District, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    crop = models.CharField(max_length=100, blank=True, default='')
+
+    farmers_registered = models.PositiveIntegerField(default=0)
+    yield_total = models.FloatField(default=0, help_text="Sum of parsed estimated yields in tons")
+    yield_count = models.PositiveIntegerField(default=0)
+    farms_registered = models.PositiveIntegerField(default=0)
+    measured_farms = models.PositiveIntegerField(default=0, help_text="Farms with an area")
+    hectares = models.FloatField(default=0)
+    participants = models.PositiveIntegerField(default=0)
+    disbursements = models.PositiveIntegerField(default=0)
+    disbursed_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    repayments = models.PositiveIntegerField(default=0)
+    repaid_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    defaulted_loans = models.PositiveIntegerField(default=0)
+    defaulted_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"KPIs for {self.snapshot_date}"
+
+    class Meta:
+        verbose_name = "KPI Snapshot"
+        verbose_name_plural = "KPI Snapshots"
+        indexes = [
+            models.Index(fields=['snapshot_date'], name='kpi_snapshot_date_idx'),
+            models.Index(fields=['region', 'snapshot_date'], name='kpi_snapshot_region_idx'),
+            models.Index(fields=['project', 'snapshot_date'], name='kpi_snapshot_project_idx'),
+        ]
+
+class PortfolioSnapshot(models.Model):
+    """
+    Loan portfolio quality on one day for one district and project: loans
+    and outstanding balance per days-past-due bucket, and for roll rates
+    the balance each bucket held 30 days earlier and how much of it has
+    since moved to a worse bucket. Every measure is additive. Built
+    nightly by portal.services.portfolio, never edited directly.
+    """
+    snapshot_date = models.DateField()
+    region = models.ForeignKey(Region, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    district = models.ForeignKey(District, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+
+    loans = models.PositiveIntegerField(default=0, help_text="Loans with a balance outstanding")
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    overdue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    loans_current = models.PositiveIntegerField(default=0)
+    outstanding_current = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    loans_1_30 = models.PositiveIntegerField(default=0)
+    outstanding_1_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    loans_31_60 = models.PositiveIntegerField(default=0)
+    outstanding_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    loans_61_90 = models.PositiveIntegerField(default=0)
+    outstanding_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    loans_over_90 = models.PositiveIntegerField(default=0)
+    outstanding_over_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    previous_current = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rolled_current = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    previous_1_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rolled_1_30 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    previous_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rolled_31_60 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    previous_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rolled_61_90 = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Portfolio on {self.snapshot_date}"
+
+    class Meta:
+        verbose_name = "Portfolio Snapshot"
+        verbose_name_plural = "Portfolio Snapshots"
+        indexes = [
+            models.Index(fields=['snapshot_date'], name='portfolio_snapshot_date_idx'),
+            models.Index(fields=['region', 'snapshot_date'], name='portfolio_region_idx'),
+            models.Index(fields=['district', 'snapshot_date'], name='portfolio_district_idx'),
+            models.Index(fields=['project', 'snapshot_date'], name='portfolio_project_idx'),
+        ]
+
 class DataExport(TimeStampModel):
     EXPORT_FORMATS = (
         ('csv', 'CSV'),
         ('json', 'JSON'),
         ('xlsx', 'Excel'),
+        ('parquet', 'Parquet'),
         ('pdf', 'PDF'),
         ('shapefile', 'Shapefile'),
+        ('gpkg', 'GeoPackage'),
     )
     
     requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -1003,6 +1273,13 @@ class DataExport(TimeStampModel):
     ), default='pending')
     error_message = models.TextField(blank=True, null=True)
     
+    # Progress reported by the export worker (manage.py run_export_worker)
+    started_at = models.DateTimeField(blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    total_rows = models.PositiveIntegerField(blank=True, null=True)
+    rows_written = models.PositiveIntegerField(default=0)
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete")
+    
     def __str__(self):
         return f"Export of {self.model_name} by {self.requested_by}"
     
@@ -1010,6 +1287,7 @@ class DataExport(TimeStampModel):
         verbose_name = "Data Export"
         verbose_name_plural = "Data Exports"
         ordering = ['-requested_at']
+        indexes = [models.Index(fields=['status', 'requested_at'], name='dataexport_queue_idx')]
 
 
 
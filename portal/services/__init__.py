@@ -0,0 +1 @@
+"""Shared, non-view logic used by the portal and api apps."""
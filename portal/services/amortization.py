@@ -0,0 +1,296 @@
+"""
+Loan repayment schedules and arrears.
+
+Schedules are computed for a whole batch of loans at once with NumPy: one
+row per loan, one column per month, amounts in integer cents.
+``interest_rate`` is the annual rate in percent and every loan repays
+monthly from its disbursement date over ``term_months``.
+
+``flat``
+    Equal principal each month, and interest on the original principal.
+``reducing``
+    Equal total payments each month (annuity), with interest on the
+    balance still owed.
+
+Rounding differences go into the last installment's principal, so the
+principal always sums to the loan amount.
+
+Repayments are matched to installments oldest first. An installment's
+``paid_date`` is the date the loan's running repayment total first
+covered it. ``refresh_schedules`` stores the result as LoanInstallment
+rows. portal.signals calls it when a loan, disbursement or repayment
+changes. Code writing those rows without signals must call it itself.
+``manage.py build_loan_schedules`` rebuilds every loan.
+
+``arrears`` recomputes the schedules from the loans and repayments for
+any date, so portfolio arrears never need a loop per loan.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import DateField, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from portal.models import Loan, LoanDisbursement, LoanInstallment, LoanRepayment
+
+FLAT = 'flat'
+REDUCING = 'reducing'
+# Loans that have money out and therefore a schedule
+SCHEDULED_STATUSES = ('disbursed', 'repaying', 'completed', 'defaulted')
+CHUNK_SIZE = 10000
+
+Schedule = namedtuple('Schedule', 'loan_ids start number due_date principal interest amount active')
+Arrears = namedtuple('Arrears', 'loan_ids due paid overdue outstanding days_past_due installments_overdue')
+
+
+def _cents(values):
+    return np.fromiter((int(Decimal(value or 0) * 100) for value in values), dtype=np.int64)
+
+
+def _money(cents):
+    return Decimal(int(cents)) / 100
+
+
+def amortize(principal, annual_rate, terms, flat):
+    """
+    ``(principal, interest)`` per installment in cents, arrays of shape
+    ``(loans, longest term)``, zero past each loan's own term.
+
+    ``principal`` is in cents, ``annual_rate`` in percent, ``terms`` in
+    months and ``flat`` a boolean array selecting the flat method.
+    """
+    count = len(principal)
+    longest = int(terms.max()) if count else 0
+    period = np.arange(1, longest + 1)
+    active = period[None, :] <= terms[:, None]
+
+    amount = principal.astype(np.float64)[:, None]
+    rate = (np.asarray(annual_rate, dtype=np.float64) / 1200.0)[:, None]
+    months = terms.astype(np.float64)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        growth = (1 + rate) ** months
+        payment = np.where(rate > 0, amount * rate * growth / (growth - 1), amount / months)
+        # Balance owed at the start of each period
+        grown = (1 + rate) ** (period[None, :] - 1)
+        balance = np.where(rate > 0, amount * grown - payment * (grown - 1) / rate, amount - payment * (period - 1))
+
+    reducing_interest = balance * rate
+    interest = np.where(flat[:, None], amount * rate, reducing_interest)
+    principal_part = np.where(flat[:, None], amount / months, payment - reducing_interest)
+
+    interest = np.where(active, np.rint(interest), 0).astype(np.int64)
+    principal_part = np.where(active, np.rint(principal_part), 0).astype(np.int64)
+    if count:
+        principal_part[np.arange(count), terms - 1] += principal - principal_part.sum(axis=1)
+    return principal_part, interest
+
+
+def due_dates(start, longest):
+    """Due date of each monthly installment, the start's day of month clamped to the month end."""
+    month = start.astype('datetime64[M]')
+    day = (start - month.astype('datetime64[D]')).astype(np.int64)
+    due_month = month[:, None] + np.arange(1, longest + 1)
+    month_days = ((due_month + 1).astype('datetime64[D]') - due_month.astype('datetime64[D]')).astype(np.int64)
+    return due_month.astype('datetime64[D]') + np.minimum(day[:, None], month_days - 1)
+
+
+def _start_date():
+    """The loan's disbursement date, or its first disbursement's when the field was never set."""
+    first = LoanDisbursement.objects.filter(loan=OuterRef('pk')).order_by().values('loan').annotate(
+        first=Min('disbursement_date')
+    ).values('first')
+    return Coalesce('disbursement_date', Subquery(first, output_field=DateField()))
+
+
+def build(queryset):
+    """The Schedule of the scheduled loans in ``queryset``."""
+    rows = list(
+        queryset.filter(status__in=SCHEDULED_STATUSES).annotate(schedule_start=_start_date())
+        .filter(schedule_start__isnull=False).order_by('id')
+        .values_list('id', 'amount', 'interest_rate', 'term_months', 'interest_method', 'schedule_start')
+    )
+    loan_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    principal = _cents(row[1] for row in rows)
+    rate = np.array([row[2] or 0 for row in rows], dtype=np.float64)
+    terms = np.array([max(row[3] or 1, 1) for row in rows], dtype=np.int64)
+    flat = np.array([row[4] == FLAT for row in rows], dtype=bool)
+    start = np.array([row[5] for row in rows], dtype='datetime64[D]')
+
+    principal_part, interest = amortize(principal, rate, terms, flat)
+    longest = principal_part.shape[1]
+    active = np.arange(1, longest + 1)[None, :] <= terms[:, None]
+    return Schedule(
+        loan_ids=loan_ids,
+        start=start,
+        number=np.broadcast_to(np.arange(1, longest + 1), principal_part.shape),
+        due_date=due_dates(start, longest),
+        principal=principal_part,
+        interest=interest,
+        amount=principal_part + interest,
+        active=active,
+    )
+
+
+def repayments(loan_ids, as_of=None):
+    """
+    ``(loan index, date, cents)`` arrays of the live repayments of
+    ``loan_ids`` (sorted), ordered by loan then date.
+    """
+    queryset = LoanRepayment.objects.filter(loan_id__in=loan_ids.tolist())
+    if as_of is not None:
+        queryset = queryset.filter(repayment_date__lte=as_of)
+    rows = list(queryset.order_by('loan_id', 'repayment_date', 'id').values_list('loan_id', 'repayment_date', 'amount'))
+    index = np.searchsorted(loan_ids, np.array([row[0] for row in rows], dtype=np.int64))
+    dates = np.array([row[1] for row in rows], dtype='datetime64[D]')
+    # Reversals are left to the ledger, the running total has to stay monotonic
+    amounts = np.maximum(_cents(row[2] for row in rows), 0)
+    return index, dates, amounts
+
+
+def match(schedule, payment_index, payment_dates, payment_amounts):
+    """
+    ``(paid, paid_date)`` per installment: repayments allocated to the
+    oldest installment first, and the date each one was covered in full
+    (NaT while it isn't).
+    """
+    count = len(schedule.loan_ids)
+    paid_total = np.bincount(payment_index, weights=payment_amounts, minlength=count).astype(np.int64)
+    covered = np.cumsum(schedule.amount, axis=1)
+    paid = np.clip(paid_total[:, None] - (covered - schedule.amount), 0, schedule.amount)
+
+    # Running total over every loan's repayments, offset to where each loan's run starts
+    running = np.cumsum(payment_amounts)
+    first = np.searchsorted(payment_index, np.arange(count), side='left')
+    end = np.searchsorted(payment_index, np.arange(count), side='right')
+    offset = np.concatenate(([0], running))[first]
+    position = np.searchsorted(running, offset[:, None] + covered, side='left')
+    fully_paid = (position >= first[:, None]) & (position < end[:, None]) & schedule.active
+    if len(payment_dates):
+        dates = payment_dates[np.minimum(position, len(payment_dates) - 1)]
+    else:
+        dates = np.full(position.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+    return paid, np.where(fully_paid, dates, np.datetime64('NaT'))
+
+
+def refresh_schedules(loan_ids):
+    """Rebuild the stored installments of ``loan_ids`` with their repayments matched."""
+    loan_ids = sorted({loan_id for loan_id in loan_ids if loan_id})
+    if not loan_ids:
+        return 0
+
+    with transaction.atomic():
+        # Locked like the ledger, so two refreshes of a loan can't interleave
+        list(Loan.all_objects.select_for_update().filter(id__in=loan_ids).order_by('id').values_list('id', flat=True))
+        schedule = build(Loan.objects.filter(id__in=loan_ids))
+        paid, paid_date = match(schedule, *repayments(schedule.loan_ids))
+
+        LoanInstallment.objects.filter(loan_id__in=loan_ids).delete()
+        rows, columns = np.nonzero(schedule.active)
+        installments = [
+            LoanInstallment(
+                loan_id=int(schedule.loan_ids[row]),
+                number=int(schedule.number[row, column]),
+                due_date=schedule.due_date[row, column].item(),
+                principal_due=_money(schedule.principal[row, column]),
+                interest_due=_money(schedule.interest[row, column]),
+                amount_due=_money(schedule.amount[row, column]),
+                amount_paid=_money(paid[row, column]),
+                paid_date=None if np.isnat(paid_date[row, column]) else paid_date[row, column].item(),
+            )
+            for row, column in zip(rows, columns)
+        ]
+        LoanInstallment.objects.bulk_create(installments, batch_size=5000)
+    return len(installments)
+
+
+def schedule_arrears(schedule, payment_index, payment_amounts, as_of):
+    """
+    Arrears of the loans of ``schedule`` started by ``as_of``, from their
+    repayments as returned by ``repayments``. An installment falls due the
+    day after its due date, so one due on ``as_of`` is not yet in arrears.
+    """
+    as_of = np.datetime64(as_of)
+    count = len(schedule.loan_ids)
+    paid_total = np.bincount(payment_index, weights=payment_amounts, minlength=count).astype(np.int64)
+
+    is_due = schedule.active & (schedule.due_date < as_of)
+    due = np.where(is_due, schedule.amount, 0).sum(axis=1)
+    covered = np.cumsum(schedule.amount, axis=1)
+    unpaid_due = is_due & (covered > paid_total[:, None])
+    oldest = np.where(unpaid_due.any(axis=1), np.argmax(unpaid_due, axis=1), -1)
+    oldest_due = schedule.due_date[np.arange(count), np.maximum(oldest, 0)]
+    days = np.where(oldest >= 0, (as_of - oldest_due).astype(np.int64), 0)
+
+    result = Arrears(
+        loan_ids=schedule.loan_ids,
+        due=due,
+        paid=paid_total,
+        overdue=np.maximum(due - paid_total, 0),
+        outstanding=np.maximum(schedule.amount.sum(axis=1) - paid_total, 0),
+        days_past_due=days,
+        installments_overdue=unpaid_due.sum(axis=1),
+    )
+    started = schedule.start <= as_of
+    return Arrears(*(array[started] for array in result))
+
+
+def arrears(as_of=None, queryset=None):
+    """
+    Arrears of every scheduled loan in ``queryset`` (all loans by default)
+    disbursed by ``as_of`` (today), all amounts in cents:
+
+    ``due``: installments due before then; ``paid``: repaid by then;
+    ``overdue``: due but unpaid; ``outstanding``: principal and interest
+    still to pay in total; ``days_past_due``: age of the oldest unpaid
+    installment; ``installments_overdue``: installments due and not fully paid.
+    """
+    as_of = as_of or timezone.localdate()
+    queryset = Loan.objects.all() if queryset is None else queryset
+    ids = np.array(list(queryset.filter(status__in=SCHEDULED_STATUSES).order_by('id').values_list('id', flat=True)),
+                   dtype=np.int64)
+
+    parts = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = ids[start:start + CHUNK_SIZE]
+        schedule = build(Loan.objects.filter(id__in=chunk.tolist()))
+        payment_index, _, payment_amounts = repayments(schedule.loan_ids, as_of)
+        parts.append(schedule_arrears(schedule, payment_index, payment_amounts, as_of))
+
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return Arrears(*([empty] * len(Arrears._fields)))
+    return Arrears(*(np.concatenate(arrays) for arrays in zip(*parts)))
+
+
+def portfolio_arrears(as_of=None, queryset=None):
+    """Portfolio totals of ``arrears``, in currency units."""
+    result = arrears(as_of, queryset)
+    late = result.overdue > 0
+    return {
+        'loans': len(result.loan_ids),
+        'loans_in_arrears': int(late.sum()),
+        'amount_due': float(result.due.sum()) / 100,
+        'amount_paid': float(result.paid.sum()) / 100,
+        'amount_overdue': float(result.overdue.sum()) / 100,
+        'outstanding': float(result.outstanding.sum()) / 100,
+        'average_days_past_due': float(result.days_past_due[late].mean()) if late.any() else 0,
+    }
+
+
+def expected_collections(since, until, queryset=None):
+    """Installment amounts falling due per month between ``since`` and ``until``, from the stored schedules."""
+    installments = LoanInstallment.objects.filter(
+        due_date__gte=since, due_date__lte=until, loan__is_deleted=False
+    )
+    if queryset is not None:
+        installments = installments.filter(loan__in=queryset)
+    rows = installments.annotate(month=TruncMonth('due_date', output_field=DateField())).values('month').annotate(
+        expected=Sum('amount_due'), collected=Sum('amount_paid')
+    ).order_by('month')
+    return [
+        {'month': row['month'].isoformat(), 'expected': float(row['expected']), 'collected': float(row['collected'])}
+        for row in rows
+    ]
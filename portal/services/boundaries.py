@@ -0,0 +1,157 @@
+"""
+Prebuilt region/district GeoJSON layers.
+
+Each layer is rendered in PostGIS at a few simplification levels, wrapped
+in the usual ``{"success": true, "data": ...}`` body and stored gzipped
+under settings.MAP_LAYER_CACHE_DIR. Requests just stream the stored bytes
+with an ETag; the files are only rebuilt after a Region or District has
+been saved or deleted (see portal.signals).
+"""
+import gzip
+import hashlib
+import os
+
+from django.conf import settings
+from django.db import connection
+
+from portal.models import District, Region
+
+LAYERS = ('regions', 'districts')
+
+# Simplification tolerance in degrees per level
+LEVELS = {
+    'full': 0,
+    'medium': 0.001,
+    'low': 0.01,
+}
+DEFAULT_LEVEL = 'full'
+
+# Part of the stored file names, bumped whenever the layer SQL changes so
+# the files built by the previous release are never served again
+LAYER_VERSION = 2
+
+# Stored bytes and ETag per (layer, level), keyed by file mtime
+_loaded = {}
+
+
+def level_for_zoom(zoom):
+    """Pick the coarsest level that still looks right at ``zoom``."""
+    if zoom <= 7:
+        return 'low'
+    if zoom <= 10:
+        return 'medium'
+    return 'full'
+
+
+def _geometry_sql(level):
+    tolerance = LEVELS[level]
+    if tolerance:
+        return f"ST_AsGeoJSON(ST_SimplifyPreserveTopology(t.geom, {tolerance}), 6)::json"
+    return "ST_AsGeoJSON(t.geom, 6)::json"
+
+
+def _layer_sql(layer, level):
+    geometry = _geometry_sql(level)
+    if layer == 'regions':
+        return f"""
+            SELECT t.id, json_build_object(
+                'region', t.region,
+                'reg_code', t.reg_code,
+                'district_count', (SELECT COUNT(*) FROM {District._meta.db_table} d
+                                   WHERE d.reg_code = t.reg_code AND NOT d.is_deleted)
+            ), {geometry}
+            FROM {Region._meta.db_table} t
+            WHERE t.is_deleted = false
+            ORDER BY t.id
+        """
+    return f"""
+        SELECT t.id, json_build_object(
+            'district', t.district,
+            'district_code', t.district_code,
+            'region', t.region,
+            'reg_code', t.reg_code
+        ), {geometry}
+        FROM {District._meta.db_table} t
+        WHERE t.is_deleted = false
+        ORDER BY t.id
+    """
+
+
+def build_layer(layer, level):
+    """Render one layer/level to the JSON body the map expects."""
+    sql = f"""
+        SELECT json_build_object(
+            'success', true,
+            'data', json_build_object(
+                'type', 'FeatureCollection',
+                'features', COALESCE(json_agg(json_build_object(
+                    'type', 'Feature',
+                    'id', f.id,
+                    'properties', f.properties,
+                    'geometry', f.geometry
+                ) ORDER BY f.id), '[]'::json)
+            )
+        )::text
+        FROM ({_layer_sql(layer, level)}) AS f(id, properties, geometry)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()[0].encode('utf-8')
+
+
+def layer_path(layer, level):
+    return os.path.join(settings.MAP_LAYER_CACHE_DIR, f'{layer}-{level}-v{LAYER_VERSION}.json.gz')
+
+
+def write_layer(layer, level):
+    """Build a layer/level and store it gzipped. Returns the compressed size."""
+    data = gzip.compress(build_layer(layer, level), compresslevel=9)
+    path = layer_path(layer, level)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def build_all():
+    """Prebuild every layer at every level."""
+    return {
+        (layer, level): write_layer(layer, level)
+        for layer in LAYERS for level in LEVELS
+    }
+
+
+def get_layer(layer, level):
+    """
+    Return ``(gzipped_bytes, etag)`` for a layer/level, building it on
+    first use. Bytes are kept in memory until the file on disk changes.
+    """
+    path = layer_path(layer, level)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        write_layer(layer, level)
+        mtime = os.stat(path).st_mtime_ns
+
+    cached = _loaded.get((layer, level))
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    etag = '"%s"' % hashlib.sha1(data).hexdigest()
+    _loaded[(layer, level)] = (mtime, data, etag)
+    return data, etag
+
+
+def invalidate_layers():
+    """Remove all stored layers, they are rebuilt on the next request."""
+    for layer in LAYERS:
+        for level in LEVELS:
+            try:
+                os.remove(layer_path(layer, level))
+            except FileNotFoundError:
+                pass
+    _loaded.clear()
@@ -0,0 +1,154 @@
+"""
+Server side clustering of farm locations for the low zoom map.
+
+Farms are grouped into a regular lon/lat grid whose cell size halves with
+every zoom level. Clusters are computed per (zoom, grid tile) with one
+indexed, grouped query and kept in ``settings.MAP_CLUSTER_CACHE``. When a
+farm is added, moved, re-statused or deleted only the tiles at its old and
+new position are dropped (see portal.signals), the rest of the cache stays
+valid. The cache is shared by every process, so a drop reaches them all.
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+from portal.models import Farm
+
+# Cells per tile side, 4 gives 64px cells on a 256px tile
+CELLS_PER_TILE = 4
+MAX_CLUSTER_ZOOM = 18
+MAX_TILES_PER_REQUEST = 64
+CACHE_TIMEOUT = 60 * 60
+CACHE_PREFIX = 'farm_clusters'
+
+
+def _cache():
+    return caches[getattr(settings, 'MAP_CLUSTER_CACHE', 'default')]
+
+
+def tile_size(zoom):
+    """Width of a grid tile in degrees."""
+    return 360.0 / (2 ** zoom)
+
+
+def cell_size(zoom):
+    return tile_size(zoom) / CELLS_PER_TILE
+
+
+def tile_for(lon, lat, zoom):
+    """Return the (tx, ty) grid tile containing lon/lat."""
+    size = tile_size(zoom)
+    return int(math.floor((lon + 180.0) / size)), int(math.floor((lat + 90.0) / size))
+
+
+def tiles_for_bbox(bbox, zoom):
+    """All grid tiles intersecting ``bbox`` = (west, south, east, north)."""
+    west, south, east, north = bbox
+    x0, y0 = tile_for(west, south, zoom)
+    x1, y1 = tile_for(east, north, zoom)
+    return [(tx, ty) for tx in range(x0, x1 + 1) for ty in range(y0, y1 + 1)]
+
+
+def cache_key(zoom, tx, ty):
+    return f'{CACHE_PREFIX}:{zoom}:{tx}:{ty}'
+
+
+def compute_tile_clusters(zoom, tx, ty):
+    """Cluster the farms of one grid tile with a single grouped query."""
+    size = tile_size(zoom)
+    cell = cell_size(zoom)
+    west = tx * size - 180.0
+    south = ty * size - 90.0
+
+    sql = f"""
+        SELECT FLOOR((ST_X(f.geom) + 180.0) / %s)::bigint AS gx,
+               FLOOR((ST_Y(f.geom) + 90.0) / %s)::bigint AS gy,
+               COALESCE(f.status, 'unknown') AS status,
+               COUNT(*) AS farms,
+               COALESCE(SUM(f.area_hectares), 0) AS area,
+               SUM(ST_X(f.geom)) AS sum_x,
+               SUM(ST_Y(f.geom)) AS sum_y
+        FROM (
+            SELECT location::geometry AS geom, area_hectares, status
+            FROM {Farm._meta.db_table}
+            WHERE is_deleted = false
+              AND location IS NOT NULL
+              AND location && ST_MakeEnvelope(%s, %s, %s, %s, 4326)::geography
+        ) f
+        WHERE ST_X(f.geom) >= %s AND ST_X(f.geom) < %s
+          AND ST_Y(f.geom) >= %s AND ST_Y(f.geom) < %s
+        GROUP BY gx, gy, status
+    """
+    params = [
+        cell, cell,
+        west, south, west + size, south + size,
+        west, west + size, south, south + size,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    clusters = {}
+    for gx, gy, status, farms, area, sum_x, sum_y in rows:
+        cluster = clusters.setdefault((gx, gy), {
+            'count': 0, 'area_hectares': 0.0, 'statuses': {}, 'sum_x': 0.0, 'sum_y': 0.0,
+        })
+        cluster['count'] += farms
+        cluster['area_hectares'] += float(area)
+        cluster['statuses'][status] = farms
+        cluster['sum_x'] += sum_x
+        cluster['sum_y'] += sum_y
+
+    result = []
+    for (gx, gy), cluster in clusters.items():
+        result.append({
+            'id': f'{zoom}/{gx}/{gy}',
+            'lng': round(cluster['sum_x'] / cluster['count'], 6),
+            'lat': round(cluster['sum_y'] / cluster['count'], 6),
+            'count': cluster['count'],
+            'area_hectares': round(cluster['area_hectares'], 2),
+            'statuses': cluster['statuses'],
+        })
+    return result
+
+
+def get_clusters(zoom, bbox=None):
+    """
+    Return the clusters for ``zoom`` inside ``bbox`` (west, south, east, north).
+    Cached tiles are reused, missing ones are computed and stored.
+    """
+    zoom = max(0, min(zoom, MAX_CLUSTER_ZOOM))
+    bbox = bbox or (-180.0, -90.0, 180.0, 90.0)
+    tiles = tiles_for_bbox(bbox, zoom)
+    if len(tiles) > MAX_TILES_PER_REQUEST:
+        raise ValueError('bbox is too large for this zoom level')
+
+    cache = _cache()
+    keys = {cache_key(zoom, tx, ty): (tx, ty) for tx, ty in tiles}
+    cached = cache.get_many(list(keys))
+
+    missing = {}
+    for key, (tx, ty) in keys.items():
+        if key not in cached:
+            missing[key] = compute_tile_clusters(zoom, tx, ty)
+    if missing:
+        cache.set_many(missing, CACHE_TIMEOUT)
+        cached.update(missing)
+
+    west, south, east, north = bbox
+    clusters = []
+    for tile_clusters in cached.values():
+        for cluster in tile_clusters:
+            if west <= cluster['lng'] <= east and south <= cluster['lat'] <= north:
+                clusters.append(cluster)
+    return clusters
+
+
+def invalidate_location(lon, lat):
+    """Drop the cached tile holding lon/lat at every zoom level."""
+    _cache().delete_many([
+        cache_key(zoom, *tile_for(lon, lat, zoom))
+        for zoom in range(MAX_CLUSTER_ZOOM + 1)
+    ])
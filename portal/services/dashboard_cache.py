@@ -0,0 +1,155 @@
+"""
+Response cache for the dashboard and statistics endpoints.
+
+An entry is keyed by view, role, district scope and query string, so two
+users only share it when they would be shown the same numbers. Each view
+lists the models it reads in ``DEPENDENCIES``. Every model has a
+generation counter in the cache that is part of the key of the entries
+reading it, and saving or deleting a row of that model bumps the counter
+after the transaction commits (see portal.signals). That drops the
+entries of exactly the views that read the model, the rest stay cached.
+Code that writes rows without signals (``bulk_create``, queryset
+``update``) calls ``invalidate`` itself.
+
+Entries live in ``settings.DASHBOARD_CACHE``. The counters have to be
+seen by every process that serves or writes, so that is a file based
+cache. A local memory cache only works with a single process.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils import timezone
+
+from portal.models import (
+    District, Farm, Farmer, KpiSnapshot, Loan, LoanDisbursement, LoanRepayment, MonitoringVisit,
+    PortfolioSnapshot, Project, ProjectParticipation, Region, UserProfile
+)
+from utils.sidebar import UserRole
+
+CACHE_TIMEOUT = 300
+KEY_PREFIX = 'dashboard'
+
+# view: models its numbers are read from
+DEPENDENCIES = {
+    'monitoring_dashboard': (KpiSnapshot, Project, Region),
+    'performance_analysis': (UserProfile, Farmer, Farm, Loan, LoanDisbursement, ProjectParticipation),
+    'regional_rollup': (Region, District, Farmer, Farm, Loan),
+    'loan_stats': (Loan, LoanDisbursement, LoanRepayment, PortfolioSnapshot),
+    'portfolio_trends': (PortfolioSnapshot,),
+    'repayment_stats': (Loan, LoanRepayment),
+    'project_stats': (Project,),
+    'farm_stats': (Farm, Farmer, UserProfile, District),
+    'monitoring_stats': (MonitoringVisit,),
+}
+TRACKED_MODELS = {model for models in DEPENDENCIES.values() for model in models}
+
+# Group names (utils.sidebar.UserRole) as UserProfile roles
+GROUP_ROLES = {role.value: role.name.lower() for role in UserRole}
+# Roles that only see their own district
+DISTRICT_ROLES = {'field_officer', 'farmer'}
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE', 'default')]
+
+
+def _generation_key(model):
+    return f'{KEY_PREFIX}:generation:{model._meta.label_lower}'
+
+
+def generations(models):
+    """Current generation of each of ``models``, started for the ones without one."""
+    cache = _cache()
+    keys = [_generation_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # A clock value, so a counter lost to eviction never restarts at
+            # a value an older entry was stored under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def invalidate(*models):
+    """Drop every entry reading any of ``models``."""
+    cache = _cache()
+    for model in models:
+        key = _generation_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def user_role(user):
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_superuser:
+        return 'admin'
+    profile = getattr(user, 'profile', None)
+    if profile and profile.role:
+        return profile.role
+    roles = sorted({GROUP_ROLES[name] for name in user.groups.values_list('name', flat=True) if name in GROUP_ROLES})
+    return '+'.join(roles) or 'none'
+
+
+def user_scope(user, role):
+    if role not in DISTRICT_ROLES:
+        return 'all'
+    profile = getattr(user, 'profile', None)
+    return f'district:{profile.district_id}' if profile and profile.district_id else 'district:none'
+
+
+def cache_key(view, request):
+    role = user_role(request.user)
+    scope = user_scope(request.user, role)
+    params = sorted((key, sorted(values)) for key, values in request.GET.lists())
+    # "Last 30 days" figures move with the date even without writes
+    parts = [params, generations(DEPENDENCIES[view]), timezone.localdate().isoformat()]
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'{KEY_PREFIX}:{view}:{role}:{scope}:{digest}'
+
+
+def get_or_compute(view, request, compute, timeout=CACHE_TIMEOUT):
+    """``compute()`` for ``request``, served from the cache while it is current."""
+    cache = _cache()
+    key = cache_key(view, request)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout)
+    return data
+
+
+def cached_response(view, timeout=CACHE_TIMEOUT):
+    """
+    Cache the successful GET responses of a JSON view under ``view``,
+    see ``DEPENDENCIES``. Errors are never cached.
+    """
+    if view not in DEPENDENCIES:
+        raise ValueError(f'{view} has no dependencies in DEPENDENCIES')
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            cache = _cache()
+            key = f'{cache_key(view, request)}:{hashlib.md5(repr((args, kwargs)).encode()).hexdigest()}'
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return _wrapped_view
+    return decorator
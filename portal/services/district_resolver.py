@@ -0,0 +1,164 @@
+"""
+In-memory point to district/region lookup.
+
+All district polygons are loaded once into prepared GEOS geometries and
+bucketed on a regular grid by bounding box, so resolving a point is a dict
+lookup plus a prepared ``contains`` on the few districts whose box covers
+it, no database round trip. The index is reloaded lazily after a District
+or Region changes (see portal.signals) and after MAX_AGE seconds so other
+worker processes pick up edits as well.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+
+from portal.models import District, Region
+
+# Grid cell size in degrees used to bucket district bounding boxes
+CELL_SIZE = 0.25
+# Distance in degrees for the "nearby district" fallback, about 1km
+NEARBY_BUFFER = 0.01
+MAX_AGE = 15 * 60
+
+DistrictMatch = namedtuple('DistrictMatch', [
+    'district_id', 'district', 'district_code',
+    'region_id', 'region', 'reg_code', 'nearby',
+])
+RegionMatch = namedtuple('RegionMatch', ['region_id', 'region', 'reg_code'])
+
+
+def _cell(value):
+    return int(math.floor(value / CELL_SIZE))
+
+
+class DistrictResolver:
+    """Resolve points to districts and regions from an in-memory index."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._loaded_at = 0
+
+    def load(self):
+        """(Re)build the index from the database."""
+        regions = {}
+        regions_by_name = {}
+        for row in Region.objects.values('id', 'region', 'reg_code'):
+            region = RegionMatch(row['id'], row['region'], row['reg_code'])
+            if row['reg_code']:
+                regions[row['reg_code']] = region
+            if row['region']:
+                regions_by_name[row['region'].strip().lower()] = region
+
+        districts = []
+        grid = {}
+        rows = District.objects.filter(geom__isnull=False).order_by('id').values(
+            'id', 'district', 'district_code', 'reg_code', 'geom'
+        )
+        for row in rows:
+            region = regions.get(row['reg_code']) if row['reg_code'] else None
+            entry = (
+                row['geom'].prepared,
+                row['geom'].extent,
+                DistrictMatch(
+                    district_id=row['id'],
+                    district=row['district'],
+                    district_code=row['district_code'],
+                    region_id=region.region_id if region else None,
+                    region=region.region if region else None,
+                    reg_code=region.reg_code if region else None,
+                    nearby=False,
+                ),
+            )
+            position = len(districts)
+            districts.append(entry)
+
+            xmin, ymin, xmax, ymax = entry[1]
+            for cx in range(_cell(xmin), _cell(xmax) + 1):
+                for cy in range(_cell(ymin), _cell(ymax) + 1):
+                    grid.setdefault((cx, cy), []).append(position)
+
+        # Swap in one assignment so concurrent readers never see a partial index
+        self._index = (districts, grid, regions, regions_by_name)
+        self._loaded_at = time.monotonic()
+        return len(districts)
+
+    def invalidate(self):
+        """Force a reload on next use."""
+        self._index = None
+
+    def _get_index(self):
+        index = self._index
+        if index is None or time.monotonic() - self._loaded_at > MAX_AGE:
+            with self._lock:
+                if self._index is index:
+                    self.load()
+                index = self._index
+        return index
+
+    def _candidates(self, index, xmin, ymin, xmax, ymax):
+        districts, grid = index[0], index[1]
+        seen = set()
+        for cx in range(_cell(xmin), _cell(xmax) + 1):
+            for cy in range(_cell(ymin), _cell(ymax) + 1):
+                for position in grid.get((cx, cy), ()):
+                    if position not in seen:
+                        seen.add(position)
+                        yield districts[position]
+
+    def resolve(self, point, index=None):
+        """
+        Return the DistrictMatch for a GEOS point (or a polygon's centroid),
+        falling back to a district within ~1km, or None if nothing is found.
+        """
+        if point is None:
+            return None
+        if point.geom_type != 'Point':
+            point = point.centroid
+        index = index or self._get_index()
+        x, y = point.x, point.y
+
+        for prepared, extent, match in self._candidates(index, x, y, x, y):
+            if extent[0] <= x <= extent[2] and extent[1] <= y <= extent[3] and prepared.contains(point):
+                return match
+
+        buffered = point.buffer(NEARBY_BUFFER)
+        for prepared, extent, match in self._candidates(
+            index, x - NEARBY_BUFFER, y - NEARBY_BUFFER, x + NEARBY_BUFFER, y + NEARBY_BUFFER
+        ):
+            if prepared.intersects(buffered):
+                return match._replace(nearby=True)
+        return None
+
+    def resolve_many(self, points):
+        """Resolve a list of points in one pass, None where nothing matched."""
+        index = self._get_index()
+        return [self.resolve(point, index=index) for point in points]
+
+    def region_by_code(self, reg_code):
+        return self._get_index()[2].get(reg_code) if reg_code else None
+
+    def region_by_name(self, name):
+        return self._get_index()[3].get(name.strip().lower()) if name else None
+
+
+district_resolver = DistrictResolver()
+
+
+def farm_location_codes(match, farmer=None):
+    """
+    (region_code, district_code) used in farm codes, "UN" where unknown.
+    Like the API, falls back to the farmer's own district when the point
+    could not be placed.
+    """
+    region_code = match.reg_code if match and match.reg_code else "UN"
+    district_code = match.district_code if match and match.district_code else "UN"
+    if region_code == "UN" or district_code == "UN":
+        farmer_district = farmer.user_profile.district if farmer else None
+        if farmer_district:
+            district_code = farmer_district.district_code or "UN"
+            region = district_resolver.region_by_name(farmer_district.region)
+            if region and region.reg_code:
+                region_code = region.reg_code
+    return region_code, district_code
@@ -0,0 +1,190 @@
+"""
+Background export jobs.
+
+A DataExport row is a job: it is created ``pending`` by ``queue_export``,
+claimed by ``manage.py run_export_worker`` with ``SELECT ... FOR UPDATE
+SKIP LOCKED`` (so any number of workers can poll the same table without
+taking the same job) and run in a worker process. The file is written with
+the streaming export engine to MEDIA_ROOT/data_exports/ while ``progress``
+and ``rows_written`` are updated on the row for the UI to poll. The
+spatial formats (gpkg, shapefile) are written by ogr2ogr straight from
+PostGIS, see portal.services.spatial_exports, and report progress per layer.
+"""
+import json
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from portal.models import DataExport
+from portal.services import exports, spatial_exports
+
+EXPORT_DIR = 'data_exports'
+# Seconds between progress writes while an export runs
+PROGRESS_INTERVAL = 2
+# A processing job not updated for this long is assumed to have lost its worker
+STALE_AFTER = timedelta(minutes=30)
+
+
+class ExportError(ValueError):
+    pass
+
+
+def validate_request(model_name, export_format):
+    """Raise ExportError unless ``model_name`` can be exported as ``export_format``."""
+    if export_format in spatial_exports.FORMATS:
+        export = spatial_exports.SPATIAL_EXPORTS.get(model_name)
+        if export is None:
+            raise ExportError(f'{model_name} has no spatial export')
+        return export
+
+    export = exports.EXPORTS.get(model_name)
+    if export is None:
+        raise ExportError(f'Unknown export: {model_name}')
+    if export_format not in export.formats or export_format not in exports.WRITERS:
+        raise ExportError(f'{export_format} is not available for {model_name}')
+    return export
+
+
+def queue_export(user, model_name, export_format, filters=None):
+    """Create a pending DataExport for the worker to pick up."""
+    validate_request(model_name, export_format)
+    return DataExport.objects.create(
+        requested_by=user,
+        added_by=user,
+        model_name=model_name,
+        export_format=export_format,
+        filters=json.dumps(filters or {}),
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next(worker):
+    """
+    Mark the oldest pending export as processing and return it, or None.
+    Rows locked by another worker's claim are skipped, not waited on.
+    """
+    with transaction.atomic():
+        job = (
+            DataExport.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('requested_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'processing'
+        job.started_at = timezone.now()
+        job.worker = worker
+        job.progress = 0
+        job.rows_written = 0
+        job.error_message = None
+        job.save(update_fields=[
+            'status', 'started_at', 'worker', 'progress', 'rows_written', 'error_message', 'updated_at'
+        ])
+        return job
+
+
+def requeue_stale():
+    """Put processing jobs whose worker stopped reporting back in the queue."""
+    return DataExport.objects.filter(
+        status='processing', updated_at__lt=timezone.now() - STALE_AFTER
+    ).update(status='pending', worker=None, updated_at=timezone.now())
+
+
+def export_path(job, export):
+    filename = f'{job.id}_{export.filename(job.export_format)}'
+    return os.path.join(EXPORT_DIR, filename)
+
+
+def _report(job_id, **fields):
+    DataExport.objects.filter(pk=job_id).update(updated_at=timezone.now(), **fields)
+
+
+def _counted(rows, job_id, total):
+    """Pass ``rows`` through, writing progress every PROGRESS_INTERVAL seconds."""
+    written = 0
+    last_report = time.monotonic()
+    for row in rows:
+        yield row
+        written += 1
+        if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+            _report(
+                job_id, rows_written=written,
+                progress=min(99, written * 100 // total) if total else 0
+            )
+            last_report = time.monotonic()
+    _report(job_id, rows_written=written)
+
+
+def _write_spatial(job, export, filters, path):
+    counts = export.counts(filters)
+    total = sum(counts.values())
+    _report(job.id, total_rows=total)
+
+    written = 0
+
+    def on_layer(layer):
+        nonlocal written
+        written += counts[layer.name]
+        _report(job.id, rows_written=written, progress=min(99, written * 100 // total) if total else 0)
+
+    export.write(path, job.export_format, filters, on_layer=on_layer)
+
+
+def write_export(job):
+    """Write the export file for ``job`` and return its path relative to MEDIA_ROOT."""
+    export = validate_request(job.model_name, job.export_format)
+    filters = json.loads(job.filters) if job.filters else {}
+
+    relative_path = export_path(job, export)
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+
+    if job.export_format in spatial_exports.FORMATS:
+        _write_spatial(job, export, filters, tmp_path)
+        os.replace(tmp_path, path)
+        return relative_path
+
+    total = export.queryset(filters).count()
+    _report(job.id, total_rows=total)
+
+    write, _ = exports.WRITERS[job.export_format]
+    rows = _counted(export.iter_rows(job.export_format, filters), job.id, total)
+    with open(tmp_path, 'wb') as fh:
+        for chunk in write(export, filters, rows=rows):
+            fh.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    os.replace(tmp_path, path)
+    return relative_path
+
+
+def fail(job_id, error):
+    _report(job_id, status='failed', error_message=str(error), completed_at=timezone.now())
+
+
+def process_export(job_id):
+    """Run one claimed export. Called in a worker process."""
+    close_old_connections()
+    try:
+        job = DataExport.objects.get(pk=job_id)
+        try:
+            relative_path = write_export(job)
+        except Exception as e:
+            fail(job_id, e)
+            return job_id, 'failed'
+
+        _report(
+            job_id, status='completed', file=relative_path, progress=100,
+            completed_at=timezone.now()
+        )
+        return job_id, 'completed'
+    finally:
+        close_old_connections()
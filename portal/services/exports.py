@@ -0,0 +1,730 @@
+"""
+Streaming data exports.
+
+Every export is a queryset builder plus the columns of each format, read
+through a ``Reader`` so rows come straight from ``values_list()`` with the
+related names joined in, never as model instances. CSV and JSON bodies are
+generated while the rows are fetched with ``.iterator()``, so memory use
+stays flat whatever the row count and the first bytes go out right away.
+
+XLSX and Parquet read typed columns (``table_fields``): native dates,
+numbers and booleans instead of formatted strings, so spreadsheets and
+dataframes load them without re-parsing. The workbook is written by
+openpyxl in write-only mode and Parquet one row group at a time through
+pyarrow (optional, the format is only offered when it is installed). Both
+are built in a temporary file, then streamed out.
+"""
+import csv
+import tempfile
+from datetime import datetime
+
+from django.db.models import F, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Font
+
+from portal.models import Farm, Farmer, Loan, LoanRepayment, MonitoringVisit, Project
+from portal.services.rows import PointOrdinate, Reader, dumps, participating_farmers_count
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# Rows fetched per round trip and written per chunk of output
+CHUNK_SIZE = 2000
+# Rows per Parquet row group
+ROW_GROUP_SIZE = 50000
+# Rows per worksheet, the last row Excel can show (the header takes one)
+XLSX_MAX_ROWS = 1048576
+# Bytes read per chunk when streaming a finished file
+FILE_BLOCK_SIZE = 64 * 1024
+
+# Column types of table_fields
+TEXT = 'text'
+INTEGER = 'integer'
+FLOAT = 'float'
+BOOLEAN = 'boolean'
+DATE = 'date'
+DATETIME = 'datetime'
+
+
+# Value converters, matching what the export views used to write
+
+def _date(value, missing=None):
+    return value.strftime('%Y-%m-%d') if value else missing
+
+
+def _date_or_na(value):
+    return _date(value, 'N/A')
+
+
+def _datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _or(missing):
+    return lambda value: value or missing
+
+
+def _display(model, field):
+    choices = dict(model._meta.get_field(field).flatchoices)
+    return lambda value: choices.get(value, value)
+
+
+def _name(first_name, last_name):
+    return f"{first_name} {last_name}"
+
+
+def _related_name(missing):
+    """Full name of an optional related person, ``missing`` when unset."""
+    return lambda pk, first_name, last_name: _name(first_name, last_name) if pk else missing
+
+
+def _related_value(missing):
+    return lambda pk, value: value if pk else missing
+
+
+def _days_remaining(end_date):
+    return max(0, (end_date - timezone.now().date()).days)
+
+
+def _progress_percent(start_date, end_date):
+    today = timezone.now().date()
+    total_days = (end_date - start_date).days
+    elapsed_days = (today - start_date).days
+    return min(100, max(0, int((elapsed_days / total_days) * 100))) if total_days > 0 else 0
+
+
+class Export:
+    """
+    One exportable dataset. ``build_queryset(filters)`` returns the rows to
+    export, ``csv_fields``/``json_fields`` are Reader field lists whose keys
+    are the CSV headers and JSON keys. JSON is wrapped as ``{json_key: [...]}``.
+
+    ``table_fields`` are Reader fields with the column type appended, e.g.
+    ``('amount', 'amount', FLOAT)``, and enable the xlsx and parquet formats.
+    """
+
+    def __init__(self, name, build_queryset, csv_fields, json_fields=None, json_key=None,
+                 table_fields=None, annotations=None, timestamped=True):
+        self.name = name
+        self.build_queryset = build_queryset
+        self.annotations = annotations or {}
+        self.readers = {'csv': Reader(csv_fields, self.annotations)}
+        if json_fields:
+            self.readers['json'] = Reader(json_fields, self.annotations)
+        self.column_types = []
+        if table_fields:
+            table = Reader([field[:-1] for field in table_fields], self.annotations)
+            self.readers['xlsx'] = self.readers['parquet'] = table
+            self.column_types = [field[-1] for field in table_fields]
+        self.json_key = json_key or name
+        self.timestamped = timestamped
+
+    @property
+    def formats(self):
+        return tuple(self.readers)
+
+    def queryset(self, filters=None):
+        return self.build_queryset(filters or {})
+
+    def filename(self, format_type):
+        if self.timestamped:
+            return f'{self.name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{format_type}'
+        return f'{self.name}.{format_type}'
+
+    def iter_rows(self, format_type, filters=None):
+        reader = self.readers[format_type]
+        return reader.rows(self.queryset(filters)).iterator(chunk_size=CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(export, filters=None, rows=None):
+    """Yield the CSV body in chunks of CHUNK_SIZE rows."""
+    reader = export.readers['csv']
+    rows = export.iter_rows('csv', filters) if rows is None else rows
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(reader.keys)]
+    for row in rows:
+        chunk.append(writer.writerow(reader.values(row)))
+        if len(chunk) >= CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def iter_json(export, filters=None, rows=None):
+    """Yield ``{"<json_key>": [...]}`` in chunks of CHUNK_SIZE rows."""
+    reader = export.readers['json']
+    rows = export.iter_rows('json', filters) if rows is None else rows
+    chunk = [dumps({export.json_key: []})[:-2]]
+    first = True
+    for row in rows:
+        item = dumps(reader.payload(row))
+        chunk.append(item if first else b',' + item)
+        first = False
+        if len(chunk) >= CHUNK_SIZE:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b']}')
+    yield b''.join(chunk)
+
+
+def _float_or_none(value):
+    return None if value is None else float(value)
+
+
+def _naive(value):
+    """Excel has no time zones, write datetimes in local time"""
+    return None if value is None else timezone.localtime(value).replace(tzinfo=None)
+
+
+def _cell_text(value):
+    return None if value is None else ILLEGAL_CHARACTERS_RE.sub('', str(value))
+
+
+XLSX_CASTS = {TEXT: _cell_text, FLOAT: _float_or_none, DATETIME: _naive}
+PARQUET_CASTS = {FLOAT: _float_or_none}
+
+
+def _casts(export, casts):
+    """``(index, cast)`` for the columns of ``export`` that need one."""
+    return [
+        (index, casts[column_type])
+        for index, column_type in enumerate(export.column_types) if column_type in casts
+    ]
+
+
+def _iter_file(fh):
+    fh.seek(0)
+    return iter(lambda: fh.read(FILE_BLOCK_SIZE), b'')
+
+
+def _worksheet(workbook, export, keys, number):
+    title = export.name[:28] if number == 1 else f'{export.name[:28]}_{number}'
+    sheet = workbook.create_sheet(title)
+    sheet.freeze_panes = 'A2'
+    header = []
+    for key in keys:
+        cell = WriteOnlyCell(sheet, value=key)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+    return sheet
+
+
+def iter_xlsx(export, filters=None, rows=None):
+    """
+    Yield an xlsx workbook. Rows go through a write-only workbook, which
+    keeps only the current row in memory, and continue on a new sheet when
+    one is full.
+    """
+    reader = export.readers['xlsx']
+    rows = export.iter_rows('xlsx', filters) if rows is None else rows
+    casts = _casts(export, XLSX_CASTS)
+    values = reader.values
+
+    workbook = Workbook(write_only=True)
+    sheets = 1
+    sheet = _worksheet(workbook, export, reader.keys, sheets)
+    sheet_rows = 1
+    for row in rows:
+        if sheet_rows >= XLSX_MAX_ROWS:
+            sheets += 1
+            sheet = _worksheet(workbook, export, reader.keys, sheets)
+            sheet_rows = 1
+        row = values(row)
+        for index, cast in casts:
+            row[index] = cast(row[index])
+        sheet.append(row)
+        sheet_rows += 1
+
+    with tempfile.TemporaryFile() as fh:
+        workbook.save(fh)
+        yield from _iter_file(fh)
+
+
+def _parquet_schema(export):
+    types = {
+        TEXT: pyarrow.string(),
+        INTEGER: pyarrow.int64(),
+        FLOAT: pyarrow.float64(),
+        BOOLEAN: pyarrow.bool_(),
+        DATE: pyarrow.date32(),
+        DATETIME: pyarrow.timestamp('us', tz='UTC'),
+    }
+    return pyarrow.schema([
+        (key, types[column_type])
+        for key, column_type in zip(export.readers['parquet'].keys, export.column_types)
+    ])
+
+
+def _record_batch(schema, chunk, casts):
+    """Turn a list of rows into one typed array per column."""
+    columns = [list(column) for column in zip(*chunk)]
+    for index, cast in casts:
+        columns[index] = [cast(value) for value in columns[index]]
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+def iter_parquet(export, filters=None, rows=None):
+    """Yield a Parquet file written one row group of ROW_GROUP_SIZE rows at a time."""
+    reader = export.readers['parquet']
+    rows = export.iter_rows('parquet', filters) if rows is None else rows
+    casts = _casts(export, PARQUET_CASTS)
+    schema = _parquet_schema(export)
+    values = reader.values
+
+    with tempfile.TemporaryFile() as fh:
+        writer = pyarrow.parquet.ParquetWriter(fh, schema, compression='snappy')
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(values(row))
+                if len(chunk) >= ROW_GROUP_SIZE:
+                    writer.write_batch(_record_batch(schema, chunk, casts))
+                    chunk = []
+            if chunk:
+                writer.write_batch(_record_batch(schema, chunk, casts))
+        finally:
+            writer.close()
+        yield from _iter_file(fh)
+
+
+WRITERS = {
+    'csv': (iter_csv, 'text/csv'),
+    'json': (iter_json, 'application/json'),
+    'xlsx': (iter_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+if pyarrow is not None:
+    WRITERS['parquet'] = (iter_parquet, 'application/vnd.apache.parquet')
+
+
+def streaming_response(name, format_type, filters=None):
+    """
+    StreamingHttpResponse for export ``name`` in ``format_type``, or None if
+    the export doesn't offer that format.
+    """
+    export = EXPORTS[name]
+    if format_type not in export.formats or format_type not in WRITERS:
+        return None
+
+    write, content_type = WRITERS[format_type]
+    response = StreamingHttpResponse(write(export, filters), content_type=content_type)
+    if format_type != 'json':
+        response['Content-Disposition'] = f'attachment; filename="{export.filename(format_type)}"'
+    return response
+
+
+# Export definitions
+
+def _loans(filters):
+    loans = Loan.objects.order_by('id')
+    if filters.get('status'):
+        loans = loans.filter(status=filters['status'])
+    return loans
+
+
+LOAN_NAME = ('farmer__user_profile__user__first_name', 'farmer__user_profile__user__last_name')
+LOAN_PROJECT = ('project_id', 'project__name')
+LOAN_STATUS = _display(Loan, 'status')
+
+loans_export = Export(
+    'loans', _loans,
+    csv_fields=[
+        ('Loan ID', 'loan_id'),
+        ('Farmer Name', LOAN_NAME, _name),
+        ('National ID', 'farmer__national_id'),
+        ('Project', LOAN_PROJECT, _related_value('N/A')),
+        ('Amount', 'amount', _float),
+        ('Purpose', 'purpose'),
+        ('Application Date', 'application_date', _date),
+        ('Approval Date', 'approval_date', _date_or_na),
+        ('Interest Rate', 'interest_rate'),
+        ('Term (Months)', 'term_months'),
+        ('Status', 'status', LOAN_STATUS),
+        ('Disbursed Amount', 'total_disbursed', _float),
+        ('Repaid Amount', 'total_repaid', _float),
+        ('Outstanding Amount', 'undisbursed', _float),
+        ('Collateral Details', 'collateral_details', _or('No collateral')),
+    ],
+    json_fields=[
+        ('loan_id', 'loan_id'),
+        ('farmer_name', LOAN_NAME, _name),
+        ('national_id', 'farmer__national_id'),
+        ('project', LOAN_PROJECT, _related_value('N/A')),
+        ('amount', 'amount', _float),
+        ('purpose', 'purpose'),
+        ('application_date', 'application_date', _date),
+        ('approval_date', 'approval_date', _date_or_na),
+        ('interest_rate', 'interest_rate'),
+        ('term_months', 'term_months'),
+        ('status', 'status'),
+        ('status_display', 'status', LOAN_STATUS),
+        ('disbursed_amount', 'total_disbursed', _float),
+        ('repaid_amount', 'total_repaid', _float),
+        ('outstanding_amount', 'undisbursed', _float),
+        ('collateral_details', 'collateral_details', _or('No collateral')),
+    ],
+    table_fields=[
+        ('loan_id', 'loan_id', TEXT),
+        ('farmer_name', LOAN_NAME, _name, TEXT),
+        ('national_id', 'farmer__national_id', TEXT),
+        ('project', 'project__name', TEXT),
+        ('amount', 'amount', FLOAT),
+        ('purpose', 'purpose', TEXT),
+        ('application_date', 'application_date', DATE),
+        ('approval_date', 'approval_date', DATE),
+        ('disbursement_date', 'disbursement_date', DATE),
+        ('interest_rate', 'interest_rate', FLOAT),
+        ('term_months', 'term_months', INTEGER),
+        ('status', 'status', TEXT),
+        ('status_display', 'status', LOAN_STATUS, TEXT),
+        ('disbursed_amount', 'total_disbursed', FLOAT),
+        ('repaid_amount', 'total_repaid', FLOAT),
+        ('undisbursed_amount', 'undisbursed', FLOAT),
+        ('outstanding_balance', 'outstanding', FLOAT),
+        ('last_payment_date', 'last_payment_date', DATE),
+        ('collateral_details', 'collateral_details', TEXT),
+        ('created_at', 'created_at', DATETIME),
+    ],
+    # The loan export has always reported amount minus disbursed as outstanding
+    annotations={'undisbursed': F('amount') - F('total_disbursed')},
+)
+
+
+def _repayments(filters):
+    repayments = LoanRepayment.objects.order_by('id')
+    if filters.get('date_from'):
+        repayments = repayments.filter(repayment_date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        repayments = repayments.filter(repayment_date__lte=filters['date_to'])
+    return repayments
+
+
+REPAYMENT_FARMER = ('loan__farmer__user_profile__user__first_name', 'loan__farmer__user_profile__user__last_name')
+REPAYMENT_PROJECT = ('loan__project_id', 'loan__project__name')
+REPAYMENT_RECEIVER = (
+    'received_by_id',
+    'received_by__user_profile__user__first_name', 'received_by__user_profile__user__last_name'
+)
+
+repayments_export = Export(
+    'repayments', _repayments,
+    csv_fields=[
+        ('Repayment Date', 'repayment_date', _date),
+        ('Loan ID', 'loan__loan_id'),
+        ('Farmer Name', REPAYMENT_FARMER, _name),
+        ('National ID', 'loan__farmer__national_id'),
+        ('Project', REPAYMENT_PROJECT, _related_value('N/A')),
+        ('Amount', 'amount', _float),
+        ('Transaction Reference', 'transaction_reference', _or('N/A')),
+        ('Received By', REPAYMENT_RECEIVER, _related_name('N/A')),
+        ('Notes', 'notes', _or('No notes')),
+        ('Created At', 'created_at', _datetime),
+    ],
+    json_fields=[
+        ('repayment_date', 'repayment_date', _date),
+        ('loan_id', 'loan__loan_id'),
+        ('farmer_name', REPAYMENT_FARMER, _name),
+        ('national_id', 'loan__farmer__national_id'),
+        ('project', REPAYMENT_PROJECT, _related_value('N/A')),
+        ('amount', 'amount', _float),
+        ('transaction_reference', 'transaction_reference', _or('N/A')),
+        ('received_by', REPAYMENT_RECEIVER, _related_name('N/A')),
+        ('notes', 'notes', _or('No notes')),
+        ('created_at', 'created_at', _datetime),
+    ],
+    table_fields=[
+        ('repayment_date', 'repayment_date', DATE),
+        ('loan_id', 'loan__loan_id', TEXT),
+        ('farmer_name', REPAYMENT_FARMER, _name, TEXT),
+        ('national_id', 'loan__farmer__national_id', TEXT),
+        ('project', 'loan__project__name', TEXT),
+        ('amount', 'amount', FLOAT),
+        ('transaction_reference', 'transaction_reference', TEXT),
+        ('received_by', REPAYMENT_RECEIVER, _related_name(None), TEXT),
+        ('notes', 'notes', TEXT),
+        ('created_at', 'created_at', DATETIME),
+    ],
+)
+
+
+def _farmers(filters):
+    return Farmer.objects.order_by('id')
+
+
+FARMER_STATUS = lambda is_active: 'Active' if is_active else 'Inactive'  # noqa: E731
+
+farmers_export = Export(
+    'farmers', _farmers,
+    csv_fields=[
+        ('First Name', 'user_profile__user__first_name'),
+        ('Last Name', 'user_profile__user__last_name'),
+        ('National ID', 'national_id'),
+        ('Email', 'user_profile__user__email'),
+        ('Phone', 'user_profile__phone_number', _or('')),
+        ('District', 'user_profile__district__district', _or('')),
+        ('Region', 'user_profile__district__region_foreignkey__region', _or('')),
+        ('Experience (years)', 'years_of_experience'),
+        ('Primary Crop', 'primary_crop'),
+        ('Registration Date', 'user_profile__user__date_joined', _date),
+        ('Status', 'user_profile__user__is_active', FARMER_STATUS),
+    ],
+    json_fields=[
+        ('first_name', 'user_profile__user__first_name'),
+        ('last_name', 'user_profile__user__last_name'),
+        ('national_id', 'national_id'),
+        ('email', 'user_profile__user__email'),
+        ('phone', 'user_profile__phone_number'),
+        ('district', 'user_profile__district__district', _or('')),
+        ('region', 'user_profile__district__region_foreignkey__region', _or('')),
+        ('experience_years', 'years_of_experience'),
+        ('primary_crop', 'primary_crop'),
+        ('registration_date', 'user_profile__user__date_joined', _date),
+        ('status', 'user_profile__user__is_active', FARMER_STATUS),
+    ],
+    table_fields=[
+        ('first_name', 'user_profile__user__first_name', TEXT),
+        ('last_name', 'user_profile__user__last_name', TEXT),
+        ('national_id', 'national_id', TEXT),
+        ('email', 'user_profile__user__email', TEXT),
+        ('phone', 'user_profile__phone_number', TEXT),
+        ('gender', 'user_profile__gender', TEXT),
+        ('district', 'user_profile__district__district', TEXT),
+        ('region', 'user_profile__district__region_foreignkey__region', TEXT),
+        ('community', 'community', TEXT),
+        ('experience_years', 'years_of_experience', INTEGER),
+        ('primary_crop', 'primary_crop', TEXT),
+        ('crop_type', 'crop_type', TEXT),
+        ('variety', 'variety', TEXT),
+        ('labour_hired', 'labour_hired', INTEGER),
+        ('estimated_yield', 'estimated_yield', TEXT),
+        ('estimated_yield_tons', 'estimated_yield_tons', FLOAT),
+        ('yield_in_pre_season', 'yield_in_pre_season', TEXT),
+        ('yield_in_pre_season_tons', 'yield_in_pre_season_tons', FLOAT),
+        ('planting_date', 'planting_date', DATE),
+        ('harvest_date', 'harvest_date', DATE),
+        ('registration_date', 'user_profile__user__date_joined', DATETIME),
+        ('is_active', 'user_profile__user__is_active', BOOLEAN),
+    ],
+)
+
+
+def _farms(filters):
+    return Farm.objects.order_by('id')
+
+
+FARM_FARMER = ('farmer__user_profile__user__first_name', 'farmer__user_profile__user__last_name')
+FARM_STATUS = _display(Farm, 'status')
+
+farms_export = Export(
+    'farms', _farms,
+    csv_fields=[
+        ('Farm Code', 'farm_code'),
+        ('Name', 'name'),
+        ('Farmer', FARM_FARMER, _name),
+        ('National ID', 'farmer__national_id'),
+        ('Area (ha)', 'area_hectares'),
+        ('Status', 'status', FARM_STATUS),
+        ('Soil Type', 'soil_type', _or('')),
+        ('Irrigation Type', 'irrigation_type', _or('')),
+        ('Irrigation Coverage (%)', 'irrigation_coverage'),
+        ('Registration Date', 'registration_date', _date),
+        ('District', 'farmer__user_profile__district__district', _or('')),
+        ('Region', 'farmer__user_profile__district__region', _or('')),
+        ('Latitude', 'location_latitude', lambda value: '' if value is None else value),
+        ('Longitude', 'location_longitude', lambda value: '' if value is None else value),
+    ],
+    json_fields=[
+        ('farm_code', 'farm_code'),
+        ('name', 'name'),
+        ('farmer', FARM_FARMER, _name),
+        ('national_id', 'farmer__national_id'),
+        ('area_hectares', 'area_hectares'),
+        ('status', 'status'),
+        ('status_display', 'status', FARM_STATUS),
+        ('soil_type', 'soil_type'),
+        ('irrigation_type', 'irrigation_type'),
+        ('irrigation_coverage', 'irrigation_coverage'),
+        ('registration_date', 'registration_date', _date),
+        ('district', 'farmer__user_profile__district__district', _or('')),
+        ('region', 'farmer__user_profile__district__region', _or('')),
+        ('latitude', 'location_latitude'),
+        ('longitude', 'location_longitude'),
+    ],
+    table_fields=[
+        ('farm_code', 'farm_code', TEXT),
+        ('name', 'name', TEXT),
+        ('farmer', FARM_FARMER, _name, TEXT),
+        ('national_id', 'farmer__national_id', TEXT),
+        ('project', 'project__name', TEXT),
+        ('area_hectares', 'area_hectares', FLOAT),
+        ('status', 'status', TEXT),
+        ('status_display', 'status', FARM_STATUS, TEXT),
+        ('soil_type', 'soil_type', TEXT),
+        ('irrigation_type', 'irrigation_type', TEXT),
+        ('irrigation_coverage', 'irrigation_coverage', FLOAT),
+        ('land_use_classification', 'land_use_classification', TEXT),
+        ('has_farm_boundary_polygon', 'has_farm_boundary_polygon', BOOLEAN),
+        ('validation_status', 'validation_status', BOOLEAN),
+        ('registration_date', 'registration_date', DATE),
+        ('last_visit_date', 'last_visit_date', DATE),
+        ('district', 'farmer__user_profile__district__district', TEXT),
+        ('region', 'farmer__user_profile__district__region', TEXT),
+        ('latitude', 'location_latitude', FLOAT),
+        ('longitude', 'location_longitude', FLOAT),
+        ('altitude', 'altitude', FLOAT),
+        ('slope', 'slope', FLOAT),
+    ],
+    annotations={
+        'location_latitude': PointOrdinate('location', function='ST_Y'),
+        'location_longitude': PointOrdinate('location', function='ST_X'),
+    },
+)
+
+
+def _projects(filters):
+    return Project.objects.order_by('id')
+
+
+PROJECT_MANAGER = (
+    'manager_id', 'manager__user_profile__user__first_name', 'manager__user_profile__user__last_name'
+)
+PROJECT_STATUS = _display(Project, 'status')
+
+projects_export = Export(
+    'projects', _projects,
+    csv_fields=[
+        ('Code', 'code'),
+        ('Name', 'name'),
+        ('Description', 'description', _or('')),
+        ('Start Date', 'start_date', _date),
+        ('End Date', 'end_date', _date),
+        ('Status', 'status', PROJECT_STATUS),
+        ('Total Budget', 'total_budget', _float),
+        ('Manager', PROJECT_MANAGER, _related_name('')),
+        ('Farmers Count', 'farmers_count', _or(0)),
+        ('Days Remaining', 'end_date', _days_remaining),
+        ('Progress (%)', ('start_date', 'end_date'), _progress_percent),
+    ],
+    json_fields=[
+        ('code', 'code'),
+        ('name', 'name'),
+        ('description', 'description'),
+        ('start_date', 'start_date', _date),
+        ('end_date', 'end_date', _date),
+        ('status', 'status'),
+        ('status_display', 'status', PROJECT_STATUS),
+        ('total_budget', 'total_budget', _float),
+        ('manager', PROJECT_MANAGER, _related_name('')),
+        ('farmers_count', 'farmers_count', _or(0)),
+        ('days_remaining', 'end_date', _days_remaining),
+        ('progress_percent', ('start_date', 'end_date'), _progress_percent),
+    ],
+    table_fields=[
+        ('code', 'code', TEXT),
+        ('name', 'name', TEXT),
+        ('description', 'description', TEXT),
+        ('start_date', 'start_date', DATE),
+        ('end_date', 'end_date', DATE),
+        ('status', 'status', TEXT),
+        ('status_display', 'status', PROJECT_STATUS, TEXT),
+        ('total_budget', 'total_budget', FLOAT),
+        ('manager', PROJECT_MANAGER, _related_name(None), TEXT),
+        ('farmers_count', 'farmers_count', _or(0), INTEGER),
+    ],
+    annotations={'farmers_count': participating_farmers_count()},
+)
+
+
+def _monitoring_visits(filters):
+    visits = MonitoringVisit.objects.all()
+    if filters.get('status'):
+        visits = visits.filter(follow_up_status=filters['status'])
+    if filters.get('search'):
+        search_query = filters['search']
+        visits = visits.filter(
+            Q(visit_id__icontains=search_query) |
+            Q(farm__name__icontains=search_query) |
+            Q(officer__user__first_name__icontains=search_query)
+        )
+    return visits
+
+
+monitoring_visits_export = Export(
+    'monitoring_visits', _monitoring_visits,
+    csv_fields=[
+        ('Visit ID', 'visit_id'),
+        ('Date of Visit', 'date_of_visit', _date),
+        ('Officer', ('officer__user__first_name', 'officer__user__last_name'), _name),
+        ('Farm', 'farm__name'),
+        ('Farmer', ('farm__farmer__user_profile__user__first_name', 'farm__farmer__user_profile__user__last_name'), _name),
+        ('Farm Boundary Polygon', 'farm_boundary_polygon', lambda value: 'Yes' if value else 'No'),
+        ('Land Use Classification', 'land_use_classification'),
+        ('Distance to Road (km)', 'distance_to_road', _float),
+        ('Distance to Market (km)', 'distance_to_market', _float),
+        ('Proximity to Processing Facility (km)', 'proximity_to_processing_facility', _float),
+        ('Main Buyers', 'main_buyers'),
+        ('Service Provider', 'service_provider'),
+        ('Cooperatives Affiliated', 'cooperatives_affiliated'),
+        ('Value Chain Linkages', 'value_chain_linkages'),
+        ('Observations', 'observations'),
+        ('Issues Identified', 'issues_identified'),
+        ('Infrastructure Identified', 'infrastructure_identified'),
+        ('Recommended Actions', 'recommended_actions'),
+        ('Follow-Up Status', 'follow_up_status', _display(MonitoringVisit, 'follow_up_status')),
+        ('Created Date', 'created_at', _datetime),
+    ],
+    table_fields=[
+        ('visit_id', 'visit_id', TEXT),
+        ('date_of_visit', 'date_of_visit', DATE),
+        ('officer', ('officer__user__first_name', 'officer__user__last_name'), _name, TEXT),
+        ('farm_code', 'farm__farm_code', TEXT),
+        ('farm', 'farm__name', TEXT),
+        ('farmer', ('farm__farmer__user_profile__user__first_name', 'farm__farmer__user_profile__user__last_name'), _name, TEXT),
+        ('farm_boundary_polygon', 'farm_boundary_polygon', BOOLEAN),
+        ('land_use_classification', 'land_use_classification', TEXT),
+        ('distance_to_road_km', 'distance_to_road', FLOAT),
+        ('distance_to_market_km', 'distance_to_market', FLOAT),
+        ('proximity_to_processing_facility_km', 'proximity_to_processing_facility', FLOAT),
+        ('main_buyers', 'main_buyers', TEXT),
+        ('service_provider', 'service_provider', TEXT),
+        ('cooperatives_affiliated', 'cooperatives_affiliated', TEXT),
+        ('value_chain_linkages', 'value_chain_linkages', TEXT),
+        ('observations', 'observations', TEXT),
+        ('issues_identified', 'issues_identified', TEXT),
+        ('infrastructure_identified', 'infrastructure_identified', TEXT),
+        ('recommended_actions', 'recommended_actions', TEXT),
+        ('follow_up_status', 'follow_up_status', TEXT),
+        ('created_at', 'created_at', DATETIME),
+    ],
+    timestamped=False,
+)
+
+
+EXPORTS = {
+    export.name: export for export in (
+        loans_export, repayments_export, farmers_export, farms_export,
+        projects_export, monitoring_visits_export,
+    )
+}
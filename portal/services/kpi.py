@@ -0,0 +1,369 @@
+"""
+KPI snapshots for the monitoring dashboard.
+
+KpiSnapshot holds additive daily totals per district, project and crop,
+built with one grouped query per source table. The dashboard only sums
+snapshot rows, so it costs the same whatever the size of the source tables.
+
+Snapshots are kept current a day at a time: saving or deleting a source
+row rebuilds the days it was and is counted on, after the transaction
+commits (see portal.signals). Code that writes source rows without
+signals (``bulk_create``, queryset ``update``) calls ``refresh_days``
+itself. ``manage.py rebuild_kpi_snapshots`` rebuilds everything month by
+month and should run periodically to catch anything the signals missed,
+and once after the table is first created.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from portal.models import (
+    District, Farm, Farmer, KpiSnapshot, Loan, LoanDisbursement, LoanRepayment,
+    ProjectParticipation, Region
+)
+from portal.services import dashboard_cache
+
+# Serializes snapshot rebuilds so two of them can't insert the same day twice
+LOCK_ID = 7301
+
+
+class Source:
+    """
+    One source table: rows are counted on ``date_field`` under the
+    ``district``/``project``/``crop`` lookups with ``measures`` as aggregates.
+    """
+
+    def __init__(self, name, model, date_field, measures, district, project=None, crop=None, condition=None):
+        self.name = name
+        self.model = model
+        self.date_field = date_field
+        self.measures = measures
+        self.district = district
+        self.project = project
+        self.crop = crop
+        self.condition = condition
+
+    @property
+    def is_datetime(self):
+        return self.model._meta.get_field(self.date_field).get_internal_type() == 'DateTimeField'
+
+    def span_filter(self, spans):
+        """Rows dated inside any of the ``(start, end)`` date spans, end excluded."""
+        query = Q()
+        for start, end in spans:
+            if self.is_datetime:
+                start, end = _day_start(start), _day_start(end)
+            query |= Q(**{f'{self.date_field}__gte': start, f'{self.date_field}__lt': end})
+        return query
+
+    def grouped(self, spans):
+        queryset = self.model.objects.filter(self.span_filter(spans))
+        if self.condition:
+            queryset = queryset.filter(self.condition)
+
+        dimensions = {
+            'kpi_day': TruncDate(self.date_field) if self.is_datetime else F(self.date_field),
+            'kpi_district': F(self.district),
+        }
+        if self.project:
+            dimensions['kpi_project'] = F(self.project)
+        if self.crop:
+            dimensions['kpi_crop'] = F(self.crop)
+        return queryset.order_by().values(**dimensions).annotate(**self.measures)
+
+
+SOURCES = [
+    Source('farmers', Farmer, 'created_at', {
+        'farmers_registered': Count('id'),
+        'yield_total': Sum('estimated_yield_tons'),
+        'yield_count': Count('estimated_yield_tons'),
+    }, district='district_id', crop='primary_crop'),
+    Source('farms', Farm, 'registration_date', {
+        'farms_registered': Count('id'),
+        'measured_farms': Count('area_hectares'),
+        'hectares': Sum('area_hectares'),
+    }, district='farmer__district_id', project='project_id'),
+    Source('participations', ProjectParticipation, 'enrollment_date', {
+        'participants': Count('id'),
+    }, district='farmer__district_id', project='project_id', condition=Q(farmer__is_deleted=False)),
+    Source('disbursements', LoanDisbursement, 'disbursement_date', {
+        'disbursements': Count('id'),
+        'disbursed_amount': Sum('amount'),
+    }, district='loan__farmer__district_id', project='loan__project_id'),
+    Source('repayments', LoanRepayment, 'repayment_date', {
+        'repayments': Count('id'),
+        'repaid_amount': Sum('amount'),
+    }, district='loan__farmer__district_id', project='loan__project_id'),
+    Source('defaults', Loan, 'application_date', {
+        'defaulted_loans': Count('id'),
+        'defaulted_amount': Sum('amount'),
+    }, district='farmer__district_id', project='project_id', condition=Q(status='defaulted')),
+]
+SOURCES_BY_MODEL = {source.model: source for source in SOURCES}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_of(value):
+    """The snapshot day of a date or datetime value."""
+    if isinstance(value, datetime):
+        return timezone.localdate(value)
+    return value
+
+
+def district_regions():
+    """
+    ``{district_id: region_id}``, from District.region_foreignkey or, for
+    districts that only have the legacy region name, the Region of that name.
+    """
+    by_code = dict(Region.all_objects.exclude(reg_code=None).values_list('reg_code', 'id'))
+    by_name = {name.strip().lower(): pk for pk, name in Region.all_objects.values_list('id', 'region')}
+    regions = {}
+    for pk, code, name in District.all_objects.values_list('id', 'region_foreignkey_id', 'region'):
+        regions[pk] = by_code.get(code) or by_name.get((name or '').strip().lower())
+    return regions
+
+
+def _spans(days):
+    """Merge days into ``(start, end)`` spans of consecutive days."""
+    spans = []
+    for day in sorted(set(days)):
+        if spans and spans[-1][1] == day:
+            spans[-1] = (spans[-1][0], day + timedelta(days=1))
+        else:
+            spans.append((day, day + timedelta(days=1)))
+    return spans
+
+
+def _build_rows(spans):
+    regions = district_regions()
+    rows = {}
+    for source in SOURCES:
+        for values in source.grouped(spans):
+            key = (
+                values['kpi_day'], values['kpi_district'],
+                values.get('kpi_project'), values.get('kpi_crop') or ''
+            )
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = KpiSnapshot(
+                    snapshot_date=key[0], district_id=key[1], project_id=key[2], crop=key[3],
+                    region_id=regions.get(key[1]),
+                )
+            for measure in source.measures:
+                if values[measure] is not None:
+                    setattr(row, measure, values[measure])
+    return list(rows.values())
+
+
+def rebuild_spans(spans):
+    """Replace the snapshot rows of the ``(start, end)`` date spans."""
+    if not spans:
+        return 0
+
+    existing = Q()
+    for start, end in spans:
+        existing |= Q(snapshot_date__gte=start, snapshot_date__lt=end)
+
+    with transaction.atomic():
+        # Rows are read after taking the lock, so a rebuild that waited on
+        # another one sees everything that one saw
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK_ID])
+        rows = _build_rows(spans)
+        KpiSnapshot.objects.filter(existing).delete()
+        KpiSnapshot.objects.bulk_create(rows, batch_size=1000)
+        transaction.on_commit(lambda: dashboard_cache.invalidate(KpiSnapshot))
+    return len(rows)
+
+
+def refresh_days(days):
+    """Rebuild the snapshot rows of ``days`` (dates or datetimes)."""
+    return rebuild_spans(_spans(day_of(day) for day in days if day))
+
+
+def first_day():
+    """Earliest day any source row is counted on, None when there are none."""
+    days = []
+    for source in SOURCES:
+        first = source.model.objects.aggregate(first=Min(source.date_field))['first']
+        if first:
+            days.append(day_of(first))
+    return min(days) if days else None
+
+
+def month_spans(start, end):
+    """Calendar month spans covering ``start`` up to and including ``end``."""
+    spans = []
+    current = start.replace(day=1)
+    while current <= end:
+        following = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        spans.append((max(current, start), min(following, end + timedelta(days=1))))
+        current = following
+    return spans
+
+
+def update_regions():
+    """Move snapshot rows whose district now belongs to another region."""
+    by_region = defaultdict(list)
+    for district_id, region_id in district_regions().items():
+        by_region[region_id].append(district_id)
+    updated = 0
+    for region_id, district_ids in by_region.items():
+        rows = KpiSnapshot.objects.filter(district_id__in=district_ids)
+        if region_id is None:
+            updated += rows.exclude(region_id=None).update(region_id=None)
+        else:
+            updated += rows.exclude(region_id=region_id).update(region_id=region_id)
+    if updated:
+        transaction.on_commit(lambda: dashboard_cache.invalidate(KpiSnapshot))
+    return updated
+
+
+# Fields whose change moves rows of other sources between snapshot cells
+TRACKED_FIELDS = {
+    Farmer: ('district_id', 'is_deleted'),
+    Loan: ('farmer_id', 'project_id'),
+}
+
+
+def tracked_fields(model):
+    """Stored values to keep before a save, see ``affected_days``."""
+    return (SOURCES_BY_MODEL[model].date_field, *TRACKED_FIELDS.get(model, ()))
+
+
+def _farmer_days(farmer_id):
+    return {
+        *Farm.objects.filter(farmer_id=farmer_id).values_list('registration_date', flat=True),
+        *ProjectParticipation.objects.filter(farmer_id=farmer_id).values_list('enrollment_date', flat=True),
+        *LoanDisbursement.objects.filter(loan__farmer_id=farmer_id).values_list('disbursement_date', flat=True),
+        *LoanRepayment.objects.filter(loan__farmer_id=farmer_id).values_list('repayment_date', flat=True),
+        *Loan.objects.filter(farmer_id=farmer_id).values_list('application_date', flat=True),
+    }
+
+
+def _loan_days(loan_id):
+    return {
+        *LoanDisbursement.objects.filter(loan_id=loan_id).values_list('disbursement_date', flat=True),
+        *LoanRepayment.objects.filter(loan_id=loan_id).values_list('repayment_date', flat=True),
+    }
+
+
+def affected_days(model, instance, previous=None):
+    """
+    Days whose snapshot rows change when ``instance`` is written.
+    ``previous`` is its stored ``tracked_fields`` before the save, if any.
+    """
+    date_field = SOURCES_BY_MODEL[model].date_field
+    days = {getattr(instance, date_field)}
+    if previous:
+        days.add(previous[date_field])
+        moved = any(previous[field] != getattr(instance, field) for field in TRACKED_FIELDS.get(model, ()))
+        if moved and model is Farmer:
+            days |= _farmer_days(instance.pk)
+        elif moved and model is Loan:
+            days |= _loan_days(instance.pk)
+    return {day_of(day) for day in days if day}
+
+
+# Dashboard reads
+
+def totals():
+    result = KpiSnapshot.objects.aggregate(
+        farmers=Sum('farmers_registered'),
+        farms=Sum('farms_registered'),
+        measured_farms=Sum('measured_farms'),
+        hectares=Sum('hectares'),
+        disbursed=Sum('disbursed_amount'),
+        repaid=Sum('repaid_amount'),
+    )
+    return {key: value or 0 for key, value in result.items()}
+
+
+def regional_totals():
+    """Per region farmers, farms, hectares and disbursed amount, every region listed."""
+    rows = {
+        row['region']: row for row in KpiSnapshot.objects.filter(region__isnull=False).values('region').annotate(
+            farmers=Sum('farmers_registered'),
+            farms=Sum('farms_registered'),
+            hectares=Sum('hectares'),
+            loans_disbursed=Sum('disbursed_amount'),
+        ).order_by()
+    }
+    regional_data = []
+    for pk, name in Region.objects.order_by('region').values_list('id', 'region'):
+        row = rows.get(pk, {})
+        regional_data.append({
+            'region': name,
+            'farmers': row.get('farmers') or 0,
+            'farms': row.get('farms') or 0,
+            'hectares': float(row.get('hectares') or 0),
+            'loans_disbursed': float(row.get('loans_disbursed') or 0),
+        })
+    return regional_data
+
+
+def monthly_loans(months=6):
+    """Disbursed, repaid and defaulted amounts for the last ``months`` calendar months."""
+    today = timezone.localdate()
+    start = today.replace(day=1)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+
+    rows = {
+        row['month']: row for row in KpiSnapshot.objects.filter(snapshot_date__gte=start).annotate(
+            month=TruncMonth('snapshot_date')
+        ).values('month').annotate(
+            disbursed=Sum('disbursed_amount'),
+            repaid=Sum('repaid_amount'),
+            defaulted=Sum('defaulted_amount'),
+        ).order_by()
+    }
+    monthly_data = []
+    for month_start, _ in month_spans(start, today):
+        row = rows.get(month_start, {})
+        monthly_data.append({
+            'month': month_start.strftime('%b %Y'),
+            'disbursed': float(row.get('disbursed') or 0),
+            'repaid': float(row.get('repaid') or 0),
+            'defaulted': float(row.get('defaulted') or 0),
+        })
+    return monthly_data
+
+
+def yield_by_crop(default_crop='Mango'):
+    """Average projected yield per crop. Actual yield is shown as 80% of it."""
+    crops = defaultdict(lambda: [0, 0])
+    rows = KpiSnapshot.objects.filter(yield_count__gt=0).values('crop').annotate(
+        total=Sum('yield_total'), count=Sum('yield_count')
+    ).order_by()
+    for row in rows:
+        crop = crops[row['crop'] or default_crop]
+        crop[0] += row['total']
+        crop[1] += row['count']
+
+    yield_data = []
+    for crop, (total, count) in sorted(crops.items()):
+        projected = total / count
+        yield_data.append({
+            'crop': crop,
+            'projected_yield': round(projected, 2),
+            'actual_yield': round(projected * 0.8, 2),
+            'farmers_count': count,
+        })
+    return yield_data
+
+
+def project_participants():
+    """``{project_id: live participants}``"""
+    return dict(
+        KpiSnapshot.objects.filter(project__isnull=False).values('project').annotate(
+            total=Sum('participants')
+        ).order_by().values_list('project', 'total')
+    )
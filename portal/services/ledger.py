@@ -0,0 +1,98 @@
+"""
+Loan ledger balances.
+
+Each Loan carries ``total_disbursed``, ``total_repaid``, ``outstanding``
+(disbursed minus repaid) and ``last_payment_date`` so list and export views
+read them straight off the row instead of aggregating disbursements and
+repayments per loan. They are recomputed from the live disbursement and
+repayment rows whenever one is saved or deleted (see portal.signals), in
+the same transaction as the write. Code that writes those rows without
+signals (``bulk_create``, queryset ``update``/``delete``) must call
+``refresh_loan_balances`` itself. ``manage.py reconcile_loan_ledger``
+checks the stored values against a full recompute.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from portal.models import Loan, LoanDisbursement, LoanRepayment
+from portal.services import dashboard_cache
+
+ZERO = Decimal('0.00')
+
+
+def _loan_total(model):
+    """Sum of the live ``model`` rows of the outer loan, 0 when there are none."""
+    total = model.objects.filter(loan=OuterRef('pk')).order_by().values('loan').annotate(
+        total=Sum('amount')
+    ).values('total')
+    return Coalesce(
+        Subquery(total, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        Value(ZERO),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def _last_payment_date():
+    last = LoanRepayment.objects.filter(loan=OuterRef('pk')).order_by().values('loan').annotate(
+        last=Max('repayment_date')
+    ).values('last')
+    return Subquery(last)
+
+
+def computed_balances():
+    """Expressions for the ledger fields, recomputed from the source rows."""
+    return {
+        'computed_disbursed': _loan_total(LoanDisbursement),
+        'computed_repaid': _loan_total(LoanRepayment),
+        'computed_last_payment_date': _last_payment_date(),
+    }
+
+
+def refresh_loan_balances(loan_ids):
+    """
+    Recompute the ledger fields of ``loan_ids`` in one UPDATE.
+
+    The loans are locked first so two concurrent writes to the same loan
+    can't both recompute from a snapshot that misses the other's row.
+    """
+    loan_ids = sorted({loan_id for loan_id in loan_ids if loan_id})
+    if not loan_ids:
+        return 0
+
+    with transaction.atomic():
+        list(Loan.all_objects.select_for_update().filter(id__in=loan_ids).order_by('id').values_list('id', flat=True))
+        transaction.on_commit(lambda: dashboard_cache.invalidate(Loan))
+        return Loan.all_objects.filter(id__in=loan_ids).update(
+            total_disbursed=_loan_total(LoanDisbursement),
+            total_repaid=_loan_total(LoanRepayment),
+            outstanding=_loan_total(LoanDisbursement) - _loan_total(LoanRepayment),
+            last_payment_date=_last_payment_date(),
+        )
+
+
+def find_mismatches(queryset=None):
+    """
+    Yield ``(loan, changes)`` for loans whose stored balances differ from a
+    recompute, ``changes`` maps field name to ``(stored, computed)``.
+    """
+    queryset = Loan.all_objects.all() if queryset is None else queryset
+    rows = queryset.annotate(**computed_balances()).order_by('id').values(
+        'id', 'loan_id', 'total_disbursed', 'total_repaid', 'outstanding', 'last_payment_date',
+        'computed_disbursed', 'computed_repaid', 'computed_last_payment_date'
+    )
+    for row in rows.iterator(chunk_size=2000):
+        computed = {
+            'total_disbursed': row['computed_disbursed'],
+            'total_repaid': row['computed_repaid'],
+            'outstanding': row['computed_disbursed'] - row['computed_repaid'],
+            'last_payment_date': row['computed_last_payment_date'],
+        }
+        changes = {
+            field: (row[field], value)
+            for field, value in computed.items() if row[field] != value
+        }
+        if changes:
+            yield row, changes
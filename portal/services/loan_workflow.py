@@ -0,0 +1,153 @@
+"""
+Bulk loan workflow actions: approve, reject and disburse many loans at once.
+
+The loans are read and locked with one SELECT ... FOR UPDATE and every
+state transition is checked against that read. Valid loans move with a
+single UPDATE, and a disbursement writes all its LoanDisbursement rows
+with one ``bulk_create``. Every loan asked for gets an outcome, in
+request order. Neither write goes through save() or the model signals, so
+the ledger balances, schedules, KPI snapshots and dashboard cache are
+refreshed here.
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from portal.models import Loan, LoanDisbursement, Staff
+from portal.services import amortization, dashboard_cache, kpi, ledger
+
+# action: (status a loan must be in, status it moves to, date field set to today)
+TRANSITIONS = {
+    'approve': ('applied', 'approved', 'approval_date'),
+    'reject': ('applied', 'rejected', None),
+    'disburse': ('approved', 'disbursed', 'disbursement_date'),
+}
+MAX_LOANS = 1000
+# Filters a bulk action accepts instead of a list of ids: (lookup, parser)
+FILTERS = {
+    'project_id': ('project_id', int),
+    'district_id': ('farmer__district_id', int),
+    'farmer_id': ('farmer_id', int),
+    'applied_from': ('application_date__gte', parse_date),
+    'applied_to': ('application_date__lte', parse_date),
+}
+
+
+class BulkActionError(Exception):
+    pass
+
+
+def _filter_lookups(filters):
+    """ORM lookups for the request ``filters``, BulkActionError when one is invalid."""
+    if not isinstance(filters, dict):
+        raise BulkActionError('filter must be an object')
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise BulkActionError(f'Unknown filters: {", ".join(sorted(unknown))}')
+
+    lookups = {}
+    for key, value in filters.items():
+        lookup, parser = FILTERS[key]
+        try:
+            parsed = parser(str(value)) if value is not None else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise BulkActionError(f'Invalid {key}: {value!r}')
+        lookups[lookup] = parsed
+    return lookups
+
+
+def select_ids(action, loan_ids=None, filters=None):
+    """
+    Loan ids to act on: ``loan_ids`` as given, or every loan matching
+    ``filters`` that is in the action's starting status.
+    """
+    if action not in TRANSITIONS:
+        raise BulkActionError(f'action must be one of {", ".join(TRANSITIONS)}')
+    if loan_ids:
+        if not isinstance(loan_ids, list):
+            raise BulkActionError('loan_ids must be a list of loan ids')
+        try:
+            loan_ids = list(dict.fromkeys(int(loan_id) for loan_id in loan_ids))
+        except (TypeError, ValueError):
+            raise BulkActionError('loan_ids must be a list of loan ids')
+    elif filters:
+        from_status, _, _ = TRANSITIONS[action]
+        queryset = Loan.objects.filter(status=from_status, **_filter_lookups(filters))
+        loan_ids = list(queryset.order_by('id').values_list('id', flat=True)[:MAX_LOANS + 1])
+    else:
+        raise BulkActionError('Provide loan_ids or a filter')
+
+    if len(loan_ids) > MAX_LOANS:
+        raise BulkActionError(f'At most {MAX_LOANS} loans per request')
+    return loan_ids
+
+
+def apply(action, loan_ids, user, stage='Initial Disbursement', references=None, notes=''):
+    """
+    Move ``loan_ids`` through ``action``. Returns one outcome per id:
+    ``{'id', 'loan_id', 'success', 'status'}`` and ``error`` on failure.
+    ``references`` maps a loan id to its disbursement transaction reference.
+    """
+    from_status, to_status, date_field = TRANSITIONS[action]
+    if references is not None and not isinstance(references, dict):
+        raise BulkActionError('transaction_references must map loan ids to references')
+    try:
+        references = {int(key): str(value)[:100] for key, value in (references or {}).items()}
+    except ValueError:
+        raise BulkActionError('transaction_references must map loan ids to references')
+    today = timezone.localdate()
+    now = timezone.now()
+
+    with transaction.atomic():
+        loans = {
+            row['id']: row for row in
+            Loan.objects.select_for_update().filter(id__in=loan_ids).values('id', 'loan_id', 'status', 'amount')
+        }
+        outcomes = []
+        valid = []
+        for loan_id in loan_ids:
+            loan = loans.get(loan_id)
+            if loan is None:
+                outcomes.append({'id': loan_id, 'loan_id': None, 'success': False, 'status': None, 'error': 'Loan not found'})
+            elif loan['status'] != from_status:
+                outcomes.append({
+                    'id': loan_id, 'loan_id': loan['loan_id'], 'success': False, 'status': loan['status'],
+                    'error': f'Only {from_status} loans can be {to_status} (status is {loan["status"]})',
+                })
+            else:
+                valid.append(loan)
+                outcomes.append({'id': loan_id, 'loan_id': loan['loan_id'], 'success': True, 'status': to_status})
+
+        if not valid:
+            return outcomes
+
+        valid_ids = [loan['id'] for loan in valid]
+        changes = {'status': to_status, 'modified_by': user, 'updated_at': now}
+        if date_field:
+            changes[date_field] = today
+        Loan.objects.filter(id__in=valid_ids, status=from_status).update(**changes)
+
+        if action == 'disburse':
+            staff = Staff.objects.filter(user_profile__user=user).first()
+            LoanDisbursement.objects.bulk_create([
+                LoanDisbursement(
+                    loan_id=loan['id'],
+                    amount=loan['amount'],
+                    disbursement_date=today,
+                    stage=stage,
+                    transaction_reference=references.get(loan['id'], ''),
+                    disbursed_by=staff,
+                    notes=notes,
+                    added_by=user,
+                )
+                for loan in valid
+            ], batch_size=500)
+            # The ledger update runs in this transaction, like the signal would
+            ledger.refresh_loan_balances(valid_ids)
+            transaction.on_commit(lambda: amortization.refresh_schedules(valid_ids))
+            transaction.on_commit(lambda: kpi.refresh_days([today]))
+            transaction.on_commit(lambda: dashboard_cache.invalidate(LoanDisbursement))
+        transaction.on_commit(lambda: dashboard_cache.invalidate(Loan))
+    return outcomes
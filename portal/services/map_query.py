@@ -0,0 +1,139 @@
+"""
+Viewport aware queries for the map data endpoints.
+
+The map sends ``bbox`` (west,south,east,north in WGS84), ``zoom`` and an
+optional comma separated ``layers`` list. Querysets are narrowed with the
+spatial index to the box and geometry is simplified in PostGIS to roughly
+one screen pixel at the requested zoom, so the payload follows what is on
+screen rather than the size of the table.
+"""
+import json
+import math
+
+from django.contrib.gis.geos import Polygon
+from django.db.models import Func, TextField
+
+# Degrees covered by one pixel of a 256px tile at zoom 0
+DEGREES_PER_PIXEL_Z0 = 360.0 / 256
+
+
+class SimplifiedGeoJSON(Func):
+    """ST_AsGeoJSON of a (geography or geometry) column simplified to ``tolerance`` degrees."""
+    template = (
+        "ST_AsGeoJSON(ST_SimplifyPreserveTopology(%(expressions)s::geometry, %(tolerance)s), %(precision)s)"
+    )
+    output_field = TextField()
+
+    def __init__(self, expression, tolerance=0.0, precision=6, **extra):
+        super().__init__(
+            expression,
+            tolerance=float(tolerance),
+            precision=int(precision),
+            **extra
+        )
+
+
+def simplify_tolerance(zoom):
+    """Simplification tolerance in degrees for a zoom level, about one pixel."""
+    if zoom is None:
+        return 0.0
+    return DEGREES_PER_PIXEL_Z0 / (2 ** zoom)
+
+
+def coordinate_precision(zoom):
+    """Decimal places worth sending at a zoom level."""
+    if zoom is None:
+        return 6
+    return max(2, min(7, int(math.ceil(-math.log10(simplify_tolerance(zoom)))) + 1))
+
+
+class Viewport:
+    """The part of the map a request is interested in."""
+
+    def __init__(self, bbox=None, zoom=None, layers=None):
+        self.bbox = bbox
+        self.zoom = zoom
+        self.layers = set(layers) if layers else None
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Build a viewport from ``bbox``, ``zoom`` and ``layers`` query params.
+        Raises ValueError on malformed input.
+        """
+        bbox = None
+        raw_bbox = request.GET.get('bbox')
+        if raw_bbox:
+            try:
+                west, south, east, north = [float(v) for v in raw_bbox.split(',')]
+            except ValueError:
+                raise ValueError('bbox must be "west,south,east,north"')
+            if west >= east or south >= north:
+                raise ValueError('bbox is empty')
+            # Clamp to valid coordinates, Leaflet can report past the antimeridian
+            west, east = max(west, -180.0), min(east, 180.0)
+            south, north = max(south, -90.0), min(north, 90.0)
+            bbox = Polygon.from_bbox((west, south, east, north))
+            bbox.srid = 4326
+
+        zoom = None
+        raw_zoom = request.GET.get('zoom')
+        if raw_zoom not in (None, ''):
+            try:
+                zoom = max(0, min(22, int(float(raw_zoom))))
+            except ValueError:
+                raise ValueError('zoom must be a number')
+
+        layers = None
+        raw_layers = request.GET.get('layers')
+        if raw_layers:
+            layers = [layer.strip() for layer in raw_layers.split(',') if layer.strip()]
+
+        return cls(bbox=bbox, zoom=zoom, layers=layers)
+
+    @property
+    def is_bounded(self):
+        return self.bbox is not None
+
+    @property
+    def tolerance(self):
+        return simplify_tolerance(self.zoom)
+
+    @property
+    def precision(self):
+        return coordinate_precision(self.zoom)
+
+    def wants(self, layer):
+        """True if ``layer`` was asked for, or no layers were specified."""
+        return self.layers is None or layer in self.layers
+
+    def filter(self, queryset, field):
+        """Restrict ``queryset`` to rows whose ``field`` intersects the box."""
+        if self.bbox is None:
+            return queryset
+        return queryset.filter(**{f'{field}__intersects': self.bbox})
+
+    def geojson(self, field):
+        """Expression annotating ``field`` as simplified GeoJSON text."""
+        return SimplifiedGeoJSON(field, tolerance=self.tolerance, precision=self.precision)
+
+
+def load_geojson(value):
+    """Parse an annotated GeoJSON string, returning None for empty geometry."""
+    if not value:
+        return None
+    return json.loads(value)
+
+
+def latlng_ring(geometry):
+    """Outer ring of a GeoJSON polygon as [[lat, lng], ...], the format the base layers use."""
+    if not geometry or not geometry.get('coordinates'):
+        return []
+    return [[coord[1], coord[0]] for coord in geometry['coordinates'][0]]
+
+
+def latlng_path(geometry):
+    """GeoJSON line coordinates as [[lat, lng], ...]."""
+    if not geometry or not geometry.get('coordinates'):
+        return []
+    return [[coord[1], coord[0]] for coord in geometry['coordinates']]
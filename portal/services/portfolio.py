@@ -0,0 +1,208 @@
+"""
+Portfolio at risk, aging buckets and roll rates.
+
+``build_snapshot`` runs nightly (``manage.py build_portfolio_snapshots``).
+It takes the arrears of every loan on the day, and 30 days earlier, from
+portal.services.amortization, which works on arrays rather than a loop per
+loan. Each loan goes into a days-past-due bucket. Loans and balances are
+then summed per district and project with ``bincount`` and written as one
+dated PortfolioSnapshot row per cell.
+
+A loan rolls when it sits in a worse bucket than it did 30 days earlier.
+Reports read ``trends``, a grouped SUM over the snapshot rows, so they
+never touch the repayment history at request time. PAR30 is the share of
+the outstanding balance more than 30 days past due, and so on.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from portal.models import Loan, PortfolioSnapshot
+from portal.services import amortization, dashboard_cache, kpi
+
+BUCKETS = ('current', '1_30', '31_60', '61_90', 'over_90')
+# Days past due where each bucket after ``current`` starts
+BUCKET_STARTS = np.array([1, 31, 61, 91])
+# Buckets a loan can roll out of
+ROLLING = BUCKETS[:-1]
+ROLL_DAYS = 30
+PAR_DAYS = {'par30': '31_60', 'par60': '61_90', 'par90': 'over_90'}
+
+# Serializes snapshot builds of the same day
+LOCK_ID = 7302
+
+MEASURES = (
+    'loans', 'outstanding', 'overdue',
+    *(f'{kind}_{bucket}' for bucket in BUCKETS for kind in ('loans', 'outstanding')),
+    *(f'{kind}_{bucket}' for bucket in ROLLING for kind in ('previous', 'rolled')),
+)
+MONEY = {measure for measure in MEASURES if not measure.startswith('loans')}
+
+# group_by: (id lookup, name lookup)
+GROUPS = {
+    'region': ('region_id', 'region__region'),
+    'district': ('district_id', 'district__district'),
+    'project': ('project_id', 'project__name'),
+}
+
+
+def bucket_of(days_past_due):
+    """Index into BUCKETS for each days past due."""
+    return np.digitize(days_past_due, BUCKET_STARTS)
+
+
+def _loan_dimensions(loan_ids):
+    """``(district, project)`` id arrays for ``loan_ids``, -1 where there is none."""
+    rows = list(Loan.all_objects.order_by('id').values_list('id', 'farmer__district_id', 'project_id'))
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    districts = np.array([row[1] or -1 for row in rows], dtype=np.int64)
+    projects = np.array([row[2] or -1 for row in rows], dtype=np.int64)
+    position = np.searchsorted(ids, loan_ids)
+    return districts[position], projects[position]
+
+
+def _sum(groups, count, weights=None):
+    return np.rint(np.bincount(groups, weights=weights, minlength=count)).astype(np.int64)
+
+
+def compute(as_of):
+    """The PortfolioSnapshot rows of ``as_of``, unsaved."""
+    now = amortization.arrears(as_of)
+    before = amortization.arrears(as_of - timedelta(days=ROLL_DAYS))
+
+    held = now.outstanding > 0
+    loan_ids = now.loan_ids[held]
+    outstanding = now.outstanding[held]
+    overdue = now.overdue[held]
+    bucket = bucket_of(now.days_past_due[held])
+
+    # The earlier position of loans still held, paid off loans don't roll
+    earlier = before.outstanding > 0
+    before_ids = before.loan_ids[earlier]
+    before_outstanding = before.outstanding[earlier]
+    before_bucket = bucket_of(before.days_past_due[earlier])
+    bucket_now = np.full(len(before_ids), -1)
+    position = np.searchsorted(loan_ids, before_ids)
+    found = position < len(loan_ids)
+    found[found] = loan_ids[position[found]] == before_ids[found]
+    bucket_now[found] = bucket[position[found]]
+    rolled = bucket_now > before_bucket
+
+    # One cell per (district, project) over both days
+    districts, projects = _loan_dimensions(np.concatenate([loan_ids, before_ids]))
+    cells, groups = np.unique(np.stack([districts, projects], axis=1), axis=0, return_inverse=True)
+    groups = groups.ravel()
+    count = len(cells)
+    held_groups, before_groups = groups[:len(loan_ids)], groups[len(loan_ids):]
+
+    totals = {
+        'loans': _sum(held_groups, count),
+        'outstanding': _sum(held_groups, count, outstanding),
+        'overdue': _sum(held_groups, count, overdue),
+    }
+    for index, name in enumerate(BUCKETS):
+        in_bucket = bucket == index
+        totals[f'loans_{name}'] = _sum(held_groups[in_bucket], count)
+        totals[f'outstanding_{name}'] = _sum(held_groups[in_bucket], count, outstanding[in_bucket])
+    for index, name in enumerate(ROLLING):
+        was_in_bucket = before_bucket == index
+        totals[f'previous_{name}'] = _sum(before_groups[was_in_bucket], count, before_outstanding[was_in_bucket])
+        moved = was_in_bucket & rolled
+        totals[f'rolled_{name}'] = _sum(before_groups[moved], count, before_outstanding[moved])
+
+    regions = kpi.district_regions()
+    rows = []
+    for cell, (district, project) in enumerate(cells.tolist()):
+        values = {
+            measure: Decimal(int(totals[measure][cell])) / 100 if measure in MONEY else int(totals[measure][cell])
+            for measure in MEASURES
+        }
+        district = None if district < 0 else district
+        rows.append(PortfolioSnapshot(
+            snapshot_date=as_of,
+            region_id=regions.get(district),
+            district_id=district,
+            project_id=None if project < 0 else project,
+            **values,
+        ))
+    return rows
+
+
+def build_snapshot(as_of):
+    """Replace the snapshot rows of ``as_of``, returns the number of rows."""
+    rows = compute(as_of)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK_ID])
+        PortfolioSnapshot.objects.filter(snapshot_date=as_of).delete()
+        PortfolioSnapshot.objects.bulk_create(rows, batch_size=1000)
+        transaction.on_commit(lambda: dashboard_cache.invalidate(PortfolioSnapshot))
+    return len(rows)
+
+
+def _percent(part, whole):
+    return round(float(part) / float(whole) * 100, 2) if whole else 0
+
+
+def _report(row):
+    """Snapshot sums as the trend payload: bucket balances, PAR and roll rates."""
+    outstanding = row['outstanding'] or 0
+    report = {
+        'loans': row['loans'] or 0,
+        'outstanding': float(outstanding),
+        'overdue': float(row['overdue'] or 0),
+        'buckets': {
+            name: {'loans': row[f'loans_{name}'] or 0, 'outstanding': float(row[f'outstanding_{name}'] or 0)}
+            for name in BUCKETS
+        },
+        'roll_rates': {
+            name: _percent(row[f'rolled_{name}'] or 0, row[f'previous_{name}'] or 0) for name in ROLLING
+        },
+    }
+    for par, first_bucket in PAR_DAYS.items():
+        at_risk = sum(row[f'outstanding_{name}'] or 0 for name in BUCKETS[BUCKETS.index(first_bucket):])
+        report[par] = _percent(at_risk, outstanding)
+    return report
+
+
+def trends(since, until, region=None, district=None, project=None, group_by=None):
+    """
+    One report per snapshot date between ``since`` and ``until``, or per
+    date and region/district/project with ``group_by``. Raises ValueError
+    on an unknown ``group_by``.
+    """
+    if group_by and group_by not in GROUPS:
+        raise ValueError(f'group_by must be one of {", ".join(GROUPS)}')
+
+    queryset = PortfolioSnapshot.objects.filter(snapshot_date__gte=since, snapshot_date__lte=until)
+    if region:
+        queryset = queryset.filter(region_id=region)
+    if district:
+        queryset = queryset.filter(district_id=district)
+    if project:
+        queryset = queryset.filter(project_id=project)
+
+    dimensions = ['snapshot_date', *(GROUPS[group_by] if group_by else ())]
+    rows = queryset.values(*dimensions).annotate(**{measure: Sum(measure) for measure in MEASURES}).order_by(*dimensions)
+
+    result = []
+    for row in rows:
+        entry = {'date': row['snapshot_date'].isoformat()}
+        if group_by:
+            id_lookup, name_lookup = GROUPS[group_by]
+            entry[group_by] = {'id': row[id_lookup], 'name': row[name_lookup]}
+        entry.update(_report(row))
+        result.append(entry)
+    return result
+
+
+def latest():
+    """Report of the newest snapshot, None before the first build."""
+    last = PortfolioSnapshot.objects.order_by('-snapshot_date').values_list('snapshot_date', flat=True).first()
+    if last is None:
+        return None
+    report = trends(last, last)
+    return report[0] if report else {'date': last.isoformat(), **_report(dict.fromkeys(MEASURES))}
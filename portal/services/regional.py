@@ -0,0 +1,91 @@
+"""
+Regional rollups of farmers, farms, hectares and loan volume.
+
+One query over District returns every district with its totals and its
+region. Each total is a grouped subquery on the source table keyed by
+district, so farms and loans never multiply each other's rows. A
+district's region is District.region_foreignkey, or for districts that
+only carry the legacy ``region`` name, the Region of that name, resolved
+in SQL. Regions are summed from the district rows, so the district level
+drill-down comes from the same call.
+"""
+from django.db.models import Count, F, FloatField, IntegerField, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from portal.models import District, Farm, Farmer, Loan, Region
+
+MEASURES = ('farmers', 'farms', 'hectares', 'loans_disbursed')
+
+
+def _district_total(model, district_lookup, aggregate, output_field):
+    """``aggregate`` over the live ``model`` rows of the outer district, 0 when none."""
+    total = model.objects.filter(**{district_lookup: OuterRef('pk')}).order_by().values(
+        district_lookup
+    ).annotate(total=aggregate).values('total')
+    return Coalesce(Subquery(total, output_field=output_field), Value(0), output_field=output_field)
+
+
+def _legacy_region(field):
+    return Subquery(Region.objects.filter(region__iexact=OuterRef('region')).order_by('id').values(field)[:1])
+
+
+def district_rows(region=None):
+    """
+    Every district with its region and totals. ``region`` (a Region id)
+    limits the rows to that region's districts.
+    """
+    districts = District.objects.annotate(
+        rollup_region_id=Coalesce(F('region_foreignkey__id'), _legacy_region('id')),
+        rollup_region=Coalesce(F('region_foreignkey__region'), _legacy_region('region'), F('region')),
+        farmers=_district_total(Farmer, 'district', Count('id'), IntegerField()),
+        farms=_district_total(Farm, 'farmer__district', Count('id'), IntegerField()),
+        hectares=_district_total(Farm, 'farmer__district', Sum('area_hectares'), FloatField()),
+        loans_disbursed=_district_total(
+            Loan, 'farmer__district', Sum('total_disbursed'), DecimalField(max_digits=14, decimal_places=2)
+        ),
+    )
+    if region is not None:
+        districts = districts.filter(rollup_region_id=region)
+    return districts.order_by('rollup_region', 'district').values(
+        'id', 'district', 'rollup_region_id', 'rollup_region', *MEASURES
+    )
+
+
+def _totals(row):
+    return {
+        'farmers': row['farmers'],
+        'farms': row['farms'],
+        'hectares': float(row['hectares']),
+        'loans_disbursed': float(row['loans_disbursed']),
+    }
+
+
+def regional_rollup(drill_down=False, region=None):
+    """
+    Totals per region, every region listed. With ``drill_down`` each region
+    carries its ``districts``. ``region`` (a Region id) returns that region only.
+    """
+    regions = {}
+    names = Region.objects.all() if region is None else Region.objects.filter(id=region)
+    for pk, name in names.order_by('region').values_list('id', 'region'):
+        regions[pk] = {'region_id': pk, 'region': name, **dict.fromkeys(MEASURES, 0)}
+
+    for row in district_rows(region):
+        key = row['rollup_region_id'] or row['rollup_region']
+        if key is None:
+            continue
+        entry = regions.get(key)
+        if entry is None:
+            # Legacy region name without a Region row
+            entry = regions[key] = {'region_id': None, 'region': row['rollup_region'], **dict.fromkeys(MEASURES, 0)}
+        totals = _totals(row)
+        for measure in MEASURES:
+            entry[measure] += totals[measure]
+        if drill_down:
+            entry.setdefault('districts', []).append({'district_id': row['id'], 'district': row['district'], **totals})
+
+    result = list(regions.values())
+    if drill_down:
+        for entry in result:
+            entry.setdefault('districts', [])
+    return result
@@ -0,0 +1,108 @@
+"""
+Row readers shared by the API and the exports.
+
+A ``Reader`` compiles a field list once into one extractor per output key
+over ``values_list()`` tuples, so large reads never build model instances.
+"""
+import json
+from operator import itemgetter
+
+from django.db.models import Count, FloatField, Func, IntegerField, OuterRef, Subquery
+
+from portal.models import ProjectParticipation
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# Rows fetched per round trip while streaming
+CHUNK_SIZE = 500
+
+
+class Reader:
+    """
+    Turns ``values_list()`` rows into payload dicts.
+
+    ``fields`` is a list of ``(key, lookup)`` or ``(key, lookups, convert)``:
+    a single lookup is copied (through ``convert`` if given), several
+    lookups are passed to ``convert`` together. ``annotations`` are added
+    to the queryset and can be used as lookups.
+    """
+
+    def __init__(self, fields, annotations=None):
+        lookups = []
+        positions = {}
+
+        def position(lookup):
+            if lookup not in positions:
+                positions[lookup] = len(lookups)
+                lookups.append(lookup)
+            return positions[lookup]
+
+        extractors = []
+        for field in fields:
+            key, sources = field[0], field[1]
+            convert = field[2] if len(field) > 2 else None
+            if isinstance(sources, str):
+                get = itemgetter(position(sources))
+                if convert:
+                    get = (lambda get, convert: lambda row: convert(get(row)))(get, convert)
+            else:
+                indexes = [position(source) for source in sources]
+                get = (lambda indexes, convert: lambda row: convert(*[row[i] for i in indexes]))(
+                    indexes, convert
+                )
+            extractors.append((key, get))
+
+        self.lookups = lookups
+        self.extractors = extractors
+        self.annotations = annotations or {}
+
+    def rows(self, queryset):
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values_list(*self.lookups)
+
+    def payload(self, row):
+        return {key: get(row) for key, get in self.extractors}
+
+    def values(self, row):
+        return [get(row) for _, get in self.extractors]
+
+    def iter_payloads(self, queryset, chunk_size=CHUNK_SIZE):
+        payload = self.payload
+        for row in self.rows(queryset).iterator(chunk_size=chunk_size):
+            yield payload(row)
+
+    @property
+    def keys(self):
+        return [key for key, _ in self.extractors]
+
+
+class PointOrdinate(Func):
+    """ST_X/ST_Y of a geography point, computed in the database"""
+    template = '%(function)s(%(expressions)s::geometry)'
+    output_field = FloatField()
+
+
+def participating_farmers_count():
+    """Live farmers of the outer project, same as project.participating_farmers.count()"""
+    return Subquery(
+        ProjectParticipation.all_objects.filter(
+            project=OuterRef('pk'), farmer__is_deleted=False
+        ).order_by().values('project').annotate(total=Count('id')).values('total'),
+        output_field=IntegerField()
+    )
+
+
+def _default(value):
+    return str(value)
+
+
+if orjson is not None:
+    def dumps(data):
+        return orjson.dumps(data, default=_default)
+else:
+    def dumps(data):
+        return json.dumps(data, default=_default).encode('utf-8')
@@ -0,0 +1,131 @@
+"""
+Concurrency safe code allocation.
+
+Every code prefix (region/district for farms, farmer for loans, one for
+visits) has a CodeSequence row. Allocating is a single
+``UPDATE ... RETURNING`` on that row, so it is O(1) and two requests can
+never get the same number. The UPDATE runs and commits on its own
+connection (CODE_SEQUENCE_DATABASE), outside the caller's transaction:
+the row lock is held for that one statement rather than until the whole
+request commits, so concurrent uploads are not serialized behind each
+other. A request that rolls back leaves a gap in its prefix's codes.
+A sequence is seeded from the highest code already in use the first time
+its prefix is seen, so codes issued before this existed are never reused.
+"""
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
+
+from portal.models import CodeSequence, Farm, Loan, MonitoringVisit
+
+
+def max_code_number(queryset, field, prefix):
+    """Highest numeric suffix of ``field`` values that are prefix + digits."""
+    pattern = r'^%s[0-9]+$' % re.escape(prefix)
+    result = queryset.filter(**{f'{field}__regex': pattern}).aggregate(
+        value=Max(Cast(Substr(field, len(prefix) + 1), BigIntegerField()))
+    )
+    return result['value'] or 0
+
+
+def reserve_block(prefix, count=1, seed=None):
+    """
+    Reserve ``count`` consecutive numbers for ``prefix`` and return them as a
+    range. ``seed`` is a callable returning the highest number already used,
+    only called when the prefix has no sequence yet.
+    """
+    if count < 1:
+        raise ValueError('count must be at least 1')
+
+    table = CodeSequence._meta.db_table
+    using = getattr(settings, 'CODE_SEQUENCE_DATABASE', DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET last_value = last_value + %s, updated_at = NOW() "
+            f"WHERE prefix = %s RETURNING last_value",
+            [count, prefix]
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # First use of this prefix. If another request seeds it at the
+            # same time ON CONFLICT keeps one row and both go on to the UPDATE.
+            start = seed() if seed else 0
+            cursor.execute(
+                f"INSERT INTO {table} (prefix, last_value, updated_at) VALUES (%s, %s, NOW()) "
+                f"ON CONFLICT (prefix) DO NOTHING",
+                [prefix, start]
+            )
+            cursor.execute(
+                f"UPDATE {table} SET last_value = last_value + %s, updated_at = NOW() "
+                f"WHERE prefix = %s RETURNING last_value",
+                [count, prefix]
+            )
+            row = cursor.fetchone()
+
+    last = row[0]
+    return range(last - count + 1, last + 1)
+
+
+def next_value(prefix, seed=None):
+    return reserve_block(prefix, 1, seed)[0]
+
+
+def farm_code_prefix(region_code, district_code):
+    return f"EX-{region_code}-{district_code}-"
+
+
+def allocate_farm_codes(region_code, district_code, count=1):
+    """Return ``count`` new farm codes for a region/district."""
+    prefix = farm_code_prefix(region_code, district_code)
+    numbers = reserve_block(
+        prefix, count,
+        seed=lambda: max_code_number(Farm.all_objects.all(), 'farm_code', prefix)
+    )
+    return [f"{prefix}{number:06d}" for number in numbers]
+
+
+def allocate_farm_codes_bulk(code_parts):
+    """
+    Farm codes for a batch, given one (region_code, district_code) per item.
+    Reserves one block per prefix and returns the codes in input order.
+    """
+    by_prefix = {}
+    for position, parts in enumerate(code_parts):
+        by_prefix.setdefault(parts, []).append(position)
+
+    codes = [None] * len(code_parts)
+    for (region_code, district_code), positions in by_prefix.items():
+        for position, code in zip(positions, allocate_farm_codes(region_code, district_code, len(positions))):
+            codes[position] = code
+    return codes
+
+
+def next_farm_code(region_code, district_code):
+    return allocate_farm_codes(region_code, district_code)[0]
+
+
+def next_loan_id(farmer):
+    """Next loan ID for a farmer: LN + last 4 of the national ID + number."""
+    farmer_code = farmer.national_id[-4:] if farmer.national_id else "0000"
+    prefix = f"LN{farmer_code}"
+    number = next_value(
+        prefix,
+        seed=lambda: max_code_number(Loan.all_objects.all(), 'loan_id', prefix)
+    )
+    return f"{prefix}{number:04d}"
+
+
+def allocate_visit_ids(count=1):
+    prefix = "VISIT-"
+    numbers = reserve_block(
+        prefix, count,
+        seed=lambda: max_code_number(MonitoringVisit.objects.all(), 'visit_id', prefix)
+    )
+    return [f"{prefix}{number:06d}" for number in numbers]
+
+
+def next_visit_id():
+    return allocate_visit_ids()[0]
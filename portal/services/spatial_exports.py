@@ -0,0 +1,267 @@
+"""
+GeoPackage and zipped Shapefile exports of farms and the base layers.
+
+Features never pass through Python. Each layer is a queryset, with the
+farmer/project/region attributes joined in and the geography cast to
+geometry, whose SQL is handed to ``ogr2ogr``. ogr2ogr reads the rows from
+PostGIS through a cursor and writes the file, so memory stays flat and no
+GEOS object is built per feature however many polygons there are.
+
+Column names are at most 10 characters, the Shapefile limit, so both
+formats carry the same attributes. ogr2ogr (GDAL's command line tools,
+``settings.OGR2OGR_BINARY``) must be installed on the host running the
+export worker.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import CharField, F, Field, Func, Value
+from django.db.models.functions import Concat
+
+from portal.models import ClimateZone, Farm, IrrigationSource, RoadNetwork, SoilTypeArea
+
+# format: (OGR driver, file extension)
+FORMATS = {
+    'gpkg': ('GPKG', 'gpkg'),
+    'shapefile': ('ESRI Shapefile', 'zip'),
+}
+
+
+class SpatialExportError(Exception):
+    pass
+
+
+class AsGeometry(Func):
+    """
+    A geography column as geometry, the type OGR reads features from.
+    The output field is left generic so Django doesn't wrap the column for
+    its own geometry decoding.
+    """
+    template = '%(expressions)s::geometry'
+    output_field = Field()
+
+
+def _full_name(prefix):
+    return Concat(
+        F(f'{prefix}__first_name'), Value(' '), F(f'{prefix}__last_name'), output_field=CharField()
+    )
+
+
+class Layer:
+    """
+    One layer of a spatial export: ``columns`` is a list of
+    ``(column, lookup or expression)``, ``filter_queryset(queryset, filters)``
+    narrows the rows for the request's filters.
+    """
+
+    def __init__(self, name, model, geometry, geometry_type, columns, filter_queryset=None):
+        self.name = name
+        self.model = model
+        self.geometry = geometry
+        self.geometry_type = geometry_type
+        self.columns = columns
+        self.filter_queryset = filter_queryset
+
+    def queryset(self, filters=None):
+        queryset = self.model.objects.filter(**{f'{self.geometry}__isnull': False})
+        if self.filter_queryset:
+            queryset = self.filter_queryset(queryset, filters or {})
+        return queryset
+
+    def sql(self, filters=None):
+        """
+        The layer's SELECT as a literal SQL string. Columns are selected
+        under positional aliases and renamed outside, so export column
+        names can repeat model field names.
+        """
+        expressions = {
+            f'c{index}': F(source) if isinstance(source, str) else source
+            for index, (_, source) in enumerate(self.columns)
+        }
+        expressions['c_geometry'] = AsGeometry(self.geometry)
+        queryset = self.queryset(filters).annotate(**expressions).order_by('pk').values(*expressions)
+
+        inner, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            inner = cursor.mogrify(inner, params)
+        if isinstance(inner, bytes):
+            inner = inner.decode('utf-8')
+
+        quote = connection.ops.quote_name
+        outer = [f'{quote(f"c{index}")} AS {quote(column)}' for index, (column, _) in enumerate(self.columns)]
+        outer.append(f'{quote("c_geometry")} AS {quote("geom")}')
+        return f'SELECT {", ".join(outer)} FROM ({inner}) AS layer'
+
+
+def _filter_farms(queryset, filters):
+    if filters.get('project'):
+        queryset = queryset.filter(project_id=filters['project'])
+    if filters.get('status'):
+        queryset = queryset.filter(status=filters['status'])
+    if filters.get('district'):
+        queryset = queryset.filter(farmer__user_profile__district__district__iexact=filters['district'])
+    if filters.get('region'):
+        queryset = queryset.filter(farmer__user_profile__district__region__iexact=filters['region'])
+    return queryset
+
+
+def _filter_region(queryset, filters):
+    if filters.get('region'):
+        queryset = queryset.filter(region__region__iexact=filters['region'])
+    return queryset
+
+
+FARM_COLUMNS = [
+    ('farm_id', 'id'),
+    ('farm_code', 'farm_code'),
+    ('name', 'name'),
+    ('status', 'status'),
+    ('area_ha', 'area_hectares'),
+    ('soil_type', 'soil_type'),
+    ('irrigation', 'irrigation_type'),
+    ('reg_date', 'registration_date'),
+    ('validated', 'validation_status'),
+    ('farmer_id', 'farmer_id'),
+    ('farmer', _full_name('farmer__user_profile__user')),
+    ('nat_id', 'farmer__national_id'),
+    ('project_id', 'project_id'),
+    ('project', 'project__name'),
+    ('proj_code', 'project__code'),
+    ('district', 'farmer__user_profile__district__district'),
+    ('region', 'farmer__user_profile__district__region'),
+]
+
+FARMS = Layer('farms', Farm, 'boundary', 'POLYGON', FARM_COLUMNS, _filter_farms)
+FARM_POINTS = Layer('farm_points', Farm, 'location', 'POINT', FARM_COLUMNS, _filter_farms)
+
+SOIL_TYPES = Layer('soil_types', SoilTypeArea, 'boundary', 'POLYGON', [
+    ('soil_type', 'soil_type'),
+    ('fertility', 'fertility'),
+    ('area_ha', 'area_hectares'),
+    ('ph', 'ph_level'),
+    ('organic', 'organic_matter'),
+    ('region', 'region__region'),
+], _filter_region)
+
+CLIMATE_ZONES = Layer('climate_zones', ClimateZone, 'boundary', 'POLYGON', [
+    ('zone_name', 'zone_name'),
+    ('rainfall', 'rainfall'),
+    ('avg_temp', 'avg_temperature'),
+    ('avg_rain', 'avg_rainfall'),
+    ('region', 'region__region'),
+], _filter_region)
+
+ROADS = Layer('roads', RoadNetwork, 'path', 'LINESTRING', [
+    ('name', 'name'),
+    ('road_type', 'road_type'),
+    ('condition', 'condition'),
+    ('length_km', 'length_km'),
+    ('region', 'region__region'),
+    ('district', 'district__district'),
+], _filter_region)
+
+IRRIGATION_SOURCES = Layer('irrigation_sources', IrrigationSource, 'location', 'POINT', [
+    ('source', 'source_type'),
+    ('capacity', 'capacity'),
+    ('operating', 'operational_status'),
+    ('installed', 'installation_date'),
+    ('cover_ha', 'coverage_area'),
+    ('region', 'region__region'),
+    ('district', 'district__district'),
+], _filter_region)
+
+
+class SpatialExport:
+    """A named group of layers written to one GeoPackage or Shapefile zip."""
+
+    formats = tuple(FORMATS)
+
+    def __init__(self, name, layers):
+        self.name = name
+        self.layers = layers
+
+    def filename(self, format_type):
+        _, extension = FORMATS[format_type]
+        return f'{self.name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+    def counts(self, filters=None):
+        return {layer.name: layer.queryset(filters).count() for layer in self.layers}
+
+    def write(self, path, format_type, filters=None, on_layer=None):
+        """
+        Write every layer to ``path``. ``on_layer(layer)`` is called after
+        each layer is written.
+        """
+        driver, _ = FORMATS[format_type]
+        with tempfile.TemporaryDirectory() as tmp:
+            # A GeoPackage is one file, a Shapefile dataset a directory of them
+            target = os.path.join(tmp, f'{self.name}.gpkg' if format_type == 'gpkg' else self.name)
+            for index, layer in enumerate(self.layers):
+                run_ogr2ogr(driver, target, layer, filters, update=index > 0)
+                if on_layer:
+                    on_layer(layer)
+
+            if format_type == 'gpkg':
+                shutil.move(target, path)
+            else:
+                with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for filename in sorted(os.listdir(target)):
+                        archive.write(os.path.join(target, filename), filename)
+
+
+def _pg_source():
+    """OGR's PG: connection string, the password goes through the environment."""
+    db = connection.settings_dict
+    options = {'dbname': db['NAME'], 'host': db.get('HOST'), 'port': db.get('PORT'), 'user': db.get('USER')}
+    parts = []
+    for key, value in options.items():
+        if value:
+            value = str(value).replace('\\', '\\\\').replace("'", "\\'")
+            parts.append(f"{key}='{value}'")
+    return 'PG:' + ' '.join(parts)
+
+
+def run_ogr2ogr(driver, target, layer, filters=None, update=False):
+    binary = getattr(settings, 'OGR2OGR_BINARY', 'ogr2ogr')
+    if shutil.which(binary) is None:
+        raise SpatialExportError(f'{binary} was not found, install the GDAL command line tools')
+
+    args = [
+        binary, '-f', driver, target, _pg_source(),
+        '-sql', layer.sql(filters),
+        '-nln', layer.name,
+        '-nlt', layer.geometry_type,
+        '-a_srs', 'EPSG:4326',
+    ]
+    if update:
+        args.append('-update')
+    if driver == 'ESRI Shapefile':
+        args += ['-lco', 'ENCODING=UTF-8']
+
+    env = dict(os.environ, PGCLIENTENCODING='UTF8')
+    password = connection.settings_dict.get('PASSWORD')
+    if password:
+        env['PGPASSWORD'] = password
+
+    result = subprocess.run(args, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SpatialExportError(
+            f'ogr2ogr failed on layer {layer.name}: {result.stderr.strip() or result.returncode}'
+        )
+
+
+BASE_LAYERS = [SOIL_TYPES, CLIMATE_ZONES, ROADS, IRRIGATION_SOURCES]
+
+SPATIAL_EXPORTS = {
+    export.name: export for export in (
+        SpatialExport('farms', [FARMS, FARM_POINTS]),
+        SpatialExport('base_layers', BASE_LAYERS),
+        *(SpatialExport(layer.name, [layer]) for layer in BASE_LAYERS),
+    )
+}
@@ -0,0 +1,479 @@
+"""
+Bank and mobile money statement import.
+
+``stage`` parses a CSV export into StatementLine rows and matches every
+credit to an open loan in one pass. The open loans are read once and
+indexed by loan ID, farmer national ID and phone number. The keys are
+normalized: case, spaces and separators are dropped, and phone numbers are
+cut to their last nine digits so ``024 123 4567`` and ``+233241234567``
+are the same key. Matching a line is then a few dict lookups, however many
+loans there are. A line is:
+
+1. ``duplicate`` when its reference is already on a repayment, on a
+   matched line of another staged statement, or earlier in the file;
+2. matched by a loan ID given as its reference;
+3. matched by a loan ID, then a national ID, found in its reference,
+   description or payer columns;
+4. matched by its phone column, or a phone number in the description.
+
+The first of these that finds any loan decides. A key shared by several
+open loans (a farmer with two loans) leaves the line ``ambiguous`` with its
+candidate loans. Reviewers assign or reject lines (``review``). ``confirm``
+then writes the matched lines as LoanRepayment rows with one
+``bulk_create``. The ledger balances of every loan paid are refreshed in one
+UPDATE, rather than once per repayment as the signals would, followed by
+the loan statuses, schedules, KPI days and dashboard cache.
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from portal.models import Loan, LoanRepayment, Staff, StatementImport, StatementLine
+from portal.services import amortization, dashboard_cache, kpi, ledger
+
+# Loans a repayment can be recorded against, as in create_repayment
+OPEN_STATUSES = ('disbursed', 'repaying')
+MAX_LINES = 20000
+BATCH_SIZE = 1000
+# Rows searched for the header, bank exports often start with account details
+HEADER_ROWS = 20
+# Shorter loan and national IDs are not indexed, they match too much free text
+MIN_KEY_LENGTH = 6
+PHONE_DIGITS = 9
+# Adjacent description tokens joined into one key, for "LN 1234 0001"
+KEY_WIDTH = 3
+CENT = Decimal('0.01')
+MAX_AMOUNT = Decimal('10000000000')
+
+# Statement field: header names it is exported under, see normalize_header
+COLUMNS = {
+    'date': ('date', 'transactiondate', 'valuedate', 'postingdate', 'transdate', 'datetime', 'completiontime'),
+    'amount': ('amount', 'credit', 'creditamount', 'paidin', 'deposit', 'deposits', 'amountghs', 'cr'),
+    'debit': ('debit', 'debitamount', 'paidout', 'withdrawal', 'withdrawals', 'withdrawn', 'dr'),
+    'reference': (
+        'reference', 'transactionreference', 'transactionid', 'transid', 'ref', 'refno', 'referenceno',
+        'receipt', 'receiptno',
+    ),
+    'description': ('description', 'narration', 'details', 'particulars', 'remarks', 'memo'),
+    'payer': ('name', 'payer', 'payername', 'sendername', 'customername', 'fromname', 'accountname'),
+    'phone': ('phone', 'phonenumber', 'msisdn', 'mobile', 'mobilenumber', 'sender', 'from'),
+}
+# Day first, as exported by Ghanaian banks and mobile money operators
+DATE_FORMATS = (
+    '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%d/%m/%y',
+    '%d %b %Y', '%d-%b-%Y', '%d %B %Y', '%d-%b-%y',
+)
+TIME_RE = re.compile(r'[T ]+\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?\s*([AP]M)?$', re.IGNORECASE)
+CURRENCY = r'(?:[A-Z]{3}|GH[S¢₵]|[¢₵$])\.?'
+# Thousands separated by commas, the decimal part by a point. Debits are
+# negative, bracketed or marked DR, and the sign may follow the currency.
+AMOUNT_RE = re.compile(
+    rf'(?P<open>\()?\s*(?P<lead>[-+])?\s*(?:{CURRENCY}\s*)?(?P<sign>[-+])?\s*'
+    r'(?P<number>\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?|\.\d+)'
+    rf'\s*(?:{CURRENCY}\s*)?(?P<close>\))?\s*(?P<trail>-|DR|CR)?',
+    re.IGNORECASE,
+)
+TOKEN_SPLIT_RE = re.compile(r'[\s,;:/|#()\[\]]+')
+
+METHODS = ('loan_id', 'national_id', 'phone')
+MATCHABLE = ('matched', 'ambiguous', 'unmatched', 'duplicate', 'rejected')
+
+
+class StatementError(Exception):
+    pass
+
+
+def normalize_header(text):
+    return re.sub(r'[^0-9a-z]', '', (text or '').lower())
+
+
+def normalize_key(text):
+    return re.sub(r'[^0-9A-Z]', '', (text or '').upper())
+
+
+def normalize_phone(text):
+    """The subscriber number of ``text``, '' when it is too short to be one."""
+    digits = re.sub(r'\D', '', text or '')
+    return digits[-PHONE_DIGITS:] if len(digits) >= PHONE_DIGITS else ''
+
+
+def parse_date(text):
+    text = TIME_RE.sub('', (text or '').strip())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_amount(text):
+    """
+    Amount of ``text`` such as ``GHS 1,200.00``, ``GHS -50.00``, ``(50.00)``
+    or ``50.00 DR``. None unless ``text`` is one well formed amount.
+    """
+    found = AMOUNT_RE.fullmatch((text or '').strip())
+    if found is None or bool(found['open']) != bool(found['close']):
+        return None
+    signs = [found['lead'], found['sign'], found['trail']]
+    if len([sign for sign in signs if sign]) > 1 or (found['open'] and any(signs)):
+        return None
+    amount = Decimal(found['number'].replace(',', '')).quantize(CENT)
+    if amount >= MAX_AMOUNT:
+        return None
+    negative = found['open'] or any(sign and sign.upper() in ('-', 'DR') for sign in signs)
+    return -amount if negative else amount
+
+
+def _header(row):
+    """Field: column index of a header ``row``, None unless it has a date and an amount."""
+    names = [normalize_header(cell) for cell in row]
+    columns = {}
+    for field, aliases in COLUMNS.items():
+        for position, name in enumerate(names):
+            if name in aliases and position not in columns.values():
+                columns[field] = position
+                break
+    return columns if 'date' in columns and 'amount' in columns else None
+
+
+def parse(content):
+    """The unsaved StatementLine rows of CSV ``content``, bytes or text."""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            content = content.decode('latin-1')
+
+    header = columns = None
+    lines = []
+    for row_number, row in enumerate(csv.reader(io.StringIO(content)), start=1):
+        if columns is None:
+            if row_number > HEADER_ROWS:
+                break
+            header, columns = row, _header(row)
+            continue
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(lines) >= MAX_LINES:
+            raise StatementError(f'At most {MAX_LINES} transactions per statement')
+
+        def value(field):
+            position = columns.get(field)
+            return row[position].strip() if position is not None and position < len(row) else ''
+
+        amount = parse_amount(value('amount'))
+        if not amount and value('debit'):
+            debit = parse_amount(value('debit'))
+            amount = -abs(debit) if debit else amount
+        lines.append(StatementLine(
+            row_number=row_number,
+            transaction_date=parse_date(value('date')),
+            amount=amount,
+            reference=value('reference')[:100] or None,
+            description=value('description') or None,
+            payer=value('payer')[:200] or None,
+            phone_number=value('phone')[:20] or None,
+            raw=dict(zip(header, row)),
+        ))
+
+    if columns is None:
+        raise StatementError('No header row with a date and an amount column was found')
+    return lines
+
+
+def _add(keys, key, loan_id):
+    if key:
+        keys.setdefault(key, set()).add(loan_id)
+
+
+def build_index(queryset=None):
+    """Open loans as ``{method: {normalized key: loan ids}}`` for ``match``."""
+    if queryset is None:
+        queryset = Loan.objects.filter(status__in=OPEN_STATUSES)
+    index = {method: {} for method in METHODS}
+    rows = queryset.order_by('id').values_list('id', 'loan_id', 'farmer__national_id', 'farmer__user_profile__phone_number')
+    for loan_id, code, national_id, phone in rows.iterator(chunk_size=5000):
+        for method, key in (('loan_id', normalize_key(code)), ('national_id', normalize_key(national_id))):
+            if len(key) >= MIN_KEY_LENGTH:
+                _add(index[method], key, loan_id)
+        _add(index['phone'], normalize_phone(phone), loan_id)
+    return index
+
+
+def _keys(*texts):
+    """Normalized tokens of ``texts``, alone and joined with up to KEY_WIDTH neighbours."""
+    keys = []
+    for text in texts:
+        tokens = [token for token in (normalize_key(part) for part in TOKEN_SPLIT_RE.split(text or '')) if token]
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(start + KEY_WIDTH, len(tokens)) + 1):
+                keys.append(''.join(tokens[start:end]))
+    return keys
+
+
+def _chunks(values):
+    values = sorted(values)
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
+
+
+def taken_references(lines, exclude_statement=None):
+    """
+    ``{normalized reference: (loan id, reason)}`` for the references of
+    ``lines`` already recorded as repayments or staged in another statement.
+    """
+    references = {line.reference for line in lines if line.reference}
+    taken = {}
+    for chunk in _chunks(references):
+        staged = StatementLine.objects.filter(reference__in=chunk, status='matched', statement__status='staged')
+        if exclude_statement is not None:
+            staged = staged.exclude(statement=exclude_statement)
+        for reference, loan_id in staged.values_list('reference', 'loan_id'):
+            taken[normalize_key(reference)] = (loan_id, 'Reference already staged in another statement')
+        recorded = LoanRepayment.objects.filter(transaction_reference__in=chunk)
+        for reference, loan_id in recorded.values_list('transaction_reference', 'loan_id'):
+            taken[normalize_key(reference)] = (loan_id, 'Reference already recorded as a repayment')
+    return taken
+
+
+def _set(line, status, loan_id=None, method=None, candidates=(), error=None):
+    line.status = status
+    line.loan_id = loan_id
+    line.match_method = method
+    line.candidates = sorted(candidates)
+    line.error = error
+    return line
+
+
+def match(line, index, taken):
+    """
+    Set the status and loan of ``line`` from ``index`` (see
+    ``build_index``). ``taken`` holds the references seen so far (see
+    ``taken_references``), the reference of a credit is added to it.
+    """
+    if line.transaction_date is None or line.amount is None:
+        return _set(line, 'ignored', error='No transaction date or amount')
+    if line.amount <= 0:
+        return _set(line, 'ignored', error='Not a credit')
+
+    reference = normalize_key(line.reference)
+    if reference in taken:
+        loan_id, reason = taken[reference]
+        return _set(line, 'duplicate', loan_id=loan_id, error=reason)
+
+    keys = _keys(line.reference, line.description, line.payer)
+    phones = {normalize_phone(line.phone_number)} | {normalize_phone(key) for key in keys if key.isdigit()}
+    searches = (
+        ('reference', 'loan_id', [reference]),
+        ('loan_id', 'loan_id', keys),
+        ('national_id', 'national_id', keys),
+        ('phone', 'phone', phones),
+    )
+    for method, indexed_by, found in searches:
+        candidates = set()
+        for key in found:
+            candidates |= index[indexed_by].get(key, set())
+        if len(candidates) == 1:
+            _set(line, 'matched', loan_id=next(iter(candidates)), method=method)
+            break
+        if candidates:
+            _set(line, 'ambiguous', method=method, candidates=candidates, error='Several open loans match')
+            break
+    else:
+        _set(line, 'unmatched', error='No open loan matches')
+
+    if reference:
+        taken[reference] = (line.loan_id, 'Reference repeated in this statement')
+    return line
+
+
+def stage(content, file_name, source, user):
+    """Parse, match and store a statement for review, returns the StatementImport."""
+    if source not in dict(StatementImport.SOURCES):
+        raise StatementError(f'source must be one of {", ".join(dict(StatementImport.SOURCES))}')
+
+    lines = parse(content)
+    index = build_index()
+    taken = taken_references(lines)
+    for line in lines:
+        match(line, index, taken)
+
+    with transaction.atomic():
+        statement = StatementImport.objects.create(
+            source=source,
+            file_name=(file_name or 'statement.csv')[:255],
+            total_lines=len(lines),
+            matched_lines=sum(1 for line in lines if line.status == 'matched'),
+            added_by=user,
+        )
+        for line in lines:
+            line.statement = statement
+        StatementLine.objects.bulk_create(lines, batch_size=BATCH_SIZE)
+    return statement
+
+
+def summary(statement):
+    """Lines and amount of ``statement`` per line status."""
+    rows = statement.lines.order_by().values('status').annotate(lines=Count('id'), amount=Sum('amount'))
+    totals = {status: {'lines': 0, 'amount': 0.0} for status, _ in StatementLine.STATUSES}
+    for row in rows:
+        totals[row['status']] = {'lines': row['lines'], 'amount': float(row['amount'] or 0)}
+    return {
+        'id': statement.id,
+        'source': statement.source,
+        'file_name': statement.file_name,
+        'status': statement.status,
+        'total_lines': statement.total_lines,
+        'confirmed_lines': statement.confirmed_lines,
+        'confirmed_amount': float(statement.confirmed_amount),
+        'confirmed_at': statement.confirmed_at.isoformat() if statement.confirmed_at else None,
+        'lines': totals,
+    }
+
+
+def _recount(statement):
+    counts = statement.lines.order_by().aggregate(
+        matched=Count('id', filter=Q(status='matched')),
+        pending=Count('id', filter=Q(status__in=('matched', 'ambiguous'))),
+        confirmed=Count('id', filter=Q(status='confirmed')),
+        confirmed_amount=Sum('amount', filter=Q(status='confirmed')),
+    )
+    statement.matched_lines = counts['matched']
+    statement.confirmed_lines = counts['confirmed']
+    statement.confirmed_amount = counts['confirmed_amount'] or 0
+    statement.status = 'confirmed' if counts['confirmed'] and not counts['pending'] else 'staged'
+    statement.save(update_fields=['matched_lines', 'confirmed_lines', 'confirmed_amount', 'status', 'confirmed_at', 'updated_at'])
+
+
+def review(statement, line_ids, action, loan_id=None):
+    """
+    Assign the lines ``line_ids`` of ``statement`` to the open loan
+    ``loan_id``, or reject them. Confirmed and ignored lines are left
+    alone. Returns the number of lines changed.
+    """
+    lines = statement.lines.filter(id__in=line_ids, status__in=MATCHABLE)
+    with transaction.atomic():
+        if action == 'assign':
+            if not Loan.objects.filter(id=loan_id, status__in=OPEN_STATUSES).exists():
+                raise StatementError('Lines can only be assigned to a disbursed or repaying loan')
+            changed = lines.update(status='matched', loan_id=loan_id, match_method='manual', error=None)
+        elif action == 'reject':
+            changed = lines.update(status='rejected', error=None)
+        else:
+            raise StatementError('action must be assign or reject')
+        _recount(statement)
+    return changed
+
+
+def confirm(statement, user, line_ids=None):
+    """
+    Record the matched lines of ``statement``, or of them those in
+    ``line_ids``, as repayments. Returns the number of repayments written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        statement = StatementImport.objects.select_for_update().get(pk=statement.pk)
+        lines = statement.lines.select_for_update().filter(status='matched')
+        if line_ids is not None:
+            lines = lines.filter(id__in=line_ids)
+        lines = list(lines.order_by('row_number'))
+        if not lines:
+            return 0
+
+        # Repayments written and loans closed since the lines were staged
+        recorded = {
+            reference for chunk in _chunks({line.reference for line in lines if line.reference})
+            for reference in LoanRepayment.objects.filter(transaction_reference__in=chunk).values_list(
+                'transaction_reference', flat=True)
+        }
+        open_loans = set(Loan.objects.select_for_update().filter(
+            id__in={line.loan_id for line in lines}, status__in=OPEN_STATUSES
+        ).order_by('id').values_list('id', flat=True))
+
+        confirmed = []
+        for line in lines:
+            if line.reference in recorded and line.match_method != 'manual':
+                line.status, line.error = 'duplicate', 'Reference already recorded as a repayment'
+            elif line.loan_id not in open_loans:
+                line.status, line.error = 'unmatched', 'Loan is no longer open for repayments'
+            else:
+                confirmed.append(line)
+
+        staff = Staff.objects.filter(user_profile__user=user).first()
+        repayments = LoanRepayment.objects.bulk_create([
+            LoanRepayment(
+                loan_id=line.loan_id,
+                amount=line.amount,
+                repayment_date=line.transaction_date,
+                transaction_reference=line.reference or '',
+                received_by=staff,
+                notes=f'{statement.get_source_display()} statement {statement.id}, row {line.row_number}',
+                added_by=user,
+            )
+            for line in confirmed
+        ], batch_size=BATCH_SIZE)
+        for line, repayment in zip(confirmed, repayments):
+            line.status, line.error, line.repayment = 'confirmed', None, repayment
+        StatementLine.objects.bulk_update(lines, ['status', 'error', 'repayment'], batch_size=BATCH_SIZE)
+
+        # bulk_create skips the signals: one ledger UPDATE for every loan
+        # paid, then the statuses create_repayment would set
+        loan_ids = sorted({line.loan_id for line in confirmed})
+        ledger.refresh_loan_balances(loan_ids)
+        Loan.objects.filter(id__in=loan_ids, status__in=OPEN_STATUSES).update(
+            status=Case(
+                When(total_repaid__gte=F('total_disbursed'), then=Value('completed')),
+                default=Value('repaying'),
+            ),
+            modified_by=user,
+            updated_at=now,
+        )
+
+        if confirmed:
+            statement.confirmed_at = now
+        _recount(statement)
+
+        days = {line.transaction_date for line in confirmed}
+        transaction.on_commit(lambda: amortization.refresh_schedules(loan_ids))
+        transaction.on_commit(lambda: kpi.refresh_days(days))
+        transaction.on_commit(lambda: dashboard_cache.invalidate(Loan, LoanRepayment))
+    return len(confirmed)
+
+
+def list_lines(statement, status=None, offset=0, limit=500):
+    """Lines of ``statement`` for review, with the loan and farmer they match."""
+    queryset = statement.lines.select_related('loan__farmer__user_profile__user').order_by('row_number')
+    if status:
+        queryset = queryset.filter(status=status)
+    result = []
+    for line in queryset[offset:offset + limit]:
+        loan = line.loan
+        result.append({
+            'id': line.id,
+            'row_number': line.row_number,
+            'transaction_date': line.transaction_date.isoformat() if line.transaction_date else None,
+            'amount': float(line.amount) if line.amount is not None else None,
+            'reference': line.reference,
+            'description': line.description,
+            'payer': line.payer,
+            'phone_number': line.phone_number,
+            'status': line.status,
+            'match_method': line.match_method,
+            'candidates': line.candidates,
+            'error': line.error,
+            'loan': {
+                'id': loan.id,
+                'loan_id': loan.loan_id,
+                'farmer': loan.farmer.user_profile.user.get_full_name(),
+                'outstanding': float(loan.outstanding),
+            } if loan else None,
+            'repayment_id': line.repayment_id,
+        })
+    return result
@@ -0,0 +1,176 @@
+"""
+Mapbox Vector Tiles for the farm layer.
+
+Tiles are rendered in PostGIS with ST_AsMVT and cached on disk under
+settings.MAP_TILE_CACHE_DIR as {z}/{x}/{y}.pbf. Editing a farm only drops
+the cached tiles that cover the farm, every other tile stays warm.
+"""
+import math
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+
+from portal.models import Farm, Farmer, UserProfile
+
+TILE_LAYER = 'farms'
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Below this zoom farms are drawn as points, from it upwards as polygons
+POLYGON_MIN_ZOOM = 12
+
+# Attributes shipped with each feature, by minimum zoom. Low zoom tiles
+# only need enough to style the dots, detail comes in as the user zooms in.
+TILE_ATTRIBUTES = (
+    (0, ("f.id AS farm_id", "f.status")),
+    (10, ("f.farm_code", "f.area_hectares", "f.validation_status")),
+    (14, ("COALESCE(NULLIF(f.name, ''), 'Farm ' || f.farm_code) AS name",
+          "TRIM(u.first_name || ' ' || u.last_name) AS farmer_name",
+          "fr.primary_crop")),
+)
+FARMER_JOIN_MIN_ZOOM = 14
+
+
+def tile_attributes(z):
+    """Return the SELECT columns used for tiles at zoom ``z``."""
+    columns = []
+    for min_zoom, fields in TILE_ATTRIBUTES:
+        if z >= min_zoom:
+            columns.extend(fields)
+    return columns
+
+
+def is_valid_tile(z, x, y):
+    if z < 0 or z > settings.MAP_TILE_MAX_ZOOM:
+        return False
+    size = 2 ** z
+    return 0 <= x < size and 0 <= y < size
+
+
+def build_farm_tile(z, x, y):
+    """Render the farm layer for tile z/x/y and return the raw MVT bytes."""
+    if z >= POLYGON_MIN_ZOOM:
+        geometry = "COALESCE(f.boundary, f.location)::geometry"
+    else:
+        geometry = "COALESCE(f.location::geometry, ST_PointOnSurface(f.boundary::geometry))"
+
+    joins = ""
+    if z >= FARMER_JOIN_MIN_ZOOM:
+        joins = f"""
+            JOIN {Farmer._meta.db_table} fr ON fr.id = f.farmer_id
+            JOIN {UserProfile._meta.db_table} up ON up.id = fr.user_profile_id
+            JOIN {User._meta.db_table} u ON u.id = up.user_id
+        """
+
+    # The && checks on the geography columns use their GiST indexes, so
+    # only farms touching the tile envelope are read.
+    sql = f"""
+        WITH bounds AS (
+            SELECT ST_TileEnvelope(%s, %s, %s) AS geom,
+                   ST_Transform(ST_TileEnvelope(%s, %s, %s), 4326)::geography AS geog
+        ),
+        mvtgeom AS (
+            SELECT ST_AsMVTGeom(ST_Transform({geometry}, 3857), bounds.geom,
+                                {TILE_EXTENT}, {TILE_BUFFER}, true) AS geom,
+                   {', '.join(tile_attributes(z))}
+            FROM {Farm._meta.db_table} f
+            {joins}
+            CROSS JOIN bounds
+            WHERE f.is_deleted = false
+              AND (f.boundary && bounds.geog
+                   OR (f.boundary IS NULL AND f.location && bounds.geog))
+        )
+        SELECT ST_AsMVT(mvtgeom.*, %s, {TILE_EXTENT}, 'geom')
+        FROM mvtgeom
+        WHERE mvtgeom.geom IS NOT NULL
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [z, x, y, z, x, y, TILE_LAYER])
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] else b''
+
+
+def tile_path(z, x, y):
+    return os.path.join(settings.MAP_TILE_CACHE_DIR, TILE_LAYER, str(z), str(x), f'{y}.pbf')
+
+
+def get_farm_tile(z, x, y):
+    """Return tile bytes from the disk cache, rendering them on a miss."""
+    path = tile_path(z, x, y)
+    try:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    except FileNotFoundError:
+        pass
+
+    data = build_farm_tile(z, x, y)
+
+    # Write to a temp file first so a concurrent reader never sees half a tile
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+    return data
+
+
+def lonlat_to_tile(lon, lat, z):
+    """Return the x/y of the tile containing lon/lat at zoom z."""
+    lat = max(min(lat, 85.0511), -85.0511)
+    size = 2 ** z
+    x = int((lon + 180.0) / 360.0 * size)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * size)
+    return min(max(x, 0), size - 1), min(max(y, 0), size - 1)
+
+
+def farm_extent(farm):
+    """Return the (xmin, ymin, xmax, ymax) a farm is drawn over, or None."""
+    geometry = farm.boundary or farm.location
+    if not geometry:
+        return None
+    extent = geometry.extent
+    if farm.boundary and farm.location:
+        # Low zoom tiles draw the point, which may sit outside the polygon
+        x, y = farm.location.x, farm.location.y
+        extent = (min(extent[0], x), min(extent[1], y), max(extent[2], x), max(extent[3], y))
+    return extent
+
+
+def invalidate_extent(extent):
+    """Delete every cached tile that intersects ``extent`` at any zoom."""
+    if not extent:
+        return 0
+
+    removed = 0
+    xmin, ymin, xmax, ymax = extent
+    for z in range(settings.MAP_TILE_MAX_ZOOM + 1):
+        # Tile rows grow southwards, so the north edge gives the lowest y
+        x0, y0 = lonlat_to_tile(xmin, ymax, z)
+        x1, y1 = lonlat_to_tile(xmax, ymin, z)
+        # Features are clipped with a buffer, so neighbouring tiles carry them too
+        size = 2 ** z
+        for x in range(max(x0 - 1, 0), min(x1 + 1, size - 1) + 1):
+            column = os.path.join(settings.MAP_TILE_CACHE_DIR, TILE_LAYER, str(z), str(x))
+            if not os.path.isdir(column):
+                continue
+            for y in range(max(y0 - 1, 0), min(y1 + 1, size - 1) + 1):
+                try:
+                    os.remove(os.path.join(column, f'{y}.pbf'))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+    return removed
+
+
+def invalidate_farm_tiles(farm, previous_extent=None):
+    """
+    Drop cached tiles for a farm. Pass the extent the farm had before an
+    edit as ``previous_extent`` so tiles at its old position are cleared too.
+    """
+    removed = invalidate_extent(farm_extent(farm))
+    if previous_extent:
+        removed += invalidate_extent(previous_extent)
+    return removed
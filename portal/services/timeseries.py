@@ -0,0 +1,172 @@
+"""
+Time-bucketed series for the performance chart.
+
+Each metric is one grouped query: rows in the range, filtered by the
+requested districts/projects, truncated to the bucket with
+TruncDay/TruncWeek/TruncMonth and aggregated in the database. Buckets
+without rows are filled with 0 here. performance_analysis_api caches the
+result (portal.services.dashboard_cache).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Avg, Count, DateField, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from portal.models import Farm, Farmer, LoanDisbursement, ProjectParticipation, UserProfile
+
+GRANULARITIES = {
+    'day': (TruncDay, '%d %b %Y'),
+    'week': (TruncWeek, '%d %b %Y'),
+    'month': (TruncMonth, '%b %Y'),
+}
+DEFAULT_TIME_RANGE = 180
+MAX_TIME_RANGE = 3650
+
+
+def bucket_start(day, granularity):
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_bucket(day, granularity):
+    if granularity == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if granularity == 'week':
+        return day + timedelta(weeks=1)
+    return day + timedelta(days=1)
+
+
+def buckets(start, end, granularity):
+    """Bucket start dates from the bucket holding ``start`` to the one holding ``end``."""
+    result = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        result.append(current)
+        current = next_bucket(current, granularity)
+    return result
+
+
+class Metric:
+    """
+    One series: ``queryset(districts, projects)`` returns the filtered rows,
+    ``date_field`` is bucketed and ``aggregate`` computed per bucket.
+    """
+
+    def __init__(self, key, name, color, queryset, date_field, aggregate, convert=float):
+        self.key = key
+        self.name = name
+        self.color = color
+        self.queryset = queryset
+        self.date_field = date_field
+        self.aggregate = aggregate
+        self.convert = convert
+
+    def by_bucket(self, start, granularity, districts, projects):
+        trunc, _ = GRANULARITIES[granularity]
+        queryset = self.queryset(districts, projects)
+        field = queryset.model._meta.get_field(self.date_field)
+        if field.get_internal_type() == 'DateTimeField':
+            since = timezone.make_aware(datetime.combine(start, time.min))
+        else:
+            since = start
+        rows = (
+            queryset.filter(**{f'{self.date_field}__gte': since})
+            .annotate(bucket=trunc(self.date_field, output_field=DateField()))
+            .order_by()
+            .values('bucket')
+            .annotate(value=self.aggregate)
+            .values_list('bucket', 'value')
+        )
+        return dict(rows)
+
+
+def _farmer_profiles(districts, projects):
+    queryset = UserProfile.objects.filter(role='farmer')
+    if districts:
+        queryset = queryset.filter(district_id__in=districts)
+    if projects:
+        queryset = queryset.filter(farmer_profile__projectparticipation__project_id__in=projects)
+    return queryset
+
+
+def _disbursements(districts, projects):
+    queryset = LoanDisbursement.objects.all()
+    if districts:
+        queryset = queryset.filter(loan__farmer__district_id__in=districts)
+    if projects:
+        queryset = queryset.filter(loan__project_id__in=projects)
+    return queryset
+
+
+def _farms(districts, projects):
+    queryset = Farm.objects.all()
+    if districts:
+        queryset = queryset.filter(farmer__district_id__in=districts)
+    if projects:
+        queryset = queryset.filter(project_id__in=projects)
+    return queryset
+
+
+def _farmers_with_yield(districts, projects):
+    queryset = Farmer.objects.filter(estimated_yield_tons__isnull=False)
+    if districts:
+        queryset = queryset.filter(district_id__in=districts)
+    if projects:
+        # A subquery, a join would count farmers in several projects more than once
+        queryset = queryset.filter(id__in=ProjectParticipation.objects.filter(
+            project_id__in=projects
+        ).values('farmer_id'))
+    return queryset
+
+
+METRICS = [
+    Metric('farmers', 'Farmers Registered', '#4e73df', _farmer_profiles, 'created_at',
+           Count('id', distinct=True), convert=int),
+    Metric('loans', 'Loans Disbursed (GHS)', '#1cc88a', _disbursements, 'disbursement_date',
+           Sum('amount')),
+    Metric('hectares', 'Hectares Cultivated', '#36b9cc', _farms, 'registration_date',
+           Sum('area_hectares')),
+    Metric('yield', 'Avg Yield (tons/ha)', '#f6c23e', _farmers_with_yield, 'created_at',
+           Avg('estimated_yield_tons'), convert=lambda value: round(value, 2)),
+]
+
+
+def performance_series(time_range=DEFAULT_TIME_RANGE, granularity='month', districts=(), projects=()):
+    """
+    Chart payload with one series per metric over the last ``time_range``
+    days, bucketed by ``granularity``. Raises ValueError on bad arguments.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'granularity must be one of {", ".join(GRANULARITIES)}')
+    if not 1 <= time_range <= MAX_TIME_RANGE:
+        raise ValueError(f'time_range must be between 1 and {MAX_TIME_RANGE} days')
+
+    districts = sorted({str(d) for d in districts if d})
+    projects = sorted({str(p) for p in projects if p})
+    today = timezone.localdate()
+    periods = buckets(today - timedelta(days=time_range - 1), today, granularity)
+    _, label = GRANULARITIES[granularity]
+    series = []
+    for metric in METRICS:
+        values = metric.by_bucket(periods[0], granularity, districts, projects)
+        series.append({
+            'name': metric.name,
+            'type': metric.key,
+            'data': [
+                metric.convert(values[period]) if values.get(period) is not None else 0
+                for period in periods
+            ],
+            'color': metric.color,
+        })
+
+    return {
+        'months': [period.strftime(label) for period in periods],
+        'periods': [period.isoformat() for period in periods],
+        'granularity': granularity,
+        'time_range': time_range,
+        'series': series,
+    }
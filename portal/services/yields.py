@@ -0,0 +1,118 @@
+"""
+Typed yields parsed from the free text yield fields.
+
+``Farmer.estimated_yield`` and ``yield_in_pre_season`` are entered as text
+("2.5 tons", "800kg", "1,200 kg/ha", "3-4 t"). ``parse_yield`` reads the
+quantity and unit and normalizes it to tons. Farmer.save stores the result
+in the ``*_value``, ``*_unit`` and ``*_tons`` columns next to each text
+field, so analytics aggregate the tons column in SQL. Text without a
+number, or with a unit that isn't a weight (bags, crates), has no tons.
+``manage.py backfill_farmer_yields`` fills existing rows and lists those.
+"""
+import re
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+KG = 'kg'
+TON = 'ton'
+
+UNIT_CHOICES = (
+    (KG, 'Kilograms'),
+    (TON, 'Tons'),
+)
+
+# Written unit: (unit, tons per unit)
+UNITS = {
+    'kg': (KG, Decimal('0.001')),
+    'kgs': (KG, Decimal('0.001')),
+    'kilo': (KG, Decimal('0.001')),
+    'kilos': (KG, Decimal('0.001')),
+    'kilogram': (KG, Decimal('0.001')),
+    'kilograms': (KG, Decimal('0.001')),
+    't': (TON, Decimal('1')),
+    'mt': (TON, Decimal('1')),
+    'ton': (TON, Decimal('1')),
+    'tons': (TON, Decimal('1')),
+    'tonne': (TON, Decimal('1')),
+    'tonnes': (TON, Decimal('1')),
+}
+
+# Fields parsed on save: text field -> (value, unit, tons) columns
+YIELD_FIELDS = {
+    'estimated_yield': ('estimated_yield_value', 'estimated_yield_unit', 'estimated_yield_tons'),
+    'yield_in_pre_season': ('yield_in_pre_season_value', 'yield_in_pre_season_unit', 'yield_in_pre_season_tons'),
+}
+
+# The integer part is optional, ".5 t" is half a ton
+NUMBER = r'\d*[.,]?\d+(?:[.,]\d+)*'
+YIELD_RE = re.compile(
+    rf'^(?P<value>{NUMBER})(?:\s*(?:-|to)\s*(?P<high>{NUMBER}))?'
+    r'\s*(?P<unit>[a-z]+\.?)?'
+    r'\s*(?:(?:/|per)\s*(?:ha|hectares?))?$'
+)
+
+# Largest value and precision the ``*_value`` columns hold
+MAX_VALUE = Decimal('999999999')
+PLACES = Decimal('0.001')
+
+Yield = namedtuple('Yield', 'value unit tons')
+EMPTY = Yield(None, None, None)
+
+
+def _number(text):
+    """``1,200`` is twelve hundred, ``2,5`` two and a half."""
+    if re.fullmatch(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?', text):
+        text = text.replace(',', '')
+    else:
+        text = text.replace(',', '.')
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def parse_yield(text):
+    """
+    ``Yield(value, unit, tons)`` for a free text yield, ``EMPTY`` when it
+    can't be read. A range yields its midpoint. A number without a unit is
+    taken as tons, as the dashboard always did.
+    """
+    if text is None:
+        return EMPTY
+    match = YIELD_RE.match(str(text).strip().lower())
+    if not match:
+        return EMPTY
+
+    value = _number(match['value'])
+    if value is None:
+        return EMPTY
+    if match['high']:
+        high = _number(match['high'])
+        if high is None or high < value:
+            return EMPTY
+        value = (value + high) / 2
+    if value > MAX_VALUE:
+        return EMPTY
+
+    unit, per_ton = UNITS.get((match['unit'] or 'ton').rstrip('.'), (None, None))
+    if unit is None:
+        return EMPTY
+    return Yield(value.quantize(PLACES), unit, float(value * per_ton))
+
+
+def is_unparsed(text, parsed):
+    """Text was entered but has no tons, what the backfill reports."""
+    return bool(text and str(text).strip()) and parsed.tons is None
+
+
+def apply(farmer, fields=YIELD_FIELDS):
+    """Set the typed columns of ``farmer`` from its text fields."""
+    for field in fields:
+        parsed = parse_yield(getattr(farmer, field))
+        for column, value in zip(YIELD_FIELDS[field], parsed):
+            setattr(farmer, column, value)
+
+
+def typed_columns(fields):
+    """The typed columns belonging to the text fields among ``fields``."""
+    return [column for field in fields if field in YIELD_FIELDS for column in YIELD_FIELDS[field]]
@@ -0,0 +1,161 @@
+"""
+Model signal handlers for the portal app.
+
+Keeps derived data (vector tiles, farm clusters, boundary layers, the
+in-memory district resolver, loan ledger balances and schedules, KPI
+snapshots and the dashboard response cache) in step with the tables
+they are built from. Connected in PortalConfig.ready().
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from portal.models import (
+    District, Farm, Farmer, Loan, LoanDisbursement, LoanRepayment, ProjectParticipation, Region
+)
+from portal.services import amortization, boundaries, clustering, dashboard_cache, kpi, ledger, tiles
+from portal.services.district_resolver import district_resolver
+
+CLUSTER_FIELDS = ('location', 'status', 'area_hectares', 'is_deleted')
+
+
+@receiver(pre_save, sender=Farm)
+def remember_farm_position(sender, instance, **kwargs):
+    """Keep the stored copy of the farm so post_save can tell what moved."""
+    instance._previous_state = None
+    if instance.pk:
+        instance._previous_state = Farm.all_objects.filter(pk=instance.pk).values(
+            'boundary', 'location', *CLUSTER_FIELDS[1:]
+        ).first()
+
+
+@receiver(post_save, sender=Farm)
+def refresh_farm_map_caches(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_state', None)
+
+    previous_extent = None
+    if previous:
+        previous_farm = Farm(boundary=previous['boundary'], location=previous['location'])
+        previous_extent = tiles.farm_extent(previous_farm)
+
+    cluster_changed = created or previous is None or any(
+        previous[field] != getattr(instance, field) for field in CLUSTER_FIELDS
+    )
+    locations = []
+    if cluster_changed:
+        if previous and previous['location']:
+            locations.append(previous['location'])
+        if instance.location:
+            locations.append(instance.location)
+
+    def refresh():
+        tiles.invalidate_farm_tiles(instance, previous_extent)
+        for point in locations:
+            clustering.invalidate_location(point.x, point.y)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Farm)
+def drop_deleted_farm_from_map(sender, instance, **kwargs):
+    def refresh():
+        tiles.invalidate_farm_tiles(instance)
+        if instance.location:
+            clustering.invalidate_location(instance.location.x, instance.location.y)
+
+    transaction.on_commit(refresh)
+
+
+def refresh_map_caches_for(farms):
+    """
+    Map cache refresh for farms written without model signals (bulk_create).
+    Call after the transaction has committed.
+    """
+    for farm in farms:
+        tiles.invalidate_farm_tiles(farm)
+        if farm.location:
+            clustering.invalidate_location(farm.location.x, farm.location.y)
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def refresh_boundary_caches(sender, **kwargs):
+    transaction.on_commit(boundaries.invalidate_layers)
+    transaction.on_commit(district_resolver.invalidate)
+    transaction.on_commit(kpi.update_regions)
+
+
+@receiver(pre_save, sender=LoanDisbursement)
+@receiver(pre_save, sender=LoanRepayment)
+def remember_ledger_loan(sender, instance, **kwargs):
+    """Keep the stored loan id so moving a row to another loan refreshes both."""
+    instance._previous_loan_id = None
+    if instance.pk:
+        instance._previous_loan_id = sender.all_objects.filter(pk=instance.pk).values_list(
+            'loan_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=LoanDisbursement)
+@receiver(post_save, sender=LoanRepayment)
+@receiver(post_delete, sender=LoanDisbursement)
+@receiver(post_delete, sender=LoanRepayment)
+def refresh_loan_ledger(sender, instance, **kwargs):
+    ledger.refresh_loan_balances([instance.loan_id, getattr(instance, '_previous_loan_id', None)])
+
+
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=LoanDisbursement)
+@receiver(post_save, sender=LoanRepayment)
+@receiver(post_delete, sender=LoanDisbursement)
+@receiver(post_delete, sender=LoanRepayment)
+def refresh_loan_schedule(sender, instance, **kwargs):
+    """Rebuild the installments of the loan (and the one a row moved from) after commit."""
+    if sender is Loan:
+        loan_ids = [instance.pk]
+    else:
+        loan_ids = [instance.loan_id, getattr(instance, '_previous_loan_id', None)]
+    transaction.on_commit(lambda: amortization.refresh_schedules(loan_ids))
+
+
+@receiver(pre_save, sender=Farmer)
+@receiver(pre_save, sender=Farm)
+@receiver(pre_save, sender=ProjectParticipation)
+@receiver(pre_save, sender=Loan)
+@receiver(pre_save, sender=LoanDisbursement)
+@receiver(pre_save, sender=LoanRepayment)
+def remember_kpi_state(sender, instance, **kwargs):
+    """Keep the stored snapshot day (and tracked fields) so a move refreshes both days."""
+    instance._previous_kpi_state = None
+    if instance.pk:
+        instance._previous_kpi_state = sender.all_objects.filter(pk=instance.pk).values(
+            *kpi.tracked_fields(sender)
+        ).first()
+
+
+@receiver(post_save, sender=Farmer)
+@receiver(post_save, sender=Farm)
+@receiver(post_save, sender=ProjectParticipation)
+@receiver(post_save, sender=Loan)
+@receiver(post_save, sender=LoanDisbursement)
+@receiver(post_save, sender=LoanRepayment)
+@receiver(post_delete, sender=Farmer)
+@receiver(post_delete, sender=Farm)
+@receiver(post_delete, sender=ProjectParticipation)
+@receiver(post_delete, sender=Loan)
+@receiver(post_delete, sender=LoanDisbursement)
+@receiver(post_delete, sender=LoanRepayment)
+def refresh_kpi_snapshots(sender, instance, **kwargs):
+    days = kpi.affected_days(sender, instance, getattr(instance, '_previous_kpi_state', None))
+    if days:
+        transaction.on_commit(lambda: kpi.refresh_days(days))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_dashboard_cache(sender, **kwargs):
+    """Drop the cached dashboard responses that read the changed model."""
+    if sender in dashboard_cache.TRACKED_MODELS:
+        transaction.on_commit(lambda: dashboard_cache.invalidate(sender))
@@ -1,3 +1,93 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from portal.services import amortization, statements, yields
+
+
+class ParseYieldTests(SimpleTestCase):
+    def assertYield(self, text, value, unit, tons):
+        parsed = yields.parse_yield(text)
+        self.assertEqual(parsed.value, Decimal(value))
+        self.assertEqual(parsed.unit, unit)
+        self.assertAlmostEqual(parsed.tons, tons)
+
+    def test_units(self):
+        self.assertYield('2.5 tons', '2.5', yields.TON, 2.5)
+        self.assertYield('800kg', '800', yields.KG, 0.8)
+        self.assertYield('1,200 kg/ha', '1200', yields.KG, 1.2)
+
+    def test_range_is_its_midpoint(self):
+        self.assertYield('3-4 t', '3.5', yields.TON, 3.5)
+
+    def test_bare_number_is_tons(self):
+        self.assertYield('12', '12', yields.TON, 12)
+
+    def test_no_leading_zero(self):
+        self.assertYield('.5 t', '0.5', yields.TON, 0.5)
+
+    def test_decimal_comma(self):
+        self.assertYield('2,5 t', '2.5', yields.TON, 2.5)
+
+    def test_unparsed(self):
+        for text in ('50 bags', '10 crates', 'good harvest', '', None):
+            self.assertEqual(yields.parse_yield(text), yields.EMPTY)
+        self.assertTrue(yields.is_unparsed('50 bags', yields.parse_yield('50 bags')))
+        self.assertFalse(yields.is_unparsed('', yields.parse_yield('')))
+
+
+class ParseAmountTests(SimpleTestCase):
+    def test_credits(self):
+        self.assertEqual(statements.parse_amount('GHS 1,200.00'), Decimal('1200.00'))
+        self.assertEqual(statements.parse_amount('50.00 CR'), Decimal('50.00'))
+        self.assertEqual(statements.parse_amount('.5'), Decimal('0.50'))
+
+    def test_debits_are_negative(self):
+        for text in ('-50.00', 'GHS -50.00', '-GHS 50.00', '(50.00)', '50.00 DR', '50.00-'):
+            self.assertEqual(statements.parse_amount(text), Decimal('-50.00'), text)
+
+    def test_malformed_is_none(self):
+        for text in ('1e5', '1.200,50', '12,00', '-(50)', '- 50 DR', 'abc', '', None):
+            self.assertIsNone(statements.parse_amount(text), text)
+
+
+class ScheduleArrearsTests(SimpleTestCase):
+    def schedule(self, start, terms=3):
+        """A schedule of one 300.00 loan at no interest started on ``start``."""
+        principal, interest = amortization.amortize(
+            np.array([30000]), np.array([0.0]), np.array([terms]), np.array([False])
+        )
+        return amortization.Schedule(
+            loan_ids=np.array([1]),
+            start=np.array([start], dtype='datetime64[D]'),
+            number=np.arange(1, terms + 1)[None, :],
+            due_date=amortization.due_dates(np.array([start], dtype='datetime64[D]'), terms),
+            principal=principal,
+            interest=interest,
+            amount=principal + interest,
+            active=np.ones((1, terms), dtype=bool),
+        )
+
+    def arrears(self, as_of, paid=0):
+        payments = np.array([0] if paid else [], dtype=np.int64)
+        amounts = np.array([paid] if paid else [], dtype=np.int64)
+        return amortization.schedule_arrears(self.schedule(date(2026, 1, 15)), payments, amounts, as_of)
+
+    def test_installment_due_today_is_not_in_arrears(self):
+        result = self.arrears(date(2026, 2, 15))
+        self.assertEqual(result.overdue[0], 0)
+        self.assertEqual(result.installments_overdue[0], 0)
+        self.assertEqual(result.days_past_due[0], 0)
+
+    def test_installment_past_due(self):
+        result = self.arrears(date(2026, 2, 16))
+        self.assertEqual(result.overdue[0], 10000)
+        self.assertEqual(result.installments_overdue[0], 1)
+        self.assertEqual(result.days_past_due[0], 1)
+
+    def test_paid_installment(self):
+        result = self.arrears(date(2026, 2, 16), paid=10000)
+        self.assertEqual(result.overdue[0], 0)
+        self.assertEqual(result.outstanding[0], 20000)
@@ -8,6 +8,7 @@ from portal.views.dashboard import *
 from portal.views.monitoring import *
 from portal.views.map import *
 from portal.views.base_data import *
+from portal.views.data_exports import *
 from django.contrib.auth import views as auth_views
 
 
@@ -24,6 +25,7 @@ urlpatterns = [
     path('dashboard/overview/', monitoring_dashboard, name='monitoring_dashboard'),
    
     path('api/performance-analysis/', performance_analysis_api, name='performance_analysis_api'),
+    path('api/regional-rollup/', regional_rollup_api, name='regional_rollup_api'),
     path('api/projects/', project_list, name='project_list'),
     path('api/farmers/', farmer_list, name='farmer_list'),
     path('api/loans/', loan_management, name='loan_management'),
@@ -47,6 +49,11 @@ urlpatterns = [
     path('farmers/districts/',get_districts, name='get_districts'),
     path('farmers/export/',farmer_export, name='farmer_export'),
 
+    # Background exports (manage.py run_export_worker)
+    path('exports/request/', request_data_export, name='request_data_export'),
+    path('exports/<int:export_id>/status/', data_export_status, name='data_export_status'),
+    path('exports/<int:export_id>/download/', data_export_download, name='data_export_download'),
+
      # Farm management main page
     path('farmers/farms/', farm_management, name='farm_management'),
 
@@ -140,9 +147,13 @@ urlpatterns = [
     path('loans/applications/approve/<int:loan_id>/', approve_loan, name='approve_loan'),
     path('loans/applications/disburse/<int:loan_id>/', disburse_loan, name='disburse_loan'),
     path('loans/applications/reject/<int:loan_id>/', reject_loan, name='reject_loan'),
+    path('loans/applications/bulk/<str:action>/', bulk_loan_action, name='bulk_loan_action'),
     
     # Loan data and utilities
     path('loans/applications/stats/', get_loan_stats, name='get_loan_stats'),
+    path('loans/applications/schedule/<int:loan_id>/', get_loan_schedule, name='get_loan_schedule'),
+    path('loans/applications/arrears/', get_portfolio_arrears, name='get_portfolio_arrears'),
+    path('loans/portfolio/trends/', get_portfolio_trends, name='get_portfolio_trends'),
     path('loans/applications/export/', loan_export, name='loan_export'),
     path('loans/applications/available-farmers/', get_available_farmers_for_loan, name='get_available_farmers_for_loan'),
     path('loans/applications/active-projects/', get_active_projects, name='get_active_projects'),
@@ -174,6 +185,12 @@ urlpatterns = [
     path('repayments/export/', repayment_export, name='repayment_export'),
     path('repayments/repayable-loans/', get_repayable_loans, name='get_repayable_loans'),
 
+    # Statement import and reconciliation
+    path('repayments/statements/import/', import_statement, name='import_statement'),
+    path('repayments/statements/<int:statement_id>/', statement_detail, name='statement_detail'),
+    path('repayments/statements/<int:statement_id>/review/', review_statement_lines, name='review_statement_lines'),
+    path('repayments/statements/<int:statement_id>/confirm/', confirm_statement, name='confirm_statement'),
+
     ##################################################################################################################
     path('monitoring/', render_monitoring_page, name='render_monitoring_page'),
     path('visits/', monitoring_visit_list, name='monitoring_visit_list'),
@@ -195,6 +212,8 @@ urlpatterns = [
 
     path('map/', interactive_map, name='interactive_map'),
     path('map/data/', get_farm_data, name='get_farm_data'),
+    path('map/tiles/farms/<int:z>/<int:x>/<int:y>.pbf', farm_tiles, name='farm_tiles'),
+    path('map/clusters/', get_farm_clusters, name='get_farm_clusters'),
     path('map/farm/<int:farm_id>/update-boundary/', update_farm_boundary, name='update_farm_boundary'),
     path('map/farm/<int:farm_id>/validate-boundary/', validate_farm_boundary, name='validate_farm_boundary'),
     # path('map/search/', search_farms, name='search_farms'),
@@ -7,6 +7,7 @@ from portal.models import (
     TreeDensityData, CropHealthData, IrrigationSource, 
     SoilTypeArea, ClimateZone, RoadNetwork, Region, District
 )
+from portal.services.map_query import Viewport, latlng_path, latlng_ring, load_geojson
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -290,21 +291,51 @@ def get_regions_list(request):
             'error': str(e)
         }, status=500)
 
+# Row caps used when no bbox is given (initial map load without a viewport)
+AGRICULTURAL_LAYER_LIMITS = {
+    'tree_density': 100,
+    'crop_health': 100,
+    'irrigation_sources': 50,
+    'soil_types': 20,
+    'climate_zones': 10,
+    'roads': 50,
+}
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_all_agricultural_data(request):
-    """Get all agricultural data in one endpoint for initial map load"""
+    """
+    Get all agricultural data in one endpoint for the map.
+
+    With ``bbox``/``zoom`` only the features in the viewport are returned and
+    polygons/lines are simplified for the zoom. ``layers`` picks which of the
+    response keys to fill, e.g. ``layers=soil_types,roads``.
+    """
+    try:
+        viewport = Viewport.from_request(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
     try:
         region_id = request.GET.get('region_id')
-        
-        # Get all data types
-        tree_data = list(TreeDensityData.objects.all()[:100])  # Limit for performance
-        crop_data = list(CropHealthData.objects.all()[:100])
-        irrigation_data = list(IrrigationSource.objects.all()[:50])
-        soil_data = list(SoilTypeArea.objects.all()[:20])
-        climate_data = list(ClimateZone.objects.all()[:10])
-        road_data = list(RoadNetwork.objects.all()[:50])
-        
+
+        def layer_rows(model, geometry_field, fields, layer, geojson=False):
+            if not viewport.wants(layer):
+                return []
+            queryset = model.objects.all()
+            if region_id:
+                queryset = queryset.filter(region_id=region_id)
+            queryset = viewport.filter(queryset, geometry_field)
+            if geojson:
+                queryset = queryset.annotate(geometry_json=viewport.geojson(geometry_field))
+                fields = fields + ('geometry_json',)
+            else:
+                fields = fields + (geometry_field,)
+            queryset = queryset.values('id', 'region__region', *fields)
+            if not viewport.is_bounded:
+                queryset = queryset[:AGRICULTURAL_LAYER_LIMITS[layer]]
+            return queryset
+
         response_data = {
             'tree_density': [],
             'crop_health': [],
@@ -315,82 +346,67 @@ def get_all_agricultural_data(request):
         }
         
         # Process tree density data
-        for item in tree_data:
+        for item in layer_rows(TreeDensityData, 'location', ('density', 'trees_per_hectare'), 'tree_density'):
             response_data['tree_density'].append({
-                'id': item.id,
-                'lat': item.location.y if item.location else None,
-                'lng': item.location.x if item.location else None,
-                'density': item.density,
-                'trees_per_hectare': item.trees_per_hectare,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'lat': item['location'].y if item['location'] else None,
+                'lng': item['location'].x if item['location'] else None,
+                'density': item['density'],
+                'trees_per_hectare': item['trees_per_hectare'],
+                'region': item['region__region']
             })
         
         # Process crop health data
-        for item in crop_data:
+        for item in layer_rows(CropHealthData, 'location', ('ndvi', 'health'), 'crop_health'):
             response_data['crop_health'].append({
-                'id': item.id,
-                'lat': item.location.y if item.location else None,
-                'lng': item.location.x if item.location else None,
-                'ndvi': float(item.ndvi) if item.ndvi else None,
-                'health': item.health,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'lat': item['location'].y if item['location'] else None,
+                'lng': item['location'].x if item['location'] else None,
+                'ndvi': float(item['ndvi']) if item['ndvi'] else None,
+                'health': item['health'],
+                'region': item['region__region']
             })
         
         # Process irrigation data
-        for item in irrigation_data:
+        for item in layer_rows(IrrigationSource, 'location', ('source_type', 'capacity'), 'irrigation_sources'):
             response_data['irrigation_sources'].append({
-                'id': item.id,
-                'lat': item.location.y if item.location else None,
-                'lng': item.location.x if item.location else None,
-                'type': item.source_type,
-                'capacity': item.capacity,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'lat': item['location'].y if item['location'] else None,
+                'lng': item['location'].x if item['location'] else None,
+                'type': item['source_type'],
+                'capacity': item['capacity'],
+                'region': item['region__region']
             })
         
         # Process soil data
-        for item in soil_data:
-            coords = []
-            if item.boundary:
-                for coord in item.boundary.coords[0]:
-                    coords.append([coord[1], coord[0]])
-            
+        for item in layer_rows(SoilTypeArea, 'boundary', ('soil_type', 'fertility'), 'soil_types', geojson=True):
             response_data['soil_types'].append({
-                'id': item.id,
-                'coords': coords,
-                'type': item.soil_type,
-                'fertility': item.fertility,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'coords': latlng_ring(load_geojson(item['geometry_json'])),
+                'type': item['soil_type'],
+                'fertility': item['fertility'],
+                'region': item['region__region']
             })
         
         # Process climate data
-        for item in climate_data:
-            coords = []
-            if item.boundary:
-                for coord in item.boundary.coords[0]:
-                    coords.append([coord[1], coord[0]])
-            
+        for item in layer_rows(ClimateZone, 'boundary', ('zone_name', 'rainfall'), 'climate_zones', geojson=True):
             response_data['climate_zones'].append({
-                'id': item.id,
-                'coords': coords,
-                'zone': item.zone_name,
-                'rainfall': item.rainfall,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'coords': latlng_ring(load_geojson(item['geometry_json'])),
+                'zone': item['zone_name'],
+                'rainfall': item['rainfall'],
+                'region': item['region__region']
             })
         
         # Process road data
-        for item in road_data:
-            coords = []
-            if item.path:
-                for coord in item.path.coords:
-                    coords.append([coord[1], coord[0]])
-            
+        for item in layer_rows(RoadNetwork, 'path', ('road_type', 'condition', 'name'), 'roads', geojson=True):
             response_data['roads'].append({
-                'id': item.id,
-                'coords': coords,
-                'type': item.road_type,
-                'condition': item.condition,
-                'name': item.name,
-                'region': item.region.name if item.region else None
+                'id': item['id'],
+                'coords': latlng_path(load_geojson(item['geometry_json'])),
+                'type': item['road_type'],
+                'condition': item['condition'],
+                'name': item['name'],
+                'region': item['region__region']
             })
         
         return JsonResponse({
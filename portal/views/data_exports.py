@@ -0,0 +1,79 @@
+# data_exports/views.py
+import json
+from django.http import FileResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+from django.contrib.auth.decorators import login_required
+from portal.models import DataExport
+from portal.services import export_jobs
+
+
+def _user_export(request, export_id):
+    """The export if the user requested it (staff see every export)"""
+    exports = DataExport.objects.all()
+    if not request.user.is_staff:
+        exports = exports.filter(requested_by=request.user)
+    return get_object_or_404(exports, id=export_id)
+
+
+@require_http_methods(["POST"])
+@login_required
+def request_data_export(request):
+    """Queue an export for the background worker"""
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+        filters = data.get('filters') or {}
+        if isinstance(filters, str):
+            filters = json.loads(filters)
+
+        export = export_jobs.queue_export(
+            request.user, data.get('model_name'), data.get('format', 'csv'), filters
+        )
+        return JsonResponse({
+            'success': True,
+            'message': 'Export queued',
+            'export_id': export.id,
+        })
+    except (export_jobs.ExportError, ValueError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@login_required
+def data_export_status(request, export_id):
+    """Progress of a queued export"""
+    export = _user_export(request, export_id)
+    return JsonResponse({
+        'success': True,
+        'data': {
+            'id': export.id,
+            'model_name': export.model_name,
+            'format': export.export_format,
+            'status': export.status,
+            'progress': export.progress,
+            'rows_written': export.rows_written,
+            'total_rows': export.total_rows,
+            'requested_at': export.requested_at.isoformat(),
+            'completed_at': export.completed_at.isoformat() if export.completed_at else None,
+            'error': export.error_message,
+            'download_url': (
+                reverse('data_export_download', args=[export.id]) if export.status == 'completed' and export.file else None
+            ),
+        }
+    })
+
+
+@require_http_methods(["GET"])
+@login_required
+def data_export_download(request, export_id):
+    """Download a finished export file"""
+    export = _user_export(request, export_id)
+    if export.status != 'completed' or not export.file:
+        return JsonResponse({'success': False, 'error': 'Export is not ready'}, status=404)
+    try:
+        return FileResponse(export.file.open('rb'), as_attachment=True, filename=export.file.name.rsplit('/', 1)[-1])
+    except FileNotFoundError:
+        return JsonResponse({'success': False, 'error': 'Export file no longer exists'}, status=404)
@@ -9,6 +9,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
 from portal.models import Farmer, Farm, District, Region, UserProfile
+from portal.services import exports
 
 @login_required
 def farmer_management(request):
@@ -573,71 +574,10 @@ def get_regions(request):
 @require_http_methods(["GET"])
 @login_required
 def farmer_export(request):
-    """Export farmers data in various formats - FIXED: Use correct field names"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    
+    """Export farmers data in various formats"""
     format_type = request.GET.get('format', 'csv')
-    farmers = Farmer.objects.select_related(
-        'user_profile__user', 
-        'user_profile__district__region_foreignkey'
-    ).all()
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="farmers_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'First Name', 'Last Name', 'National ID', 'Email', 'Phone', 
-            'District', 'Region', 'Experience (years)',
-            'Primary Crop', 'Registration Date', 'Status'
-        ])
-        
-        for farmer in farmers:
-            district = farmer.user_profile.district
-            district_name = district.district if district else ''
-            region_name = district.region_foreignkey.region if district and district.region_foreignkey else ''
-            
-            writer.writerow([
-                farmer.user_profile.user.first_name,
-                farmer.user_profile.user.last_name,
-                farmer.national_id,
-                farmer.user_profile.user.email,
-                farmer.user_profile.phone_number or '',
-                district_name,
-                region_name,
-                farmer.years_of_experience,
-                farmer.primary_crop,
-                farmer.user_profile.user.date_joined.strftime('%Y-%m-%d'),
-                'Active' if farmer.user_profile.user.is_active else 'Inactive'
-            ])
-        
-        return response
-    
-    elif format_type == 'json':
-        data = []
-        for farmer in farmers:
-            district = farmer.user_profile.district
-            district_name = district.district if district else ''
-            region_name = district.region_foreignkey.region if district and district.region_foreignkey else ''
-            
-            data.append({
-                'first_name': farmer.user_profile.user.first_name,
-                'last_name': farmer.user_profile.user.last_name,
-                'national_id': farmer.national_id,
-                'email': farmer.user_profile.user.email,
-                'phone': farmer.user_profile.phone_number,
-                'district': district_name,
-                'region': region_name,
-                'experience_years': farmer.years_of_experience,
-                'primary_crop': farmer.primary_crop,
-                'registration_date': farmer.user_profile.user.date_joined.strftime('%Y-%m-%d'),
-                'status': 'Active' if farmer.user_profile.user.is_active else 'Inactive'
-            })
-        
-        return JsonResponse({'farmers': data})
     
-    else:
-        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
\ No newline at end of file
+    response = exports.streaming_response('farmers', format_type, request.GET)
+    if response is None:
+        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
+    return response
@@ -10,6 +10,10 @@ from django.contrib import messages
 from django.core.serializers import serialize
 from django.utils import timezone
 from portal.models import Farm, Farmer, District, Region, FarmVisit, FarmCrop, MangoVariety
+from portal.services import dashboard_cache, exports
+from portal.services.district_resolver import district_resolver, farm_location_codes
+from portal.services.map_query import Viewport
+from portal.services.sequences import allocate_farm_codes_bulk
 
 @login_required
 def farm_management(request):
@@ -238,30 +242,41 @@ def farrm_get_farm_geojson(request, farm_id):
 @require_http_methods(["GET"])
 @login_required
 def get_all_farms_geojson(request):
-    """Get GeoJSON data for all farms"""
-    farms = Farm.objects.all()
-    
+    """
+    Get GeoJSON data for all farms.
+
+    Pass ``bbox`` (west,south,east,north) to only get the farms in view.
+    """
+    try:
+        viewport = Viewport.from_request(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    farms = viewport.filter(Farm.objects.filter(location__isnull=False), 'location')
+    status_labels = dict(Farm.FARM_STATUS)
+
     features = []
-    for farm in farms:
-        if farm.location:
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [farm.location.x, farm.location.y]
-                },
-                'properties': {
-                    'id': farm.id,
-                    'name': farm.name,
-                    'farm_code': farm.farm_code,
-                    'area_hectares': farm.area_hectares,
-                    'status': farm.status,
-                    'status_display': farm.get_status_display(),
-                    'farmer_name': f"{farm.farmer.user_profile.user.first_name} {farm.farmer.user_profile.user.last_name}",
-                    'farmer_id': farm.farmer.id
-                }
+    for row in farms.values(
+        'id', 'name', 'farm_code', 'area_hectares', 'status', 'location', 'farmer_id',
+        'farmer__user_profile__user__first_name', 'farmer__user_profile__user__last_name'
+    ):
+        features.append({
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [row['location'].x, row['location'].y]
+            },
+            'properties': {
+                'id': row['id'],
+                'name': row['name'],
+                'farm_code': row['farm_code'],
+                'area_hectares': row['area_hectares'],
+                'status': row['status'],
+                'status_display': status_labels.get(row['status'], row['status']),
+                'farmer_name': f"{row['farmer__user_profile__user__first_name']} {row['farmer__user_profile__user__last_name']}",
+                'farmer_id': row['farmer_id']
             }
-            features.append(feature)
+        })
     
     geojson = {
         'type': 'FeatureCollection',
@@ -273,6 +288,38 @@ def get_all_farms_geojson(request):
 
 
 
+def _bulk_farm_point(farm_data):
+    """Point used to place a bulk farm row: boundary centroid, else its location."""
+    from django.contrib.gis.geos import Point, Polygon
+    try:
+        if farm_data.get('boundary') and farm_data['boundary'].get('coordinates'):
+            return Polygon([(float(c[0]), float(c[1])) for c in farm_data['boundary']['coordinates'][0]]).centroid
+        if farm_data.get('location') and farm_data['location'].get('coordinates'):
+            coords = farm_data['location']['coordinates']
+            return Point(float(coords[0]), float(coords[1]))
+        if farm_data.get('latitude') and farm_data.get('longitude'):
+            return Point(float(farm_data['longitude']), float(farm_data['latitude']))
+    except Exception:
+        pass
+    return None
+
+
+def _reserve_bulk_farm_codes(data, farmers):
+    """
+    Resolve every row's district in one pass and reserve a block of farm
+    codes per region/district prefix. Returns {row index: farm code}.
+    """
+    rows = [(index, farm_data) for index, farm_data in enumerate(data) if isinstance(farm_data, dict)]
+    matches = district_resolver.resolve_many([_bulk_farm_point(farm_data) for _, farm_data in rows])
+
+    code_parts = []
+    for (index, farm_data), match in zip(rows, matches):
+        farmer = farmers.get(int(farm_data['farmer_id'])) if str(farm_data.get('farmer_id', '')).isdigit() else None
+        code_parts.append(farm_location_codes(match, farmer))
+
+    return dict(zip([index for index, _ in rows], allocate_farm_codes_bulk(code_parts)))
+
+
 @require_http_methods(["POST"])
 @login_required
 @transaction.atomic
@@ -346,6 +393,13 @@ def create_farms(request):
         created_farms = []
         errors = []
         
+        # Look up farmers, districts and farm codes for the whole batch up front
+        farmers = Farmer.objects.select_related('user_profile__district').in_bulk(
+            [farm_data.get('farmer_id') for farm_data in data
+             if isinstance(farm_data, dict) and str(farm_data.get('farmer_id', '')).isdigit()]
+        )
+        farm_codes = _reserve_bulk_farm_codes(data, farmers)
+        
         for index, farm_data in enumerate(data):
             try:
                 # Required fields for each farm
@@ -361,9 +415,8 @@ def create_farms(request):
                     continue
                 
                 # Check if farmer exists
-                try:
-                    farmer = Farmer.objects.get(id=farm_data['farmer_id'])
-                except Farmer.DoesNotExist:
+                farmer = farmers.get(int(farm_data['farmer_id'])) if str(farm_data['farmer_id']).isdigit() else None
+                if farmer is None:
                     errors.append({
                         'index': index,
                         'name': farm_data.get('name', 'Unknown'),
@@ -424,6 +477,7 @@ def create_farms(request):
                 # Create farm
                 farm = Farm.objects.create(
                     farmer=farmer,
+                    farm_code=farm_codes.get(index),
                     name=farm_data['name'],
                     location=location,
                     boundary=boundary,
@@ -558,6 +612,7 @@ def delete_farm(request):
 
 @require_http_methods(["GET"])
 @login_required
+@dashboard_cache.cached_response('farm_stats')
 def get_farm_stats(request):
     """Get statistics about farms"""
     try:
@@ -675,69 +730,9 @@ def add_farm_crop(request, farm_id):
 @login_required
 def farm_export(request):
     """Export farms data in various formats"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    
     format_type = request.GET.get('format', 'csv')
-    farms = Farm.objects.select_related(
-        'farmer__user_profile__user', 
-        'farmer__user_profile__district__region'
-    ).all()
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="farms_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Farm Code', 'Name', 'Farmer', 'National ID', 'Area (ha)', 
-            'Status', 'Soil Type', 'Irrigation Type', 'Irrigation Coverage (%)',
-            'Registration Date', 'District', 'Region', 'Latitude', 'Longitude'
-        ])
-        
-        for farm in farms:
-            writer.writerow([
-                farm.farm_code,
-                farm.name,
-                f"{farm.farmer.user_profile.user.first_name} {farm.farmer.user_profile.user.last_name}",
-                farm.farmer.national_id,
-                farm.area_hectares,
-                farm.get_status_display(),
-                farm.soil_type or '',
-                farm.irrigation_type or '',
-                farm.irrigation_coverage,
-                farm.registration_date.strftime('%Y-%m-%d'),
-                farm.farmer.user_profile.district.name if farm.farmer.user_profile.district else '',
-                farm.farmer.user_profile.district.region.name if farm.farmer.user_profile.district and farm.farmer.user_profile.district.region else '',
-                farm.location.y if farm.location else '',
-                farm.location.x if farm.location else ''
-            ])
-        
-        return response
-    
-    elif format_type == 'json':
-        data = []
-        for farm in farms:
-            data.append({
-                'farm_code': farm.farm_code,
-                'name': farm.name,
-                'farmer': f"{farm.farmer.user_profile.user.first_name} {farm.farmer.user_profile.user.last_name}",
-                'national_id': farm.farmer.national_id,
-                'area_hectares': farm.area_hectares,
-                'status': farm.status,
-                'status_display': farm.get_status_display(),
-                'soil_type': farm.soil_type,
-                'irrigation_type': farm.irrigation_type,
-                'irrigation_coverage': farm.irrigation_coverage,
-                'registration_date': farm.registration_date.strftime('%Y-%m-%d'),
-                'district': farm.farmer.user_profile.district.name if farm.farmer.user_profile.district else '',
-                'region': farm.farmer.user_profile.district.region.name if farm.farmer.user_profile.district and farm.farmer.user_profile.district.region else '',
-                'latitude': farm.location.y if farm.location else None,
-                'longitude': farm.location.x if farm.location else None
-            })
-        
-        return JsonResponse({'farms': data})
     
-    else:
-        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
\ No newline at end of file
+    response = exports.streaming_response('farms', format_type, request.GET)
+    if response is None:
+        return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=400)
+    return response
@@ -1,5 +1,6 @@
 # loans/views.py
 import json
+from django.contrib.auth.models import User
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
 from django.core.paginator import Paginator
@@ -10,56 +11,24 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from datetime import datetime, timedelta
-from portal.models import Loan, LoanDisbursement, LoanRepayment, Farmer, Project, Staff
+from portal.models import Loan, LoanDisbursement, LoanRepayment, Farmer, Project, Staff, StatementImport
+from portal.services import amortization, dashboard_cache, datatables, exports, loan_workflow, portfolio, statements
 
 @login_required
 def loan_management(request):
     """Main loan management page with tabs"""
     return render(request, 'portal/loans/loan-application.html')
 
-@require_http_methods(["GET"])
-@login_required
-def loan_list(request):
-    """Server-side processing for loans datatable"""
-    draw = int(request.GET.get('draw', 1))
-    start = int(request.GET.get('start', 0))
-    length = int(request.GET.get('length', 10))
-    search_value = request.GET.get('search[value]', '')
-    status_filter = request.GET.get('status')
-    
-    # Base queryset with related data
-    queryset = Loan.objects.select_related(
-        'farmer__user_profile__user', 
+FARMER_NAMES = ('first_name', 'last_name')
+
+LOAN_TABLE = datatables.Table(
+    'loans',
+    Loan.objects.select_related(
+        'farmer__user_profile__user',
         'project',
         'farmer__user_profile__district__region_foreignkey'
-    ).all()
-    
-    # Apply filters
-    if status_filter:
-        queryset = queryset.filter(status=status_filter)
-    
-    # Apply search filter
-    if search_value:
-        queryset = queryset.filter(
-            Q(loan_id__icontains=search_value) |
-            Q(farmer__user_profile__user__first_name__icontains=search_value) |
-            Q(farmer__user_profile__user__last_name__icontains=search_value) |
-            Q(farmer__national_id__icontains=search_value) |
-            Q(purpose__icontains=search_value) |
-            Q(project__name__icontains=search_value) |
-            Q(project__code__icontains=search_value)
-        )
-    
-    # Total records count
-    total_records = Loan.objects.count()
-    total_filtered = queryset.count()
-    
-    # Apply ordering
-    order_column_index = int(request.GET.get('order[0][column]', 0))
-    order_direction = request.GET.get('order[0][dir]', 'asc')
-    
-    # Map column index to model field
-    column_mapping = {
+    ),
+    columns={
         0: 'loan_id',
         1: 'farmer__user_profile__user__first_name',
         2: 'farmer__national_id',
@@ -68,60 +37,48 @@ def loan_list(request):
         5: 'application_date',
         6: 'status',
         7: 'term_months'
-    }
-    
-    order_column = column_mapping.get(order_column_index, 'application_date')
-    if order_direction == 'desc':
-        order_column = f'-{order_column}'
-    
-    queryset = queryset.order_by(order_column)
-    
-    # Apply pagination
-    paginator = Paginator(queryset, length)
-    page_number = (start // length) + 1
-    page_obj = paginator.get_page(page_number)
-    
-    # Prepare data for response
-    data = []
-    for loan in page_obj:
-        # Calculate disbursed amount
-        disbursed_amount = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Calculate repaid amount
-        repaid_amount = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
-        
-        # Calculate outstanding amount
-        outstanding_amount = disbursed_amount - repaid_amount
+    },
+    search=[
+        ('id', None, ('loan_id',)),
+        ('farmer_id', Farmer, ('national_id',)),
+        ('farmer__user_profile__user_id', User, FARMER_NAMES),
+        ('project_id', Project, ('name', 'code')),
+    ],
+)
 
-        data.append({
-            'id': loan.id,
-            'loan_id': loan.loan_id,
-            'farmer_name': f"{loan.farmer.user_profile.user.first_name} {loan.farmer.user_profile.user.last_name}",
-            'farmer_national_id': loan.farmer.national_id,
-            'project_name': loan.project.name if loan.project else 'N/A',
-            'project_code': loan.project.code if loan.project else 'N/A',
-            'amount': float(loan.amount),
-            'purpose': loan.purpose,
-            'application_date': loan.application_date.strftime('%Y-%m-%d'),
-            'approval_date': loan.approval_date.strftime('%Y-%m-%d') if loan.approval_date else 'N/A',
-            'interest_rate': loan.interest_rate,
-            'term_months': loan.term_months,
-            'status': loan.status,
-            'status_display': loan.get_status_display(),
-            'disbursed_amount': float(disbursed_amount),
-            'repaid_amount': float(repaid_amount),
-            'outstanding_amount': float(outstanding_amount),
-            'collateral_details': loan.collateral_details or 'No collateral'
-        })
-    
-    response = {
-        'draw': draw,
-        'recordsTotal': total_records,
-        'recordsFiltered': total_filtered,
-        'data': data
+
+def _loan_row(loan):
+    return {
+        'id': loan.id,
+        'loan_id': loan.loan_id,
+        'farmer_name': f"{loan.farmer.user_profile.user.first_name} {loan.farmer.user_profile.user.last_name}",
+        'farmer_national_id': loan.farmer.national_id,
+        'project_name': loan.project.name if loan.project else 'N/A',
+        'project_code': loan.project.code if loan.project else 'N/A',
+        'amount': float(loan.amount),
+        'purpose': loan.purpose,
+        'application_date': loan.application_date.strftime('%Y-%m-%d'),
+        'approval_date': loan.approval_date.strftime('%Y-%m-%d') if loan.approval_date else 'N/A',
+        'interest_rate': loan.interest_rate,
+        'term_months': loan.term_months,
+        'status': loan.status,
+        'status_display': loan.get_status_display(),
+        'disbursed_amount': float(loan.total_disbursed),
+        'repaid_amount': float(loan.total_repaid),
+        'outstanding_amount': float(loan.outstanding),
+        'collateral_details': loan.collateral_details or 'No collateral'
     }
-    
-    return JsonResponse(response)
+
+
+@require_http_methods(["GET"])
+@login_required
+def loan_list(request):
+    """Server-side processing for loans datatable"""
+    filters = Q()
+    if request.GET.get('status'):
+        filters &= Q(status=request.GET['status'])
+
+    return JsonResponse(LOAN_TABLE.respond(request, _loan_row, filters))
 
 @require_http_methods(["GET"])
 @login_required
@@ -161,9 +118,9 @@ def get_loan_detail(request, loan_id):
                 'created_at': repayment.created_at.strftime('%Y-%m-%d %H:%M')
             })
         
-        # Calculate totals
-        total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
+        # Totals from the loan ledger
+        total_disbursed = loan.total_disbursed
+        total_repaid = loan.total_repaid
         outstanding_amount = loan.amount - total_disbursed
         
         data = {
@@ -234,6 +191,10 @@ def create_loan(request):
             except Project.DoesNotExist:
                 return JsonResponse({'success': False, 'error': 'Project not found'}, status=404)
         
+        interest_method = data.get('interest_method') or 'reducing'
+        if interest_method not in dict(Loan.INTEREST_METHODS):
+            return JsonResponse({'success': False, 'error': 'interest_method must be reducing or flat'}, status=400)
+        
         # Create loan
         loan = Loan.objects.create(
             farmer=farmer,
@@ -242,6 +203,7 @@ def create_loan(request):
             purpose=data['purpose'],
             interest_rate=float(data['interest_rate']),
             term_months=int(data['term_months']),
+            interest_method=interest_method,
             collateral_details=data.get('collateral_details', ''),
             status='applied'
         )
@@ -285,6 +247,10 @@ def update_loan(request, loan_id):
             loan.interest_rate = float(data['interest_rate'])
         if 'term_months' in data:
             loan.term_months = int(data['term_months'])
+        if 'interest_method' in data:
+            if data['interest_method'] not in dict(Loan.INTEREST_METHODS):
+                return JsonResponse({'success': False, 'error': 'interest_method must be reducing or flat'}, status=400)
+            loan.interest_method = data['interest_method']
         if 'collateral_details' in data:
             loan.collateral_details = data['collateral_details']
         if 'application_date' in data:
@@ -455,6 +421,43 @@ def reject_loan(request, loan_id):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
+
+@require_http_methods(["POST"])
+@login_required
+def bulk_loan_action(request, action):
+    """Approve, reject or disburse many loans, by ``loan_ids`` or a ``filter``"""
+    try:
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON body'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'The body must be a JSON object'}, status=400)
+
+        loan_ids = loan_workflow.select_ids(action, data.get('loan_ids'), data.get('filter'))
+        results = loan_workflow.apply(
+            action,
+            loan_ids,
+            request.user,
+            stage=data.get('stage') or 'Initial Disbursement',
+            references=data.get('transaction_references'),
+            notes=data.get('notes', ''),
+        )
+        succeeded = sum(1 for result in results if result['success'])
+
+        return JsonResponse({
+            'success': True,
+            'message': f'{succeeded} of {len(results)} loans {loan_workflow.TRANSITIONS[action][1]}',
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'results': results,
+        })
+
+    except loan_workflow.BulkActionError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 @require_http_methods(["GET"])
 @login_required
 def get_available_farmers_for_loan(request):
@@ -515,6 +518,7 @@ def get_active_projects(request):
 
 @require_http_methods(["GET"])
 @login_required
+@dashboard_cache.cached_response('loan_stats')
 def get_loan_stats(request):
     """Get statistics about loans"""
     try:
@@ -562,7 +566,9 @@ def get_loan_stats(request):
                 'outstanding_amount': float(total_loan_amount - total_disbursed),
                 'avg_loan_amount': float(avg_loan_amount),
                 'recent_loans': recent_loans,
-                'repayment_rate': (float(total_repaid) / float(total_disbursed) * 100) if total_disbursed > 0 else 0
+                'repayment_rate': (float(total_repaid) / float(total_disbursed) * 100) if total_disbursed > 0 else 0,
+                # PAR, aging buckets and roll rates from the latest nightly snapshot
+                'portfolio': portfolio.latest()
             }
         }
         
@@ -573,90 +579,89 @@ def get_loan_stats(request):
 
 @require_http_methods(["GET"])
 @login_required
-def loan_export(request):
-    """Export loans data in various formats"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    
-    format_type = request.GET.get('format', 'csv')
-    status_filter = request.GET.get('status', '')
-    
-    # Base queryset
-    loans = Loan.objects.select_related(
-        'farmer__user_profile__user', 
-        'project'
-    ).prefetch_related('disbursements', 'repayments')
-    
-    # Apply status filter if provided
-    if status_filter:
-        loans = loans.filter(status=status_filter)
+def get_loan_schedule(request, loan_id):
+    """Repayment schedule of a loan with the repayments matched to each installment"""
+    try:
+        loan = Loan.objects.get(id=loan_id)
+    except Loan.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Loan not found'}, status=404)
     
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="loans_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Loan ID', 'Farmer Name', 'National ID', 'Project', 'Amount', 
-            'Purpose', 'Application Date', 'Approval Date', 'Interest Rate',
-            'Term (Months)', 'Status', 'Disbursed Amount', 'Repaid Amount',
-            'Outstanding Amount', 'Collateral Details'
-        ])
+    try:
+        today = timezone.localdate()
+        installments = []
+        for installment in loan.installments.all():
+            balance = installment.amount_due - installment.amount_paid
+            installments.append({
+                'number': installment.number,
+                'due_date': installment.due_date.strftime('%Y-%m-%d'),
+                'principal_due': float(installment.principal_due),
+                'interest_due': float(installment.interest_due),
+                'amount_due': float(installment.amount_due),
+                'amount_paid': float(installment.amount_paid),
+                'paid_date': installment.paid_date.strftime('%Y-%m-%d') if installment.paid_date else None,
+                # Past its due date, the rule amortization.arrears uses
+                'overdue': balance > 0 and installment.due_date < today,
+            })
         
-        for loan in loans:
-            disbursed_amount = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-            repaid_amount = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            writer.writerow([
-                loan.loan_id,
-                f"{loan.farmer.user_profile.user.first_name} {loan.farmer.user_profile.user.last_name}",
-                loan.farmer.national_id,
-                loan.project.name if loan.project else 'N/A',
-                float(loan.amount),
-                loan.purpose,
-                loan.application_date.strftime('%Y-%m-%d'),
-                loan.approval_date.strftime('%Y-%m-%d') if loan.approval_date else 'N/A',
-                loan.interest_rate,
-                loan.term_months,
-                loan.get_status_display(),
-                float(disbursed_amount),
-                float(repaid_amount),
-                float(loan.amount - disbursed_amount),
-                loan.collateral_details or 'No collateral'
-            ])
-        
-        return response
+        summary = amortization.portfolio_arrears(queryset=Loan.objects.filter(id=loan.id))
+        return JsonResponse({
+            'success': True,
+            'loan_id': loan.loan_id,
+            'interest_method': loan.interest_method,
+            'installments': installments,
+            'arrears': summary,
+        })
+        
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+@login_required
+def get_portfolio_arrears(request):
+    """Portfolio arrears as of ?as_of= (default today) and collections expected over the next ?months= months"""
+    try:
+        as_of = datetime.strptime(request.GET['as_of'], '%Y-%m-%d').date() if request.GET.get('as_of') else timezone.localdate()
+        months = min(max(int(request.GET.get('months', 6)), 1), 36)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'as_of must be YYYY-MM-DD and months a number'}, status=400)
     
-    elif format_type == 'json':
-        data = []
-        for loan in loans:
-            disbursed_amount = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-            repaid_amount = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
-            
-            data.append({
-                'loan_id': loan.loan_id,
-                'farmer_name': f"{loan.farmer.user_profile.user.first_name} {loan.farmer.user_profile.user.last_name}",
-                'national_id': loan.farmer.national_id,
-                'project': loan.project.name if loan.project else 'N/A',
-                'amount': float(loan.amount),
-                'purpose': loan.purpose,
-                'application_date': loan.application_date.strftime('%Y-%m-%d'),
-                'approval_date': loan.approval_date.strftime('%Y-%m-%d') if loan.approval_date else 'N/A',
-                'interest_rate': loan.interest_rate,
-                'term_months': loan.term_months,
-                'status': loan.status,
-                'status_display': loan.get_status_display(),
-                'disbursed_amount': float(disbursed_amount),
-                'repaid_amount': float(repaid_amount),
-                'outstanding_amount': float(loan.amount - disbursed_amount),
-                'collateral_details': loan.collateral_details or 'No collateral'
-            })
+    try:
+        until = as_of + timedelta(days=months * 31)
+        return JsonResponse({
+            'success': True,
+            'as_of': as_of.isoformat(),
+            'arrears': amortization.portfolio_arrears(as_of),
+            'expected_collections': amortization.expected_collections(as_of, until),
+        })
         
-        return JsonResponse({'loans': data})
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@require_http_methods(["GET"])
+@login_required
+@dashboard_cache.cached_response('portfolio_trends')
+def get_portfolio_trends(request):
+    """PAR30/60/90, aging buckets and roll rates per snapshot date, optionally per region, district or project"""
+    try:
+        until = datetime.strptime(request.GET['until'], '%Y-%m-%d').date() if request.GET.get('until') else timezone.localdate()
+        since = datetime.strptime(request.GET['since'], '%Y-%m-%d').date() if request.GET.get('since') else until - timedelta(days=90)
+        filters = {key: int(request.GET[key]) for key in ('region', 'district', 'project') if request.GET.get(key)}
+        trends = portfolio.trends(since, until, group_by=request.GET.get('group_by') or None, **filters)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
     
-    else:
+    return JsonResponse({'success': True, 'since': since.isoformat(), 'until': until.isoformat(), 'trends': trends})
+
+@require_http_methods(["GET"])
+@login_required
+def loan_export(request):
+    """Export loans data in various formats"""
+    format_type = request.GET.get('format', 'csv')
+    
+    response = exports.streaming_response('loans', format_type, request.GET)
+    if response is None:
         return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=500)
+    return response
     
 
 
@@ -681,80 +686,71 @@ def disbursement_list_page(request):
     """Loan disbursements page view"""
     return render(request, 'portal/loans/disbursement.html')
 
+DISBURSEMENT_TABLE = datatables.Table(
+    'disbursements',
+    LoanDisbursement.objects.select_related(
+        'loan',
+        'loan__farmer',
+        'loan__farmer__user_profile__user',
+        'loan__project',
+        'disbursed_by',
+        'disbursed_by__user_profile__user'
+    ),
+    columns={
+        0: 'id',
+        1: 'loan__loan_id',
+        2: 'loan__farmer__user_profile__user__first_name',
+        3: 'loan__farmer__national_id',
+        4: 'amount',
+        5: 'disbursement_date',
+        6: 'stage',
+        7: 'transaction_reference',
+        8: 'disbursed_by__user_profile__user__first_name'
+    },
+    search=[
+        ('id', None, ('transaction_reference',)),
+        ('loan_id', Loan, ('loan_id',)),
+        ('loan__farmer_id', Farmer, ('national_id',)),
+        ('loan__farmer__user_profile__user_id', User, FARMER_NAMES),
+        ('disbursed_by__user_profile__user_id', User, FARMER_NAMES),
+    ],
+    default=(5, 'desc'),
+)
+
+
+def _disbursement_row(disbursement):
+    farmer = disbursement.loan.farmer
+    farmer_name = f"{farmer.user_profile.user.first_name} {farmer.user_profile.user.last_name}"
+    disbursed_by_name = f"{disbursement.disbursed_by.user_profile.user.first_name} {disbursement.disbursed_by.user_profile.user.last_name}" if disbursement.disbursed_by else "Not specified"
+
+    return {
+        'id': disbursement.id,
+        'loan_id': disbursement.loan.loan_id,
+        'farmer_name': farmer_name,
+        'farmer_national_id': farmer.national_id,
+        'amount': float(disbursement.amount),
+        'disbursement_date': disbursement.disbursement_date.strftime('%Y-%m-%d'),
+        'stage': disbursement.stage,
+        'transaction_reference': disbursement.transaction_reference or 'Not provided',
+        'disbursed_by': disbursed_by_name,
+        'project_name': disbursement.loan.project.name if disbursement.loan.project else 'N/A',
+        'project_code': disbursement.loan.project.code if disbursement.loan.project else 'N/A',
+        'created_at': disbursement.created_at.strftime('%Y-%m-%d %H:%M'),
+        'updated_at': disbursement.updated_at.strftime('%Y-%m-%d %H:%M'),
+        'notes': disbursement.notes or 'No notes provided'
+    }
+
+
 @require_http_methods(["GET"])
 @login_required
 def disbursement_list(request):
     """Get paginated loan disbursements for DataTables"""
     try:
-        # Get request parameters for DataTables
-        draw = int(request.GET.get('draw', 1))
-        start = int(request.GET.get('start', 0))
-        length = int(request.GET.get('length', 10))
-        search_value = request.GET.get('search[value]', '')
-        loan_id_filter = request.GET.get('loan_id', '')
-        
-        # Base queryset
-        disbursements = LoanDisbursement.objects.select_related(
-            'loan', 
-            'loan__farmer', 
-            'loan__farmer__user_profile',
-            'loan__project',
-            'disbursed_by',
-            'disbursed_by__user_profile'
-        ).order_by('-disbursement_date')
-        
-        # Apply filters
-        if loan_id_filter:
-            disbursements = disbursements.filter(loan_id=loan_id_filter)
-        
-        if search_value:
-            disbursements = disbursements.filter(
-                Q(loan__loan_id__icontains=search_value) |
-                Q(transaction_reference__icontains=search_value) |
-                Q(loan__farmer__user_profile__user__first_name__icontains=search_value) |
-                Q(loan__farmer__user_profile__user__last_name__icontains=search_value) |
-                Q(loan__farmer__national_id__icontains=search_value) |
-                Q(stage__icontains=search_value) |
-                Q(disbursed_by__user_profile__user__first_name__icontains=search_value) |
-                Q(disbursed_by__user_profile__user__last_name__icontains=search_value)
-            )
-        
-        # Get total count
-        total_records = disbursements.count()
-        
-        # Apply pagination
-        disbursements = disbursements[start:start + length]
-        
-        # Prepare data for response
-        data = []
-        for disbursement in disbursements:
-            farmer = disbursement.loan.farmer
-            farmer_name = f"{farmer.user_profile.user.first_name} {farmer.user_profile.user.last_name}"
-            disbursed_by_name = f"{disbursement.disbursed_by.user_profile.user.first_name} {disbursement.disbursed_by.user_profile.user.last_name}" if disbursement.disbursed_by else "Not specified"
-            
-            data.append({
-                'id': disbursement.id,
-                'loan_id': disbursement.loan.loan_id,
-                'farmer_name': farmer_name,
-                'farmer_national_id': farmer.national_id,
-                'amount': float(disbursement.amount),
-                'disbursement_date': disbursement.disbursement_date.strftime('%Y-%m-%d'),
-                'stage': disbursement.stage,
-                'transaction_reference': disbursement.transaction_reference or 'Not provided',
-                'disbursed_by': disbursed_by_name,
-                'project_name': disbursement.loan.project.name if disbursement.loan.project else 'N/A',
-                'project_code': disbursement.loan.project.code if disbursement.loan.project else 'N/A',
-                'created_at': disbursement.created_at.strftime('%Y-%m-%d %H:%M'),
-                'updated_at': disbursement.updated_at.strftime('%Y-%m-%d %H:%M'),
-                'notes': disbursement.notes or 'No notes provided'
-            })
-        
-        return JsonResponse({
-            'draw': draw,
-            'recordsTotal': total_records,
-            'recordsFiltered': total_records,
-            'data': data
-        })
+        filters = Q()
+        if request.GET.get('loan_id'):
+            filters &= Q(loan_id=request.GET['loan_id'])
+
+        return JsonResponse(DISBURSEMENT_TABLE.respond(request, _disbursement_row, filters))
         
     except Exception as e:
         return JsonResponse({
@@ -846,101 +842,60 @@ def repayment_tracking(request):
     """Main repayment tracking page"""
     return render(request, 'portal/loans/repayment.html')
 
-@require_http_methods(["GET"])
-@login_required
-def repayment_list(request):
-    """Server-side processing for repayments datatable"""
-    draw = int(request.GET.get('draw', 1))
-    start = int(request.GET.get('start', 0))
-    length = int(request.GET.get('length', 10))
-    search_value = request.GET.get('search[value]', '')
-    status_filter = request.GET.get('status')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    # Base queryset with related data
-    queryset = LoanRepayment.objects.select_related(
+REPAYMENT_TABLE = datatables.Table(
+    'repayments',
+    LoanRepayment.objects.select_related(
         'loan__farmer__user_profile__user',
         'loan__project',
         'received_by__user_profile__user'
-    ).all()
-    
-    # Apply filters
-    if status_filter:
-        queryset = queryset.filter(loan__status=status_filter)
-    
-    # Apply date filters
-    if date_from:
-        queryset = queryset.filter(repayment_date__gte=date_from)
-    if date_to:
-        queryset = queryset.filter(repayment_date__lte=date_to)
-    
-    # Apply search filter
-    if search_value:
-        queryset = queryset.filter(
-            Q(loan__loan_id__icontains=search_value) |
-            Q(loan__farmer__user_profile__user__first_name__icontains=search_value) |
-            Q(loan__farmer__user_profile__user__last_name__icontains=search_value) |
-            Q(loan__farmer__national_id__icontains=search_value) |
-            Q(transaction_reference__icontains=search_value) |
-            Q(received_by__user_profile__user__first_name__icontains=search_value) |
-            Q(received_by__user_profile__user__last_name__icontains=search_value)
-        )
-    
-    # Total records count
-    total_records = LoanRepayment.objects.count()
-    total_filtered = queryset.count()
-    
-    # Apply ordering
-    order_column_index = int(request.GET.get('order[0][column]', 0))
-    order_direction = request.GET.get('order[0][dir]', 'asc')
-    
-    # Map column index to model field
-    column_mapping = {
+    ),
+    columns={
         0: 'repayment_date',
         1: 'loan__loan_id',
         2: 'loan__farmer__user_profile__user__first_name',
         3: 'amount',
         4: 'transaction_reference',
         5: 'received_by__user_profile__user__first_name'
+    },
+    search=[
+        ('id', None, ('transaction_reference',)),
+        ('loan_id', Loan, ('loan_id',)),
+        ('loan__farmer_id', Farmer, ('national_id',)),
+        ('loan__farmer__user_profile__user_id', User, FARMER_NAMES),
+        ('received_by__user_profile__user_id', User, FARMER_NAMES),
+    ],
+)
+
+
+def _repayment_row(repayment):
+    return {
+        'id': repayment.id,
+        'repayment_date': repayment.repayment_date.strftime('%Y-%m-%d'),
+        'loan_id': repayment.loan.loan_id,
+        'farmer_name': f"{repayment.loan.farmer.user_profile.user.first_name} {repayment.loan.farmer.user_profile.user.last_name}",
+        'farmer_national_id': repayment.loan.farmer.national_id,
+        'project_name': repayment.loan.project.name if repayment.loan.project else 'N/A',
+        'amount': float(repayment.amount),
+        'transaction_reference': repayment.transaction_reference or 'N/A',
+        'received_by': f"{repayment.received_by.user_profile.user.first_name} {repayment.received_by.user_profile.user.last_name}" if repayment.received_by else 'N/A',
+        'notes': repayment.notes or 'No notes',
+        'created_at': repayment.created_at.strftime('%Y-%m-%d %H:%M')
     }
-    
-    order_column = column_mapping.get(order_column_index, 'repayment_date')
-    if order_direction == 'desc':
-        order_column = f'-{order_column}'
-    
-    queryset = queryset.order_by(order_column)
-    
-    # Apply pagination
-    paginator = Paginator(queryset, length)
-    page_number = (start // length) + 1
-    page_obj = paginator.get_page(page_number)
-    
-    # Prepare data for response
-    data = []
-    for repayment in page_obj:
-        data.append({
-            'id': repayment.id,
-            'repayment_date': repayment.repayment_date.strftime('%Y-%m-%d'),
-            'loan_id': repayment.loan.loan_id,
-            'farmer_name': f"{repayment.loan.farmer.user_profile.user.first_name} {repayment.loan.farmer.user_profile.user.last_name}",
-            'farmer_national_id': repayment.loan.farmer.national_id,
-            'project_name': repayment.loan.project.name if repayment.loan.project else 'N/A',
-            'amount': float(repayment.amount),
-            'transaction_reference': repayment.transaction_reference or 'N/A',
-            'received_by': f"{repayment.received_by.user_profile.user.first_name} {repayment.received_by.user_profile.user.last_name}" if repayment.received_by else 'N/A',
-            'notes': repayment.notes or 'No notes',
-            'created_at': repayment.created_at.strftime('%Y-%m-%d %H:%M')
-        })
-    
-    response = {
-        'draw': draw,
-        'recordsTotal': total_records,
-        'recordsFiltered': total_filtered,
-        'data': data
-    }
-    
-    return JsonResponse(response)
+
+
+@require_http_methods(["GET"])
+@login_required
+def repayment_list(request):
+    """Server-side processing for repayments datatable"""
+    filters = Q()
+    if request.GET.get('status'):
+        filters &= Q(loan__status=request.GET['status'])
+    if request.GET.get('date_from'):
+        filters &= Q(repayment_date__gte=request.GET['date_from'])
+    if request.GET.get('date_to'):
+        filters &= Q(repayment_date__lte=request.GET['date_to'])
+
+    return JsonResponse(REPAYMENT_TABLE.respond(request, _repayment_row, filters))
 
 @require_http_methods(["GET"])
 @login_required
@@ -956,8 +911,8 @@ def get_repayment_detail(request, repayment_id):
         
         # Get loan details
         loan = repayment.loan
-        total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
+        total_disbursed = loan.total_disbursed
+        total_repaid = loan.total_repaid
         outstanding_amount = loan.amount - total_disbursed
         
         data = {
@@ -1051,9 +1006,10 @@ def create_repayment(request):
             loan.status = 'repaying'
             loan.save()
         
-        # Check if loan is fully repaid
-        total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
+        # Check if loan is fully repaid, balances were updated with the repayment
+        loan.refresh_from_db(fields=Loan.LEDGER_FIELDS)
+        total_disbursed = loan.total_disbursed
+        total_repaid = loan.total_repaid
         
         if total_repaid >= total_disbursed:
             loan.status = 'completed'
@@ -1102,10 +1058,10 @@ def update_repayment(request, repayment_id):
         
         repayment.save()
         
-        # Recalculate loan status
-        loan = repayment.loan
-        total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
+        # Recalculate loan status, balances were updated with the repayment
+        loan = Loan.objects.get(id=repayment.loan_id)
+        total_disbursed = loan.total_disbursed
+        total_repaid = loan.total_repaid
         
         if total_repaid >= total_disbursed:
             loan.status = 'completed'
@@ -1149,9 +1105,10 @@ def delete_repayment(request):
         # Delete the repayment
         repayment.delete()
         
-        # Recalculate loan status
-        total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-        total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
+        # Recalculate loan status, balances were updated with the deletion
+        loan.refresh_from_db(fields=Loan.LEDGER_FIELDS)
+        total_disbursed = loan.total_disbursed
+        total_repaid = loan.total_repaid
         
         if total_repaid >= total_disbursed:
             loan.status = 'completed'
@@ -1179,13 +1136,13 @@ def get_repayable_loans(request):
         ).select_related(
             'farmer__user_profile__user',
             'project'
-        ).prefetch_related('disbursements', 'repayments')
+        )
         
         data = []
         for loan in repayable_loans:
-            total_disbursed = loan.disbursements.aggregate(total=Sum('amount'))['total'] or 0
-            total_repaid = loan.repayments.aggregate(total=Sum('amount'))['total'] or 0
-            outstanding_amount = total_disbursed - total_repaid
+            total_disbursed = loan.total_disbursed
+            total_repaid = loan.total_repaid
+            outstanding_amount = loan.outstanding
             
             data.append({
                 'id': loan.id,
@@ -1209,6 +1166,7 @@ def get_repayable_loans(request):
 
 @require_http_methods(["GET"])
 @login_required
+@dashboard_cache.cached_response('repayment_stats')
 def get_repayment_stats(request):
     """Get statistics about repayments"""
     try:
@@ -1267,73 +1225,111 @@ def get_repayment_stats(request):
 @login_required
 def repayment_export(request):
     """Export repayments data in various formats"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    
     format_type = request.GET.get('format', 'csv')
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    
-    # Base queryset
-    repayments = LoanRepayment.objects.select_related(
-        'loan__farmer__user_profile__user',
-        'loan__project',
-        'received_by__user_profile__user'
-    )
-    
-    # Apply date filters
-    if date_from:
-        repayments = repayments.filter(repayment_date__gte=date_from)
-    if date_to:
-        repayments = repayments.filter(repayment_date__lte=date_to)
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="repayments_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Repayment Date', 'Loan ID', 'Farmer Name', 'National ID', 'Project', 
-            'Amount', 'Transaction Reference', 'Received By', 'Notes', 'Created At'
-        ])
-        
-        for repayment in repayments:
-            writer.writerow([
-                repayment.repayment_date.strftime('%Y-%m-%d'),
-                repayment.loan.loan_id,
-                f"{repayment.loan.farmer.user_profile.user.first_name} {repayment.loan.farmer.user_profile.user.last_name}",
-                repayment.loan.farmer.national_id,
-                repayment.loan.project.name if repayment.loan.project else 'N/A',
-                float(repayment.amount),
-                repayment.transaction_reference or 'N/A',
-                f"{repayment.received_by.user_profile.user.first_name} {repayment.received_by.user_profile.user.last_name}" if repayment.received_by else 'N/A',
-                repayment.notes or 'No notes',
-                repayment.created_at.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
     
-    elif format_type == 'json':
-        data = []
-        for repayment in repayments:
-            data.append({
-                'repayment_date': repayment.repayment_date.strftime('%Y-%m-%d'),
-                'loan_id': repayment.loan.loan_id,
-                'farmer_name': f"{repayment.loan.farmer.user_profile.user.first_name} {repayment.loan.farmer.user_profile.user.last_name}",
-                'national_id': repayment.loan.farmer.national_id,
-                'project': repayment.loan.project.name if repayment.loan.project else 'N/A',
-                'amount': float(repayment.amount),
-                'transaction_reference': repayment.transaction_reference or 'N/A',
-                'received_by': f"{repayment.received_by.user_profile.user.first_name} {repayment.received_by.user_profile.user.last_name}" if repayment.received_by else 'N/A',
-                'notes': repayment.notes or 'No notes',
-                'created_at': repayment.created_at.strftime('%Y-%m-%d %H:%M')
-            })
-        
-        return JsonResponse({'repayments': data})
-    
-    else:
+    response = exports.streaming_response('repayments', format_type, request.GET)
+    if response is None:
         return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=500)
+    return response
+
+
+@require_http_methods(["POST"])
+@login_required
+def import_statement(request):
+    """Stage a bank or mobile money statement CSV and match it to open loans"""
+    try:
+        upload = request.FILES.get('file')
+        if upload is None:
+            return JsonResponse({'success': False, 'error': 'file is required'}, status=400)
+
+        statement = statements.stage(upload.read(), upload.name, request.POST.get('source', 'bank'), request.user)
+
+        return JsonResponse({
+            'success': True,
+            'message': f'{statement.matched_lines} of {statement.total_lines} transactions matched',
+            'statement': statements.summary(statement),
+        })
+
+    except statements.StatementError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@login_required
+def statement_detail(request, statement_id):
+    """A staged statement with its lines, optionally of one status"""
+    try:
+        statement = StatementImport.objects.get(id=statement_id)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', 500)), 1), 5000)
+
+        return JsonResponse({
+            'success': True,
+            'statement': statements.summary(statement),
+            'lines': statements.list_lines(statement, request.GET.get('status'), offset, limit),
+        })
+
+    except StatementImport.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Statement not found'}, status=404)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid offset or limit'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["POST"])
+@login_required
+def review_statement_lines(request, statement_id):
+    """Assign statement lines to a loan or reject them"""
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'The body must be a JSON object'}, status=400)
+        statement = StatementImport.objects.get(id=statement_id)
+
+        changed = statements.review(statement, data.get('line_ids') or [], data.get('action'), data.get('loan_id'))
+
+        return JsonResponse({
+            'success': True,
+            'message': f'{changed} lines updated',
+            'statement': statements.summary(statement),
+        })
+
+    except StatementImport.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Statement not found'}, status=404)
+    except (json.JSONDecodeError, statements.StatementError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@require_http_methods(["POST"])
+@login_required
+def confirm_statement(request, statement_id):
+    """Record the matched lines of a statement as repayments"""
+    try:
+        data = json.loads(request.body or '{}')
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'The body must be a JSON object'}, status=400)
+        statement = StatementImport.objects.get(id=statement_id)
+
+        written = statements.confirm(statement, request.user, data.get('line_ids'))
+        statement.refresh_from_db()
+
+        return JsonResponse({
+            'success': True,
+            'message': f'{written} repayments recorded',
+            'statement': statements.summary(statement),
+        })
+
+    except StatementImport.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Statement not found'}, status=404)
+    except json.JSONDecodeError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
     
 
 
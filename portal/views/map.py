@@ -1,12 +1,18 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.http import JsonResponse
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
+import gzip
 import json
 from django.contrib.gis.geos import Polygon
 
 from portal.models import District, Farm, Region, UserProfile
+from portal.services.map_query import Viewport, load_geojson
+from portal.services import boundaries
+from portal.services.clustering import get_clusters
+from portal.services.tiles import POLYGON_MIN_ZOOM, get_farm_tile, is_valid_tile
 from utils.sidebar import UserRole
 
 @login_required
@@ -19,87 +25,105 @@ def interactive_map(request):
 
 @login_required
 def get_farm_data(request):
-    """Get farm data for the map"""
+    """
+    Get farm data for the map.
+
+    Accepts optional ``bbox``, ``zoom`` and ``layers`` (``boundaries``,
+    ``locations``) params to only return the farms in the current viewport,
+    with boundaries simplified for the zoom level.
+    """
+    try:
+        viewport = Viewport.from_request(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
     try:
-        # Get all farms with related data
-        farms = Farm.objects.filter(is_deleted=False).select_related(
-            'farmer', 
-            'farmer__user_profile', 
-            'farmer__user_profile__user'
+        farms = Farm.objects.filter(is_deleted=False)
+        if viewport.is_bounded:
+            farms = farms.filter(
+                Q(boundary__intersects=viewport.bbox) |
+                Q(boundary__isnull=True, location__intersects=viewport.bbox)
+            )
+
+        # Polygons are not visible when zoomed far out, send points only
+        send_boundaries = viewport.wants('boundaries') and (
+            viewport.zoom is None or viewport.zoom >= POLYGON_MIN_ZOOM
         )
-        
+        send_locations = viewport.wants('locations')
+
+        annotations = {
+            'has_boundary': ExpressionWrapper(Q(boundary__isnull=False), output_field=BooleanField()),
+        }
+        if send_boundaries:
+            annotations['boundary_json'] = viewport.geojson('boundary')
+
+        rows = farms.annotate(**annotations).values(
+            'id', 'farm_code', 'name', 'status', 'area_hectares', 'soil_type',
+            'irrigation_type', 'irrigation_coverage', 'boundary_coord',
+            'validation_status', 'registration_date', 'last_visit_date',
+            'location', 'farmer__national_id', 'farmer__primary_crop',
+            'farmer__years_of_experience', 'farmer__cooperative_membership',
+            'farmer__user_profile__user__first_name',
+            'farmer__user_profile__user__last_name',
+            *annotations.keys()
+        )
+
         farm_data = []
-        for farm in farms:
-            farmer = farm.farmer
-            user_profile = farmer.user_profile
-            
+        for row in rows:
+            location = row['location']
+            farmer_name = '%s %s' % (
+                row['farmer__user_profile__user__first_name'],
+                row['farmer__user_profile__user__last_name']
+            )
+
             farm_info = {
-                'id': farm.id,
-                'farm_code': farm.farm_code,
-                'name': farm.name or f"Farm {farm.farm_code}",
-                'status': farm.status,
-                'area_hectares': farm.area_hectares,
-                'soil_type': farm.soil_type,
-                'irrigation_type': farm.irrigation_type,
-                'irrigation_coverage': farm.irrigation_coverage,
-                'boundary_coord': farm.boundary_coord,  # This should be the ArrayField data
-                'validation_status': farm.validation_status,
-                'registration_date': farm.registration_date.strftime('%Y-%m-%d') if farm.registration_date else '',
-                'last_visit_date': farm.last_visit_date.strftime('%Y-%m-%d') if farm.last_visit_date else '',
-                
+                'id': row['id'],
+                'farm_code': row['farm_code'],
+                'name': row['name'] or f"Farm {row['farm_code']}",
+                'status': row['status'],
+                'area_hectares': row['area_hectares'],
+                'soil_type': row['soil_type'],
+                'irrigation_type': row['irrigation_type'],
+                'irrigation_coverage': row['irrigation_coverage'],
+                'boundary_coord': row['boundary_coord'],
+                'validation_status': row['validation_status'],
+                'registration_date': row['registration_date'].strftime('%Y-%m-%d') if row['registration_date'] else '',
+                'last_visit_date': row['last_visit_date'].strftime('%Y-%m-%d') if row['last_visit_date'] else '',
+
                 # Farmer information
-                'farmer_name': user_profile.user.get_full_name(),
-                'farmer_national_id': farmer.national_id,
-                'primary_crop': farmer.primary_crop,
-                'years_of_experience': farmer.years_of_experience,
-                'cooperative_membership': farmer.cooperative_membership,
-                
+                'farmer_name': farmer_name.strip(),
+                'farmer_national_id': row['farmer__national_id'],
+                'primary_crop': row['farmer__primary_crop'],
+                'years_of_experience': row['farmer__years_of_experience'],
+                'cooperative_membership': row['farmer__cooperative_membership'],
+
                 # Location data
-                'has_boundary': bool(farm.boundary),
-                'has_location': bool(farm.location),
+                'has_boundary': row['has_boundary'],
+                'has_location': bool(location),
             }
-            
-            # Add boundary coordinates if available - FIXED VERSION
-            if farm.boundary:
-                try:
-                    # Get coordinates from the Polygon field
-                    coords = list(farm.boundary.coords[0])  # This gives us the exterior ring
-                    
-                    # Convert to the format Leaflet expects: [[lng, lat], [lng, lat], ...]
-                    leaflet_coords = []
-                    for coord in coords:
-                        if len(coord) >= 2:
-                            leaflet_coords.append([float(coord[0]), float(coord[1])])
-                    
-                    farm_info['boundary'] = {
-                        'type': 'Polygon',
-                        'coordinates': [leaflet_coords]  # Note: coordinates is an array of arrays
-                    }
-                    print(f"Farm {farm.id} boundary coordinates: {leaflet_coords[:3]}...")  # Debug first 3 points
-                    
-                except Exception as e:
-                    print(f"Error converting boundary for farm {farm.id}: {e}")
-                    farm_info['boundary'] = None
-            
-            # Add point location if available
-            if farm.location:
-                try:
-                    farm_info['location'] = {
-                        'type': 'Point',
-                        'coordinates': [float(farm.location.x), float(farm.location.y)]
-                    }
-                except Exception as e:
-                    print(f"Error converting location for farm {farm.id}: {e}")
-                    farm_info['location'] = None
-            
+
+            # Boundary comes back from PostGIS as GeoJSON: [[lng, lat], ...]
+            boundary = load_geojson(row.get('boundary_json'))
+            if boundary:
+                farm_info['boundary'] = {
+                    'type': 'Polygon',
+                    'coordinates': boundary['coordinates'][:1]
+                }
+
+            if location and send_locations:
+                farm_info['location'] = {
+                    'type': 'Point',
+                    'coordinates': [float(location.x), float(location.y)]
+                }
+
             farm_data.append(farm_info)
-        
+
         return JsonResponse({
             'success': True,
             'farms': farm_data,
             'total_count': len(farm_data)
         })
-        
+
     except Exception as e:
         import traceback
         print(f"Error in get_farm_data: {e}")
@@ -109,6 +133,50 @@ def get_farm_data(request):
             'error': str(e)
         })
 
+@login_required
+def farm_tiles(request, z, x, y):
+    """Serve the farm layer as a Mapbox Vector Tile"""
+    if not is_valid_tile(z, x, y):
+        return JsonResponse({'success': False, 'error': 'Invalid tile coordinates'}, status=404)
+
+    try:
+        tile = get_farm_tile(z, x, y)
+        response = HttpResponse(tile, content_type='application/vnd.mapbox-vector-tile')
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
+    except Exception as e:
+        print(f"Error building tile {z}/{x}/{y}: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+@login_required
+def get_farm_clusters(request):
+    """
+    Get farm clusters for the map at ``zoom``, optionally limited to ``bbox``.
+    Each cluster has a count, total hectares and a count per farm status.
+    """
+    try:
+        viewport = Viewport.from_request(request)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    if viewport.zoom is None:
+        return JsonResponse({'success': False, 'error': 'zoom is required'}, status=400)
+
+    try:
+        bbox = viewport.bbox.extent if viewport.is_bounded else None
+        clusters = get_clusters(viewport.zoom, bbox)
+        return JsonResponse({
+            'success': True,
+            'zoom': viewport.zoom,
+            'clusters': clusters,
+            'total_count': sum(cluster['count'] for cluster in clusters)
+        })
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        print(f"Error in get_farm_clusters: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
 # @login_required
 # @csrf_exempt
 # def update_farm_boundary(request, farm_id):
@@ -283,89 +351,48 @@ def validate_farm_boundary(request, farm_id):
 
 
 
-# views.py
-from django.http import JsonResponse
-from django.core.serializers import serialize
-import json
-from django.http import JsonResponse
-from django.core.serializers import serialize
-import json
-from django.db.models import Count
-# views.py
-from django.http import JsonResponse
-from django.core.serializers import serialize
-import json
-from django.db.models import Count
+def boundary_layer_response(request, layer):
+    """
+    Serve a prebuilt boundary layer. ``level`` (full/medium/low) or ``zoom``
+    picks the simplification, the stored gzip bytes are sent as-is when the
+    client accepts gzip and a matching If-None-Match gets a 304.
+    """
+    level = request.GET.get('level')
+    if not level and request.GET.get('zoom'):
+        try:
+            level = boundaries.level_for_zoom(int(float(request.GET['zoom'])))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'zoom must be a number'}, status=400)
+    level = level or boundaries.DEFAULT_LEVEL
+    if level not in boundaries.LEVELS:
+        return JsonResponse({'success': False, 'error': f'Unknown level {level}'}, status=400)
 
-def regions_geojson(request):
-    """Return regions as GeoJSON"""
     try:
-        regions = Region.objects.all()
-        geojson = serialize('geojson', regions, 
-                          geometry_field='geom',
-                          fields=('region', 'reg_code'))
-        
-        # Add district count to each region using reg_code
-        data = json.loads(geojson)
-        
-        # Get ALL districts to debug
-        all_districts = District.objects.all()
-        print(f"Total districts in database: {all_districts.count()}")
-        
-        # Get district counts per region
-        district_counts = District.objects.values('reg_code').annotate(
-            district_count=Count('id')
-        )
-        
-        # Convert to dictionary for easy lookup
-        count_dict = {item['reg_code']: item['district_count'] for item in district_counts if item['reg_code']}
-        # print("District counts by reg_code:", count_dict)
-        
-        # Debug: Print all region codes and their district counts
-        print("=== REGION DEBUG INFO ===")
-        for feature in data['features']:
-            region_code = feature['properties']['reg_code']
-            district_count = count_dict.get(region_code, 0)
-            feature['properties']['district_count'] = district_count
-            # print(f"Region: {feature['properties']['region']}, Code: {region_code}, Districts: {district_count}")
-        
-        print("=== END REGION DEBUG ===")
-        
-        return JsonResponse({
-            'success': True,
-            'data': data
-        })
+        data, etag = boundaries.get_layer(layer, level)
     except Exception as e:
-        print(f"Error in regions_geojson: {e}")
+        print(f"Error in {layer}_geojson: {e}")
         return JsonResponse({
             'success': False,
             'error': str(e)
         }, status=500)
 
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(data, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(data), content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+def regions_geojson(request):
+    """Return regions as GeoJSON"""
+    return boundary_layer_response(request, 'regions')
+
 def districts_geojson(request):
     """Return districts as GeoJSON"""
-    try:
-        districts = District.objects.all()
-        geojson = serialize('geojson', districts, 
-                          geometry_field='geom',
-                          fields=('district', 'district_code', 'region', 'reg_code'))
-        
-        data = json.loads(geojson)
-        
-        # Debug: Print district information
-        print("=== DISTRICT DEBUG INFO ===")
-        for feature in data['features']:
-            pass
-            # print(f"District: {feature['properties']['district']}, Region Code: {feature['properties']['reg_code']}")
-        print("=== END DISTRICT DEBUG ===")
-        
-        return JsonResponse({
-            'success': True,
-            'data': data
-        })
-    except Exception as e:
-        print(f"Error in districts_geojson: {e}")
-        return JsonResponse({
-            'success': False,
-            'error': str(e)
-        }, status=500)
\ No newline at end of file
+    return boundary_layer_response(request, 'districts')
@@ -6,8 +6,6 @@ from django.core.paginator import Paginator
 from django.db.models import Q
 import json
 from datetime import datetime
-import csv
-from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 
@@ -16,6 +14,7 @@ from portal.models import (
     Farm, FollowUpAction, Infrastructure, MonitoringVisit, UserProfile, 
     Staff, Farmer, Project
 )
+from portal.services import dashboard_cache, exports
 
 def render_monitoring_page(request):
     """Render the main monitoring page"""
@@ -544,66 +543,7 @@ def delete_infrastructure(request, infrastructure_id):
 def export_monitoring_visits(request):
     """Export monitoring visits to CSV"""
     try:
-        # Get filter parameters
-        status_filter = request.GET.get('status', '')
-        search_query = request.GET.get('search', '')
-        
-        # Query visits
-        visits = MonitoringVisit.objects.select_related('officer__user', 'farm__farmer__user_profile__user').all()
-        
-        if status_filter:
-            visits = visits.filter(follow_up_status=status_filter)
-        
-        if search_query:
-            visits = visits.filter(
-                Q(visit_id__icontains=search_query) |
-                Q(farm__name__icontains=search_query) |
-                Q(officer__user__first_name__icontains=search_query)
-            )
-        
-        # Create HTTP response with CSV header
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="monitoring_visits.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Visit ID', 'Date of Visit', 'Officer', 'Farm', 'Farmer',
-            'Farm Boundary Polygon', 'Land Use Classification',
-            'Distance to Road (km)', 'Distance to Market (km)', 
-            'Proximity to Processing Facility (km)',
-            'Main Buyers', 'Service Provider', 'Cooperatives Affiliated',
-            'Value Chain Linkages', 'Observations', 'Issues Identified',
-            'Infrastructure Identified', 'Recommended Actions', 'Follow-Up Status',
-            'Created Date'
-        ])
-        
-        for visit in visits:
-            farmer_name = f"{visit.farm.farmer.user_profile.user.first_name} {visit.farm.farmer.user_profile.user.last_name}" if visit.farm.farmer else 'N/A'
-            
-            writer.writerow([
-                visit.visit_id,
-                visit.date_of_visit.strftime('%Y-%m-%d'),
-                f"{visit.officer.user.first_name} {visit.officer.user.last_name}",
-                visit.farm.name,
-                farmer_name,
-                'Yes' if visit.farm_boundary_polygon else 'No',
-                visit.land_use_classification,
-                float(visit.distance_to_road),
-                float(visit.distance_to_market),
-                float(visit.proximity_to_processing_facility),
-                visit.main_buyers,
-                visit.service_provider,
-                visit.cooperatives_affiliated,
-                visit.value_chain_linkages,
-                visit.observations,
-                visit.issues_identified,
-                visit.infrastructure_identified,
-                visit.recommended_actions,
-                visit.get_follow_up_status_display(),
-                visit.created_at.strftime('%Y-%m-%d %H:%M')
-            ])
-        
-        return response
+        return exports.streaming_response('monitoring_visits', 'csv', request.GET)
         
     except Exception as e:
         return JsonResponse({
@@ -612,6 +552,7 @@ def export_monitoring_visits(request):
         }, status=500)
 
 @require_http_methods(["GET"])
+@dashboard_cache.cached_response('monitoring_stats')
 def monitoring_stats(request):
     """Get monitoring statistics"""
     try:
@@ -10,6 +10,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models.functions import Concat
 from portal.models import Project, ProjectParticipation, Farmer, Staff, Farm, Loan, LoanDisbursement, LoanRepayment, Milestone, ComplianceCheck, ComplianceCategory
+from portal.services import dashboard_cache, exports
 
 @login_required
 def project_tracking(request):
@@ -517,6 +518,7 @@ def get_project_timeline(request):
 
 @require_http_methods(["GET"])
 @login_required
+@dashboard_cache.cached_response('project_stats')
 def get_project_stats(request):
     """Get statistics about projects"""
     try:
@@ -638,73 +640,12 @@ def get_staff_members_project(request):
 @login_required
 def project_export(request):
     """Export projects data in various formats"""
-    import csv
-    from django.http import HttpResponse
-    from datetime import datetime
-    
     format_type = request.GET.get('format', 'csv')
-    projects = Project.objects.select_related('manager__user_profile__user').prefetch_related('participating_farmers')
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="projects_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-        
-        writer = csv.writer(response)
-        writer.writerow([
-            'Code', 'Name', 'Description', 'Start Date', 'End Date', 
-            'Status', 'Total Budget', 'Manager', 'Farmers Count',
-            'Days Remaining', 'Progress (%)'
-        ])
-        
-        for project in projects:
-            today = timezone.now().date()
-            total_days = (project.end_date - project.start_date).days
-            elapsed_days = (today - project.start_date).days
-            progress_percent = min(100, max(0, int((elapsed_days / total_days) * 100))) if total_days > 0 else 0
-            
-            writer.writerow([
-                project.code,
-                project.name,
-                project.description or '',
-                project.start_date.strftime('%Y-%m-%d'),
-                project.end_date.strftime('%Y-%m-%d'),
-                project.get_status_display(),
-                float(project.total_budget),
-                f"{project.manager.user_profile.user.first_name} {project.manager.user_profile.user.last_name}" if project.manager else '',
-                project.participating_farmers.count(),
-                max(0, (project.end_date - today).days),
-                progress_percent
-            ])
-        
-        return response
-    
-    elif format_type == 'json':
-        data = []
-        for project in projects:
-            today = timezone.now().date()
-            total_days = (project.end_date - project.start_date).days
-            elapsed_days = (today - project.start_date).days
-            progress_percent = min(100, max(0, int((elapsed_days / total_days) * 100))) if total_days > 0 else 0
-            
-            data.append({
-                'code': project.code,
-                'name': project.name,
-                'description': project.description,
-                'start_date': project.start_date.strftime('%Y-%m-%d'),
-                'end_date': project.end_date.strftime('%Y-%m-%d'),
-                'status': project.status,
-                'status_display': project.get_status_display(),
-                'total_budget': float(project.total_budget),
-                'manager': f"{project.manager.user_profile.user.first_name} {project.manager.user_profile.user.last_name}" if project.manager else '',
-                'farmers_count': project.participating_farmers.count(),
-                'days_remaining': max(0, (project.end_date - today).days),
-                'progress_percent': progress_percent
-            })
-        
-        return JsonResponse({'projects': data})
     
-    else:
+    response = exports.streaming_response('projects', format_type, request.GET)
+    if response is None:
         return JsonResponse({'success': False, 'error': 'Unsupported format'}, status=500)
+    return response
 
 # @require_http_methods(["GET"])
 # @login_required
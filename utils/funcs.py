@@ -5,11 +5,14 @@ from datetime import datetime
 
 
 class IDGenerator:
-    counter = 0
     @classmethod
     def generate_unique_id(cls, prefix: str) -> str:
-        cls.counter += 1
-        counter_str = str(cls.counter).rjust(4, "0")
+        # Counter comes from the per-prefix database sequence so it is unique
+        # across processes and restarts, not just within one interpreter
+        from portal.services.sequences import next_value
+
+        counter = next_value(f"ID:{prefix.upper()}")
+        counter_str = str(counter).rjust(4, "0")
         now_suffix = datetime.now().strftime("%d%m%Y%H%M%S")
         return f"{prefix.upper()}{now_suffix}{counter_str}"
 